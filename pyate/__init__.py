@@ -1 +1,2 @@
 from .datamanagement import *
+from .checkpoint import Checkpoint
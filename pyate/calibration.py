@@ -4,34 +4,649 @@ Created on May 9, 2019
 @author: kyleh
 """
 
+import bisect
+from collections import OrderedDict
+from collections.abc import MutableMapping
+import itertools
+import json
 import logging
 import os
 
+import numpy as np
 from numpy import genfromtxt, savetxt, stack, all
 import pandas as pd
-from scipy.interpolate import interp1d
+
+
+def _uniform_step(x):
+    """Returns the spacing of x if it is uniform, otherwise None"""
+    if len(x) < 2:
+        return None
+    step = (x[-1] - x[0]) / (len(x) - 1)
+    if np.allclose(np.diff(x), step, rtol=1e-9, atol=0):
+        return step
+    return None
+
+
+def _find_segment(x_table, step, x):
+    """Returns index of the segment of x_table containing each x.  Uniform
+    grids (step not None) are indexed directly instead of searched."""
+    if len(x_table) < 2:
+        return np.zeros(np.shape(x), dtype=np.intp)
+    if step is not None:
+        # Rounding can put a point on a segment boundary into the neighboring
+        # segment.  Tables are continuous so that is harmless.
+        i = np.floor((x - x_table[0]) / step).astype(np.intp)
+    else:
+        i = np.searchsorted(x_table, x, side="right") - 1
+    return np.clip(i, 0, len(x_table) - 2)
+
+
+def _check_range(x_table, x, extrapolate):
+    """Applies the raise & clip extrapolation modes to x"""
+    if extrapolate == "raise":
+        if np.any(x < x_table[0]):
+            raise ValueError("A value in x_new is below the interpolation range.")
+        if np.any(x > x_table[-1]):
+            raise ValueError("A value in x_new is above the interpolation range.")
+    elif extrapolate == "clip":
+        x = np.clip(x, x_table[0], x_table[-1])
+    return x
+
+
+def _table_array(values):
+    """Returns values as a float64 array.  Read-only memory mapped data is used
+    in place.  Anything else is copied so later changes by the caller cannot
+    get out of step with the precomputed slopes."""
+    if isinstance(values, np.memmap) and not values.flags.writeable:
+        return np.asarray(values, dtype=np.float64)
+    return np.array(values, dtype=np.float64)
+
+
+class CalibrationTable(object):
+    """
+    Piecewise-linear lookup table
+
+    x & y are stored sorted in contiguous float64 arrays along with the slope
+    of each segment, so a lookup is an index search plus one multiply-add.
+    Uniformly spaced x values are detected and indexed directly in O(1)
+    instead of with a binary search.
+
+    y can have leading dimensions (..., len(x)) to evaluate several tables
+    sharing the same x values at once.
+
+    Points outside of the range of x are handled according to extrapolate:
+        "raise": Raise ValueError (same as scipy interp1d)
+        "clip": Use the value at the nearest end point
+        "linear": Extend the first & last segments
+        "nan": Return NaN
+    """
+
+    extrapolate_modes = ("raise", "clip", "linear", "nan")
+
+    def __init__(self, x, y, extrapolate="raise"):
+        if extrapolate not in self.extrapolate_modes:
+            raise ValueError(f"Unknown extrapolation mode: {extrapolate}")
+
+        x = _table_array(x)
+        y = _table_array(y)
+        if x.ndim != 1 or x.shape[0] != y.shape[-1]:
+            raise ValueError("x must be 1-D and match the last dimension of y")
+        if len(x) < 2:
+            raise ValueError("Calibration table needs at least 2 points")
+
+        if np.all(x[1:] > x[:-1]):
+            # Already sorted.  Keeps memory mapped data from being copied
+            self.x = x
+            self.y = y
+        else:
+            order = np.argsort(x, kind="stable")
+            self.x = np.ascontiguousarray(x[order])
+            self.y = np.ascontiguousarray(y[..., order])
+        self.extrapolate = extrapolate
+
+        dx = np.diff(self.x)
+        if np.any(dx == 0):
+            raise ValueError("x values must be unique")
+        self._slope = np.diff(self.y, axis=-1) / dx
+
+        # Direct index for uniform grids
+        self._step = _uniform_step(self.x)
+
+        # Copies for scalar lookups.  The lists are only built on the first
+        # scalar lookup so memory mapped tables are not read in up front
+        self._x_ends = (self.x[0].item(), self.x[-1].item())
+        self._lists = None
+
+    def __len__(self):
+        return len(self.x)
+
+    def __repr__(self):
+        return "CalibrationTable({:d} points, {:g} to {:g}{:s})".format(
+            len(self.x),
+            self.x[0],
+            self.x[-1],
+            ", uniform" if self._step is not None else "",
+        )
+
+    @property
+    def uniform(self):
+        return self._step is not None
+
+    def index(self, x):
+        """Returns index of the segment containing each x"""
+        return _find_segment(self.x, self._step, x)
+
+    def _call_scalar(self, x):
+        # Plain float arithmetic.  Array overhead dominates single lookups
+        x = float(x)
+        if x != x:
+            return np.float64(np.nan)
+        x_first, x_last = self._x_ends
+        if x < x_first or x > x_last:
+            if self.extrapolate == "raise":
+                where = "below" if x < x_first else "above"
+                raise ValueError(
+                    f"A value in x_new is {where} the interpolation range."
+                )
+            elif self.extrapolate == "nan":
+                return np.float64(np.nan)
+            elif self.extrapolate == "clip":
+                x = min(max(x, x_first), x_last)
+
+        if self._lists is None:
+            self._lists = (self.x.tolist(), self.y.tolist(), self._slope.tolist())
+        x_list, y_list, slope_list = self._lists
+
+        if self._step is not None:
+            i = int((x - x_first) // self._step)
+        else:
+            i = bisect.bisect_right(x_list, x) - 1
+        i = min(max(i, 0), len(x_list) - 2)
+        return np.float64(y_list[i] + slope_list[i] * (x - x_list[i]))
+
+    def __call__(self, x):
+        if self.y.ndim == 1 and np.ndim(x) == 0:
+            return self._call_scalar(x)
+
+        x = _check_range(self.x, np.asarray(x, dtype=np.float64), self.extrapolate)
+
+        i = self.index(x)
+        val = self.y[..., i] + self._slope[..., i] * (x - self.x[i])
+
+        if self.extrapolate == "nan":
+            val = np.where((x < self.x[0]) | (x > self.x[-1]), np.nan, val)
+        return val
+
+
+class GridTable(object):
+    """
+    N-dimensional calibration table on a rectangular grid
+
+    Values are interpolated multilinearly between the 2^N surrounding grid
+    points.  Each axis is searched like a CalibrationTable (direct index for
+    uniform axes) and follows the same extrapolate modes.  Axes with a single
+    value are held constant.
+    """
+
+    def __init__(self, dims, axes, values, extrapolate="raise"):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        dims : list of str
+            Name of each axis, e.g. ["freq", "power"]
+        axes : list of array_like
+            Grid values of each axis.  Sorted in place of the user order.
+        values : array_like
+            Table values with shape (len(axes[0]), len(axes[1]), ...)
+        extrapolate : str, optional
+            See CalibrationTable
+
+        Returns
+        -------
+        None.
+
+        """
+        if extrapolate not in CalibrationTable.extrapolate_modes:
+            raise ValueError(f"Unknown extrapolation mode: {extrapolate}")
+        if len(dims) != len(axes):
+            raise ValueError("Number of dims and axes must match")
+
+        values = np.asarray(values, dtype=np.float64)
+        if values.shape != tuple(len(axis) for axis in axes):
+            raise ValueError("Shape of values does not match axes")
+
+        self.dims = list(dims)
+        self.axes = []
+        self.extrapolate = extrapolate
+        self._steps = []
+        for k, axis in enumerate(axes):
+            axis = np.asarray(axis, dtype=np.float64)
+            if not np.all(axis[1:] > axis[:-1]):
+                order = np.argsort(axis, kind="stable")
+                axis = np.ascontiguousarray(axis[order])
+                values = np.take(values, order, axis=k)
+            if np.any(np.diff(axis) == 0):
+                raise ValueError(f"Values of axis {dims[k]} must be unique")
+            self.axes.append(axis)
+            self._steps.append(_uniform_step(axis))
+        self.values = values
+
+    def __repr__(self):
+        return "GridTable({:s})".format(
+            ", ".join(
+                "{:s}: {:d}".format(dim, len(axis))
+                for dim, axis in zip(self.dims, self.axes)
+            )
+        )
+
+    @property
+    def ndim(self):
+        return len(self.dims)
+
+    def lookup(self, x):
+        """Evaluates the table at x given as a dict keyed by dim name or a
+        sequence in dim order"""
+        if isinstance(x, dict):
+            return self(*[x[dim] for dim in self.dims])
+        return self(*x)
+
+    def __call__(self, *coords):
+        if len(coords) != self.ndim:
+            raise ValueError(f"Expected {self.ndim} coordinates")
+        coords = np.broadcast_arrays(*[np.asarray(c, dtype=np.float64) for c in coords])
+
+        index = []
+        weight = []
+        outside = np.zeros(coords[0].shape, dtype=bool)
+        for axis, step, x in zip(self.axes, self._steps, coords):
+            if self.extrapolate == "nan":
+                outside |= (x < axis[0]) | (x > axis[-1])
+            x = _check_range(axis, x, self.extrapolate)
+            i = _find_segment(axis, step, x)
+            if len(axis) < 2:
+                t = np.zeros(x.shape)
+            else:
+                t = (x - axis[i]) / (axis[i + 1] - axis[i])
+            index.append(i)
+            weight.append(t)
+
+        val = np.zeros(coords[0].shape)
+        for corner in itertools.product((0, 1), repeat=self.ndim):
+            w = 1.0
+            position = []
+            for bit, i, t, axis in zip(corner, index, weight, self.axes):
+                w = w * (t if bit else 1 - t)
+                position.append(np.minimum(i + bit, len(axis) - 1))
+            val = val + w * self.values[tuple(position)]
+
+        if self.extrapolate == "nan":
+            val = np.where(outside, np.nan, val)
+        return val
+
+
+class SweepCalibration(object):
+    """
+    Calibration values precomputed for every point of a ParameterSweep
+
+    Each table is evaluated once, in a single vectorized call, on the grid of
+    the sweep parameters it depends on.  Lookups during the run are plain
+    array indexing using the current position of the sweep.  Created with
+    Calibration.precompute().
+    """
+
+    def __init__(self, cal, sweep, names=None, mapping=None):
+        if names is None:
+            names = list(cal.tables.keys())
+        if mapping is None:
+            mapping = {}
+
+        self.sweep = sweep
+        self._values = {}
+        self._positions = {}
+
+        order = sweep.get_order()
+        for name in names:
+            table = cal.tables[name]
+            dims = table.dims if isinstance(table, GridTable) else [cal.indep_var]
+            keys = [mapping.get(dim, dim) for dim in dims]
+            for key in keys:
+                if key not in order:
+                    raise KeyError(f"Sweep has no parameter {key} needed by {name}")
+
+            ranges = [sweep.get_parameter_range(key) for key in keys]
+            grid = np.meshgrid(
+                *[np.asarray(values, dtype=float) for values in ranges], indexing="ij"
+            )
+            if isinstance(table, GridTable):
+                self._values[name] = table(*grid)
+            else:
+                self._values[name] = table(grid[0])
+            self._positions[name] = [order.index(key) for key in keys]
+
+    def __getitem__(self, name):
+        return self.get(name)
+
+    def get(self, name):
+        """Returns the value of a table at the current sweep point"""
+        digits = self.sweep.get_current_digits()
+        position = tuple(digits[k] for k in self._positions[name])
+        return self._values[name][position].item()
+
+    def get_current_dict(self):
+        return {name: self.get(name) for name in self._values}
+
+    def get_grid(self, name):
+        """Returns array of values over the grid of sweep parameters the table
+        depends on"""
+        return self._values[name]
+
+
+class _LazyTables(MutableMapping):
+    """Table name -> table mapping where tables can be registered as loader
+    functions that are only called when the table is first accessed.
+    on_changed is called whenever a table is added, replaced or removed."""
+
+    def __init__(self, on_changed=None):
+        self._tables = OrderedDict()
+        self._loaders = {}
+        self._on_changed = on_changed
+
+    def _changed(self):
+        if self._on_changed is not None:
+            self._on_changed()
+
+    def __repr__(self):
+        return "{{{:s}}}".format(
+            ", ".join(
+                "{:s}: {:s}".format(
+                    repr(name),
+                    "<not loaded>" if name in self._loaders else repr(table),
+                )
+                for name, table in self._tables.items()
+            )
+        )
+
+    def set_loader(self, name, loader):
+        self._tables[name] = None
+        self._loaders[name] = loader
+        self._changed()
+
+    def is_loaded(self, name):
+        return name in self._tables and name not in self._loaders
+
+    def __getitem__(self, name):
+        if name in self._loaders:
+            self._tables[name] = self._loaders.pop(name)()
+        return self._tables[name]
+
+    def __setitem__(self, name, table):
+        self._loaders.pop(name, None)
+        self._tables[name] = table
+        self._changed()
+
+    def __delitem__(self, name):
+        self._loaders.pop(name, None)
+        del self._tables[name]
+        self._changed()
+
+    def __iter__(self):
+        return iter(self._tables)
+
+    def __len__(self):
+        return len(self._tables)
+
+
+# Binary calibration file layout:
+#   magic (8 bytes), header length (uint64 little endian), JSON header padded
+#   to a multiple of 8 bytes, float64 little endian data.
+# The header describes each table with element offsets into the data.
+_BINARY_MAGIC = b"PYATECAL"
+_BINARY_VERSION = 1
+
+
+def _is_binary(filename):
+    with open(filename, "rb") as fid:
+        return fid.read(len(_BINARY_MAGIC)) == _BINARY_MAGIC
 
 
 class Calibration(object):
-    def __init__(self):
+    def __init__(self, cache_size=1024, extrapolate="raise"):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        cache_size : int, optional
+            Maximum number of scalar lookups remembered by get() and
+            get_many().  0 disables the cache.
+        extrapolate : str, optional
+            Default handling of points outside of a table.  See
+            CalibrationTable.
+
+        Returns
+        -------
+        None.
+
+        """
         self.logger = logging.getLogger(__name__)
-        self.tables = {}
+        # Adding, replacing or removing a table clears the cache.  Tables must
+        # not be modified in place (e.g. cal.tables[name].y[:] = ...) as
+        # cached results are not cleared then.  Use set_table() instead.
+        self.tables = _LazyTables(on_changed=self.clear_cache)
         self.indep_var = None
+        self.extrapolate = extrapolate
+
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._stacked = {}
 
     def set_indep_var(self, name):
         self.indep_var = name
 
-    def set_table(self, name, x, y):
-        self.tables[name] = interp1d(x, y)
+    def set_table(self, name, x, y, extrapolate=None):
+        if extrapolate is None:
+            extrapolate = self.extrapolate
+        self.tables[name] = CalibrationTable(x, y, extrapolate=extrapolate)
+
+    def set_grid_table(self, name, dims, axes, values, extrapolate=None):
+        """Adds an N-dimensional table.  See GridTable."""
+        if extrapolate is None:
+            extrapolate = self.extrapolate
+        self.tables[name] = GridTable(dims, axes, values, extrapolate=extrapolate)
+
+    def clear_cache(self):
+        self._cache.clear()
+        self._stacked.clear()
+
+    def _cache_get(self, key):
+        try:
+            val = self._cache[key]
+        except (KeyError, TypeError):
+            return None
+        self._cache.move_to_end(key)
+        return val
+
+    def _cache_put(self, key, val):
+        if self.cache_size <= 0:
+            return
+        try:
+            self._cache[key] = val
+        except TypeError:
+            # x is not hashable
+            return
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
 
     def get(self, name, x):
-        val = self.tables[name](x)
-        self.logger.debug("cal(%s,%g) = %g", name, x, val)
+        """
+        Looks up the value of a table
+
+        Scalar results are cached.  The cache is cleared when a table is
+        added, replaced or removed, but not when a table's arrays are
+        modified in place.
+
+        Parameters
+        ----------
+        name : str
+            Table name
+        x : float or array_like
+            Independent variable.  Arrays are evaluated in a single call.
+            For GridTables a dict keyed by dim name or a tuple of coordinates
+            in dim order.
+
+        Returns
+        -------
+        float or numpy.ndarray
+            Same shape as x
+
+        """
+        val = self._cache_get((name, x))
+        if val is None:
+            table = self.tables[name]
+            if isinstance(table, GridTable):
+                val = table.lookup(x)
+            else:
+                val = table(x)
+            if np.ndim(val) == 0:
+                val = val[()]
+                self._cache_put((name, x), val)
+
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("cal(%s,%s) = %s", name, str(x), str(val))
         return val
 
+    def _get_stacked(self, names):
+        """Groups tables sharing the same x values into a single interpolator
+        so they can all be evaluated in one call"""
+        key = tuple(names)
+        if key not in self._stacked:
+            groups = OrderedDict()
+            for name in names:
+                table = self.tables[name]
+                if isinstance(table, GridTable):
+                    continue
+                key_group = (table.extrapolate, table.x.tobytes())
+                groups.setdefault(key_group, []).append(name)
+
+            stacked = []
+            for group in groups.values():
+                table = self.tables[group[0]]
+                y = stack([self.tables[name].y for name in group])
+                stacked.append((group, CalibrationTable(table.x, y, table.extrapolate)))
+            self._stacked[key] = stacked
+        return self._stacked[key]
+
+    def get_many(self, x, names=None):
+        """
+        Looks up the value of several tables at once
+
+        Tables that share the same x values are evaluated together in a
+        single vectorized call.
+
+        Parameters
+        ----------
+        x : float, array_like or dict
+            Independent variable.  With GridTables x is a dict keyed by dim
+            name and 1-D tables use the entry for indep_var.
+        names : list of str, optional
+            Tables to evaluate.  Defaults to all tables.
+
+        Returns
+        -------
+        dict
+            Table name -> value (same shape as x)
+
+        """
+        if names is None:
+            names = list(self.tables.keys())
+
+        if isinstance(x, dict):
+            x_1d = x.get(self.indep_var)
+            scalar = all([np.ndim(v) == 0 for v in x.values()])
+            key = ("get_many", tuple(names), tuple(sorted(x.items())))
+        else:
+            x_1d = x
+            scalar = np.ndim(x) == 0
+            key = ("get_many", tuple(names), x)
+
+        result = self._cache_get(key) if scalar else None
+        if result is not None:
+            return dict(result)
+
+        values = {}
+        for group, interpolator in self._get_stacked(names):
+            y = interpolator(x_1d)
+            for k, name in enumerate(group):
+                values[name] = y[k][()] if scalar else y[k]
+        for name in names:
+            if isinstance(self.tables[name], GridTable):
+                y = self.tables[name].lookup(x)
+                values[name] = y[()] if scalar else y
+        result = {name: values[name] for name in names}
+
+        if scalar:
+            self._cache_put(key, result)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("cal(%s) = %s", str(x), str(result))
+        return dict(result)
+
+    def precompute(self, sweep, names=None, mapping=None):
+        """
+        Evaluates tables over every point of a ParameterSweep before the run
+
+        Parameters
+        ----------
+        sweep : ParameterSweep
+            Computed sweep
+        names : list of str, optional
+            Tables to evaluate.  Defaults to all tables.
+        mapping : dict, optional
+            Table dim name -> sweep parameter name for dims named differently
+            than the sweep parameters
+
+        Returns
+        -------
+        SweepCalibration
+
+        """
+        return SweepCalibration(self, sweep, names=names, mapping=mapping)
+
     def read(self, filename, delimiter=",", indep=None):
+        """
+        Reads tables from a CSV file
+
+        Binary files written by write(format="binary") are detected
+        automatically.  Their tables are memory mapped and only loaded when
+        first accessed.
+
+        Parameters
+        ----------
+        filename : str
+        delimiter : str, optional
+        indep : str or list of str, optional
+            Independent variable column(s).  Defaults to the first column.
+            With several independent variables the file is in long format (one
+            row per grid point) and every other column becomes a GridTable.
+
+        Returns
+        -------
+        None.
+
+        """
+        if _is_binary(filename):
+            self._read_binary(filename)
+            return
+
         cal_data = pd.read_csv(filename, delimiter=delimiter)
 
+        if isinstance(indep, (list, tuple)):
+            if len(indep) > 1:
+                self._read_grid(cal_data, list(indep))
+                return
+            indep = indep[0]
+
         # Determine independent values
         if indep is None:
             indep = cal_data.columns[0]
@@ -51,20 +666,178 @@ class Calibration(object):
             y = cal_data[name]
             self.set_table(name, x, y)
 
+    def _read_grid(self, cal_data, dims):
+        axes = [np.unique(cal_data[dim].to_numpy(dtype=float)) for dim in dims]
+        shape = tuple(len(axis) for axis in axes)
+
+        # Position of each row in the grid
+        position = tuple(
+            np.searchsorted(axis, cal_data[dim].to_numpy(dtype=float))
+            for dim, axis in zip(dims, axes)
+        )
+        flat = np.ravel_multi_index(position, shape)
+        if len(flat) != np.prod(shape) or len(np.unique(flat)) != len(flat):
+            raise ValueError("Calibration data does not form a complete grid")
+
+        for name in cal_data.columns:
+            if name in dims:
+                continue
+            values = np.empty(shape)
+            values[position] = cal_data[name].to_numpy(dtype=float)
+            self.set_grid_table(name, dims, axes, values)
+
+    def _read_binary(self, filename):
+        with open(filename, "rb") as fid:
+            fid.seek(len(_BINARY_MAGIC))
+            header_length = int(np.frombuffer(fid.read(8), dtype="<u8")[0])
+            header = json.loads(fid.read(header_length).decode())
+        if header["version"] > _BINARY_VERSION:
+            raise ValueError(f"Unsupported calibration file version in {filename}")
+
+        if any(table["type"] == "table" for table in header["tables"].values()):
+            indep = header["indep_var"]
+            if self.indep_var is not None and self.indep_var != indep:
+                raise ValueError("Incompatible independant variables")
+            self.indep_var = indep
+
+        data_start = len(_BINARY_MAGIC) + 8 + header_length
+        if os.path.getsize(filename) > data_start:
+            data = np.memmap(filename, dtype="<f8", mode="r", offset=data_start)
+        else:
+            data = np.zeros(0)
+
+        def block(offset, shape):
+            return data[offset : offset + int(np.prod(shape))].reshape(shape)
+
+        def loader(info):
+            if info["type"] == "grid":
+                return GridTable(
+                    info["dims"],
+                    [block(*axis) for axis in info["axes"]],
+                    block(*info["values"]),
+                    extrapolate=info["extrapolate"],
+                )
+            return CalibrationTable(
+                block(*info["x"]), block(*info["y"]), extrapolate=info["extrapolate"]
+            )
+
+        for name, info in header["tables"].items():
+            self.tables.set_loader(name, lambda info=info: loader(info))
+
+    def _write_binary(self, filename, fields):
+        tables = {}
+        blocks = []
+        offset = 0
+
+        def add_block(values):
+            nonlocal offset
+            values = np.asarray(values, dtype="<f8")
+            blocks.append(values)
+            location = [offset, list(values.shape)]
+            offset += values.size
+            return location
+
+        for field in fields:
+            table = self.tables[field]
+            if isinstance(table, GridTable):
+                tables[field] = {
+                    "type": "grid",
+                    "dims": table.dims,
+                    "axes": [add_block(axis) for axis in table.axes],
+                    "values": add_block(table.values),
+                }
+            else:
+                tables[field] = {
+                    "type": "table",
+                    "x": add_block(table.x),
+                    "y": add_block(table.y),
+                }
+            tables[field]["extrapolate"] = table.extrapolate
+
+        header = {
+            "version": _BINARY_VERSION,
+            "indep_var": self.indep_var,
+            "tables": tables,
+        }
+        header = json.dumps(header).encode()
+        header += b" " * (-len(header) % 8)
+
+        with open(filename, "wb") as fid:
+            fid.write(_BINARY_MAGIC)
+            fid.write(np.array(len(header), dtype="<u8").tobytes())
+            fid.write(header)
+            for values in blocks:
+                fid.write(np.ascontiguousarray(values).tobytes())
+
     def write(self, filename, format="csv", fields=None):
+        """
+        Writes tables to a file
+
+        Parameters
+        ----------
+        filename : str
+        format : str, optional
+            "csv": Readable text.  1-D tables must share the same x values and
+            grid tables must share the same grid.
+            "binary": Compact file with any mix of tables that read() memory
+            maps
+        fields : list of str, optional
+            Tables to write.  Defaults to all tables.
+
+        Returns
+        -------
+        None.
+
+        """
         if fields is None:
             fields = list(self.tables.keys())
 
-        cal_data = pd.DataFrame()
+        if format == "binary":
+            self._write_binary(filename, fields)
+            return
+        elif format != "csv":
+            raise ValueError(f"Unknown format: {format}")
+
+        if isinstance(self.tables[fields[0]], GridTable):
+            self._write_grid(filename, fields)
+            return
+
+        # Columns are collected first.  Inserting them one at a time into a
+        # DataFrame is slow for many tables
+        cal_data = OrderedDict()
 
         # Check for compatible dimensions
         x = self.tables[fields[0]].x  # Get x of first field
         cal_data[self.indep_var] = x
 
         for field in fields:
-            if not all(self.tables[field].x == x):
+            table = self.tables[field]
+            if isinstance(table, GridTable) or not all(table.x == x):
                 raise ValueError("X data must be same for all saved fields")
 
-            cal_data[field] = self.tables[field].y
+            cal_data[field] = table.y
+
+        pd.DataFrame(cal_data).to_csv(filename, header=True, index=False)
+
+    def _write_grid(self, filename, fields):
+        # Long format: one row per grid point
+        first = self.tables[fields[0]]
+        cal_data = OrderedDict()
+        grid = np.meshgrid(*first.axes, indexing="ij")
+        for dim, values in zip(first.dims, grid):
+            cal_data[dim] = values.ravel()
+
+        for field in fields:
+            table = self.tables[field]
+            if (
+                not isinstance(table, GridTable)
+                or table.dims != first.dims
+                or any(
+                    a.shape != b.shape or not all(a == b)
+                    for a, b in zip(table.axes, first.axes)
+                )
+            ):
+                raise ValueError("Grid must be same for all saved fields")
+            cal_data[field] = table.values.ravel()
 
-        cal_data.to_csv(filename, header=True, index=False)
+        pd.DataFrame(cal_data).to_csv(filename, header=True, index=False)
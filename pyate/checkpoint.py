@@ -0,0 +1,166 @@
+"""
+Created on Oct 18, 2026
+
+Checkpoint & resume of long running sweeps
+
+@author: kyleh
+"""
+
+import json
+import logging
+import os
+import time
+
+
+def _json_default(obj):
+    # numpy scalars
+    try:
+        return obj.item()
+    except AttributeError:
+        raise TypeError("Cannot serialize {:s}".format(repr(obj)))
+
+
+class Checkpoint(object):
+    """
+    Periodically saves the position of a sweep and the DataLogger counters so
+    an interrupted run can be resumed
+
+    The checkpoint file is JSON and is replaced atomically, so a crash while
+    saving leaves the previous checkpoint intact.  On resume the sweep
+    continues at the first point not covered by the checkpoint and autosave
+    appends to the existing logfile.  Records written after the checkpoint
+    are dropped from the logfile since those points get measured again.
+
+    Call update() once per point, after DataLogger.next_record() and the
+    sweep's next():
+
+        checkpoint = Checkpoint("run.checkpoint", sweep, datalog, interval=60)
+        checkpoint.resume()
+        while not sweep.end():
+            ...
+            datalog.next_record()
+            sweep.next()
+            checkpoint.update()
+        checkpoint.remove()
+    """
+
+    def __init__(self, filename, sweep, datalog=None, interval=60.0, records=None):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        filename : str
+            Checkpoint file
+        sweep : ParameterSweep or AdaptiveSweep
+            Sweep to save.  Anything with get_state() & set_state() works.
+        datalog : DataLogger, optional
+            Logger to save
+        interval : float, optional
+            Minimum number of seconds between checkpoints.  None disables the
+            time based checkpoint.
+        records : int, optional
+            Save a checkpoint every this many update() calls
+
+        Returns
+        -------
+        None.
+
+        """
+        self._logger = logging.getLogger(__name__)
+
+        self.filename = filename
+        self.sweep = sweep
+        self.datalog = datalog
+        self.interval = interval
+        self.records = records
+
+        self._updates = 0
+        self._time_save = time.monotonic()
+
+    def __repr__(self):
+        return "Checkpoint({:s})".format(repr(self.filename))
+
+    def exists(self):
+        return os.path.exists(self.filename)
+
+    def get_state(self):
+        state = {"time": time.time(), "sweep": self.sweep.get_state()}
+        if self.datalog is not None:
+            state["datalog"] = self.datalog.get_state()
+        return state
+
+    def save(self):
+        """Writes the checkpoint file"""
+        state = self.get_state()
+
+        filename_tmp = self.filename + ".tmp"
+        with open(filename_tmp, "wt") as fid:
+            json.dump(state, fid, default=_json_default)
+            fid.flush()
+            os.fsync(fid.fileno())
+        os.replace(filename_tmp, self.filename)
+
+        self._updates = 0
+        self._time_save = time.monotonic()
+        self._logger.debug("Checkpoint saved to %s", self.filename)
+
+    def update(self, force=False):
+        """
+        Saves a checkpoint if enough records or time have passed since the
+        last one
+
+        Returns
+        -------
+        bool
+            True if a checkpoint was saved
+
+        """
+        self._updates += 1
+        if (
+            force
+            or (self.records is not None and self._updates >= self.records)
+            or (
+                self.interval is not None
+                and time.monotonic() - self._time_save >= self.interval
+            )
+        ):
+            self.save()
+            return True
+        return False
+
+    def load(self):
+        with open(self.filename, "rt") as fid:
+            return json.load(fid)
+
+    def resume(self):
+        """
+        Restores the sweep & logger from the checkpoint file if there is one
+
+        Returns
+        -------
+        bool
+            True if a checkpoint was restored
+
+        """
+        if not self.exists():
+            return False
+
+        state = self.load()
+        self.sweep.set_state(state["sweep"])
+        if self.datalog is not None and "datalog" in state:
+            self.datalog.set_state(state["datalog"])
+
+        self._logger.info(
+            "Resumed from checkpoint %s saved at %s",
+            self.filename,
+            time.ctime(state["time"]),
+        )
+        self._updates = 0
+        self._time_save = time.monotonic()
+        return True
+
+    def remove(self):
+        """Deletes the checkpoint file once the run is complete"""
+        if self.exists():
+            os.remove(self.filename)
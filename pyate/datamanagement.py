@@ -10,9 +10,9 @@ ToDo:
 
 from collections import OrderedDict
 from datetime import datetime
-from itertools import product
 import logging
 from os import environ
+import time
 
 import matplotlib
 import matplotlib.pyplot as plt
@@ -20,6 +20,10 @@ import numpy as np
 from scipy.stats import linregress
 import pandas as pd
 
+from pyate.datastore import DataColumn, GroupIndex, RollingStatistics
+from pyate.datawriter import CsvLogWriter, HdfLogWriter, ThreadedLogWriter
+from pyate.plotviewer import PlotPublisher
+
 
 class DataLogger(object):
     """
@@ -27,39 +31,118 @@ class DataLogger(object):
     """
 
     def __init__(
-        self, logfile=None, logfile_format="csv", autosave=False, timestamp=True
+        self,
+        logfile=None,
+        logfile_format="csv",
+        autosave=False,
+        timestamp=True,
+        storage="list",
+        flush_records=None,
+        flush_interval=None,
+        background_writer=False,
+        writer_queue_size=1000,
+        min_itemsize=64,
+        plot_blit=False,
+        plot_fps=None,
+        plot_publish=None,
     ):
         """
         Constructor
+
+        Parameters
+        ----------
+        logfile_format : str, optional
+            Format used for autosave.
+            "csv": One line per record (see pyate.datawriter.CsvLogWriter)
+            "hdf": Records are appended to an HDF5 table in chunks as groups
+            complete (see pyate.datawriter.HdfLogWriter)
+        storage : str, optional
+            Backend used to hold logged data in memory.
+            "list": Each column is a Python list
+            "columnar": Numeric columns are kept in typed NumPy buffers (see
+            pyate.datastore.DataColumn).  Missing numeric values become NaN.
+        flush_records : int, optional
+            Number of autosaved records buffered in memory before they are
+            written to the logfile.  Defaults to 1 for csv and 1000 for hdf.
+        flush_interval : float, optional
+            Maximum time in seconds autosaved records are buffered.  None
+            disables the time based flush.
+        background_writer : bool, optional
+            Perform logfile formatting and I/O on a dedicated thread.
+            next_record() only queues the record.  write_data() is also
+            performed on the writer thread.
+        writer_queue_size : int, optional
+            Maximum number of queued records before next_record() blocks
+        min_itemsize : int, optional
+            Bytes reserved for string columns of an hdf logfile.  Records with
+            longer strings are rejected (see pyate.datawriter.HdfLogWriter).
+        plot_blit : bool, optional
+            Use incremental, blit based drawing in plot_update().  Only new
+            points are added to the plot and the figure is only fully redrawn
+            when a new group starts or the data leaves the current axis limits.
+        plot_fps : float, optional
+            Maximum rate plot_update() redraws the figure.  Calls in between
+            return immediately.  None redraws on every call.
+        plot_publish : int, optional
+            Publish plot definitions and records on this local TCP port so
+            they can be displayed by a separate viewer process
+            (python -m pyate.plotviewer --port <port>).  0 picks a free port,
+            see plot_publisher.port.  None disables publishing.
         """
 
+        if storage not in ("list", "columnar"):
+            raise ValueError(f"Unknown storage type: {storage}")
+
         self._logger = logging.getLogger(__name__)
 
         self._logfile = logfile
         self._logfile_started = False
         self._logfile_format = logfile_format
         self._autosave = autosave
+        self._storage = storage
+        self._writer = None
+        self._flush_records = flush_records
+        self._flush_interval = flush_interval
+        self._background_writer = background_writer
+        self._writer_queue_size = writer_queue_size
+        self._min_itemsize = min_itemsize
 
         self._enable_timestamp = timestamp
         self._record_start_time = datetime.now()
         self._record_stop_time = None
         self._data = OrderedDict()
         self._record_current = OrderedDict()
+        self._record_started = False
         self._record_num = 0
         self._num_records = 0
 
         self._group_num = 0
         self._group_start = 0
-        self._group_indexes = [0]
+        self._groups = GroupIndex()
 
         self._column_order = []
 
+        self._statistics = {}
+
         self._plots = []
         self._plot_window_drawn = False
+        self._plot_blit = plot_blit
+        self._plot_fps = plot_fps
+        self._plot_time_draw = None
+
+        self.plot_publisher = None
+        if plot_publish is not None:
+            self.plot_publisher = PlotPublisher(port=plot_publish)
 
         # self._value_missing = float("nan")
         self._value_missing = None
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def __getitem__(self, key):
         return self._record_current[key]
 
@@ -74,13 +157,22 @@ class DataLogger(object):
         return self._data[key][-1]
 
     def get_data(self, key, s=None, includecurrent=False):
+        if s is None:
+            s = slice(None)
+
         if key not in self._data:
             v = []
         else:
             v = self._data[key][s]
 
         if includecurrent:
-            v += [self._record_current.get(key, None)]
+            current = self._record_current.get(key, None)
+            if isinstance(v, np.ndarray):
+                if current is None and v.dtype != object:
+                    current = np.nan
+                v = np.append(v, current)
+            else:
+                v = v + [current]
 
         return v
 
@@ -88,21 +180,59 @@ class DataLogger(object):
         """ Returns list of values for key in requested group
         
         index: 0 indicates current group, -1 indicates last group, etc.
+
+        With columnar storage the result is a view into the column buffer.
         """
+        return self.get_data(key, self._groups.get_slice(index))
 
-        # Need to subtract one from index to correclty align with self._group_indexes
-        index -= 1
+    def get_group_info(self, index):
+        """ Returns summary of requested group: group number, start/stop
+        positions, record count and timestamp range
 
-        record_start = self._group_indexes[index]
+        index: 0 indicates current group, -1 indicates last group, etc.
+        """
+        return self._groups.get_info(index)
 
-        if index == -1:
-            record_stop = -1
-        else:
-            record_stop = self._group_indexes[index + 1]
+    def num_groups(self):
+        return len(self._groups)
+
+    def iter_groups(self, key):
+        """ Iterates over all groups yielding (group number, values for key) """
+        for index in self._groups.indexes():
+            yield self._groups.get_info(index)["group"], self.get_group(index, key)
 
-        return self._data[key][record_start:record_stop]
+    def aggregate_groups(self, key, fcn=np.mean):
+        """ Applies fcn to the values of key in each group
+
+        Returns dict of group number: result.  Empty groups are skipped. """
+        result = {}
+        for group, values in self.iter_groups(key):
+            if len(values) > 0:
+                result[group] = fcn(values)
+        return result
+
+    def add_statistics(self, key, window):
+        """ Maintains rolling statistics for key over the last window records of
+        the current group.  They are updated in constant time by next_record()
+        and reset by next_group().  See get_statistics() """
+        stats = RollingStatistics(window)
+        for value in self.get_data(key, slice(self._group_start, None)):
+            stats.append(value)
+        self._statistics[key] = stats
+        return stats
+
+    def get_statistics(self, key):
+        """ Returns pyate.datastore.RollingStatistics for key
+
+        Provides mean, std, min, max, span, slope and settled() """
+        return self._statistics[key]
 
     def trend(self, key, pts, includecurrent=False):
+        stats = self._statistics.get(key)
+        if stats is not None and stats.window == pts and not includecurrent:
+            # Already tracked.  No need to touch the history
+            return stats.slope
+
         # Get all the data in the current group
         v = self.get_data(
             key, slice(self._group_start, None), includecurrent=includecurrent
@@ -131,18 +261,27 @@ class DataLogger(object):
         self._record_current["index"] = self._record_num
         self._record_current["group"] = self._group_num
 
+        # Written first so a record the logfile rejects is not logged at all
+        if self._autosave:
+            self.write_record()
+
+        self._groups.add_record(self._record_start_time, datetime.now())
+
         # Since keys in _record_current are never deleted, then _record_current should
         # always contain the keys already in _data
 
         for key, item in self._record_current.items():
             if key not in self._data:
                 # Create missing record & fill with appropriate missing data value
-                self._data[key] = [self._value_missing] * self._num_records
+                self._data[key] = self._new_column()
 
             self._data[key].append(self._record_current[key])
 
-        if self._autosave:
-            self.write_record()
+        for key, stats in self._statistics.items():
+            stats.append(self._record_current.get(key))
+
+        if self.plot_publisher is not None:
+            self.plot_publisher.publish_record(self._record_current)
 
         for key in self._record_current.keys():
             self._record_current[key] = None
@@ -157,13 +296,27 @@ class DataLogger(object):
             self._logger.warning("next_group() called with non-empty current record")
             self.next_record()
 
-        if self._group_start == self._record_num:
+        if self._group_start == self._num_records:
             # next_group called without adding any data
             pass
 
         self._group_num += 1
-        self._group_start = self._record_num
-        self._group_indexes.append(self._record_num)
+        self._groups.next_group(self._group_num)
+        self._group_start = self._groups.current_start
+
+        for stats in self._statistics.values():
+            stats.reset()
+
+        if self._writer is not None:
+            self._writer.next_group()
+
+        if self.plot_publisher is not None:
+            self.plot_publisher.publish_group(self._group_num)
+
+    def _new_column(self):
+        if self._storage == "columnar":
+            return DataColumn(num_missing=self._num_records)
+        return [self._value_missing] * self._num_records
 
     def set_order(self, order):
         self._column_order = ["index"] + order
@@ -179,6 +332,13 @@ class DataLogger(object):
             if key not in columns:
                 columns.append(key)
 
+        if self._storage == "columnar" and "index" in self._data:
+            # Hand pandas views of the column buffers so no data is copied
+            columns = [key for key in columns if key != "index"]
+            data = {key: self._data[key].values() for key in columns}
+            index = pd.Index(self._data["index"].values(), name="index")
+            return pd.DataFrame(data, index=index, columns=columns, copy=False)
+
         return pd.DataFrame(self._data, columns=columns).set_index("index")
 
     def to_csv(self, data):
@@ -191,22 +351,147 @@ class DataLogger(object):
         self._logger.debug(f"to_csv.line = {line}")
         return line
 
+    def _create_writer(self, append=False):
+        if self._logfile_format == "csv":
+            writer = CsvLogWriter(
+                self._logfile,
+                flush_records=self._flush_records or 1,
+                flush_interval=self._flush_interval,
+                append=append,
+            )
+        elif self._logfile_format == "hdf":
+            # Rows are appended to the table in chunks at each group boundary
+            writer = HdfLogWriter(
+                self._logfile,
+                flush_records=self._flush_records or 1000,
+                flush_interval=self._flush_interval,
+                append=append,
+                min_itemsize=self._min_itemsize,
+            )
+        else:
+            raise ValueError(f"Unknown logfile format: {self._logfile_format}")
+
+        if self._background_writer:
+            writer = ThreadedLogWriter(writer, queue_size=self._writer_queue_size)
+        return writer
+
+    def _get_writer(self):
+        if self._writer is None:
+            # Continue an existing logfile after close()
+            self._writer = self._create_writer(append=self._logfile_started)
+        return self._writer
+
+    def get_state(self):
+        """
+        Returns the counters needed to resume logging with set_state()
+
+        Buffered autosave records are flushed first so the logfile position
+        in the state matches the records logged so far.  Should be called
+        between records (see pyate.checkpoint.Checkpoint).
+
+        Returns
+        -------
+        dict
+            JSON serializable state
+
+        """
+        if self._record_started:
+            self._logger.warning("Current record is not included in the state")
+
+        position = None
+        if self._logfile_started:
+            position = self._get_writer().tell()
+
+        return {
+            "record_num": self._record_num,
+            "group_num": self._group_num,
+            "columns": list(self._record_current.keys()),
+            "column_order": list(self._column_order),
+            "logfile": self._logfile,
+            "logfile_format": self._logfile_format,
+            "logfile_position": position,
+        }
+
+    def set_state(self, state):
+        """
+        Restores counters saved by get_state() so logging continues where it
+        left off
+
+        Autosave appends to the existing logfile.  Anything written to the
+        logfile after the state was saved is discarded.  Data logged before
+        the state was saved is not reloaded into memory.
+
+        Parameters
+        ----------
+        state : dict
+            State returned by get_state()
+
+        Returns
+        -------
+        None.
+
+        """
+        if self._num_records > 0 or self._record_started:
+            raise Exception("set_state() must be called before logging any data")
+        if self._logfile is None:
+            self._logfile = state["logfile"]
+        if state["logfile_format"] != self._logfile_format:
+            raise ValueError(
+                "Logfile format does not match state: {:s}".format(
+                    state["logfile_format"]
+                )
+            )
+
+        self._record_num = state["record_num"]
+        self._group_num = state["group_num"]
+        self._groups = GroupIndex(self._group_num)
+        self._group_start = self._groups.current_start
+        self._column_order = list(state["column_order"])
+
+        # Restore column order so records line up with the existing logfile
+        self._record_current = OrderedDict.fromkeys(state["columns"])
+        for key in state["columns"]:
+            if key not in self._data:
+                self._data[key] = self._new_column()
+
+        position = state["logfile_position"]
+        if position:
+            if self._writer is not None:
+                self._writer.close()
+            self._writer = self._create_writer(append=True)
+            self._writer.truncate(position)
+            self._logfile_started = True
+        self._record_start_time = datetime.now()
+
+    def get_writer_statistics(self):
+        """ Returns queue depth & write latency counters of the background
+        writer.  Returns None if the background writer is not in use """
+        if isinstance(self._writer, ThreadedLogWriter):
+            return self._writer.get_statistics()
+        return None
+
     def write_record(self):
         if self._logfile is None:
             raise ValueError("Logfile not specified")
         self._logger.debug("Writing record data")
-        data_to_write = self._record_current
-        if not self._logfile_started:
-            with open(self._logfile, "wt") as fid:
-                fid.write(self.to_csv(data_to_write.keys()))
-                fid.write("\n")
-            self._logfile_started = True
 
-        with open(self._logfile, "at") as fid:
-            fid.write(
-                self.to_csv(data_to_write.values())
-            )  # I think an odict should return the values in the same order as the keys....
-            fid.write("\n")
+        self._get_writer().write_record(self._record_current)
+        self._logfile_started = True
+
+    def flush(self):
+        """ Writes any buffered autosave records to the logfile """
+        if self._writer is not None:
+            self._writer.flush()
+
+    def close(self):
+        """ Flushes and closes the autosave logfile.  Records written after
+        this are appended to it by a new writer. """
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self.plot_publisher is not None:
+            self.plot_publisher.close()
+            self.plot_publisher = None
 
     def write_data(self, filename=None, format="csv", name="data"):
         if filename is None:
@@ -215,40 +500,78 @@ class DataLogger(object):
         if filename is None:
             raise (FileNotFoundError("No output filename provided"))
 
+        self.flush()
+
+        frame = self.to_frame()
         if format == "csv":
-            self.to_frame().to_csv(filename, na_rep="nan")
+            fcn, args, kwargs = frame.to_csv, (filename,), {"na_rep": "nan"}
         elif format == "hdf":
-            self.to_frame().to_hdf(filename, name)
+            fcn, args, kwargs = frame.to_hdf, (filename, name), {}
+        else:
+            raise ValueError(f"Unknown format: {format}")
+
+        if isinstance(self._writer, ThreadedLogWriter):
+            self._writer.submit(fcn, *args, **kwargs)
+        else:
+            fcn(*args, **kwargs)
 
     def plot_add(self, x, y, axes=1, title="New Plot", **kwargs):
         plotdef = {"axes": axes, "x": x, "y": y, "title": title, **kwargs}
         self._plots.append(plotdef)
         self._logger.debug("Added plot definition: %s", str(self._plots[-1]))
 
+        if self.plot_publisher is not None:
+            self.plot_publisher.set_plots(self._plots)
+
     def plot_hold(self, *args, **kwargs):
         plt.ioff()
         plt.show(*args, **kwargs)
 
-    def plot_update(self):
-        if not self._plot_window_drawn:
-            # Initialize matplotlib
-            in_spyder = False
-            if "SPY_PYTHONPATH" in environ:
-                self._logger.debug("Application running from within Spyder")
-                in_spyder = True
-                # %matplotlib auto
-            else:
-                self._logger.debug("Configuring matplotlibfor QT windows")
-                matplotlib.use("qtagg")
-                plt.ion()
+    def _plot_init(self):
+        # Initialize matplotlib
+        in_spyder = False
+        if "SPY_PYTHONPATH" in environ:
+            self._logger.debug("Application running from within Spyder")
+            in_spyder = True
+            # %matplotlib auto
+        else:
+            self._logger.debug("Configuring matplotlibfor QT windows")
+            matplotlib.use("qtagg")
+            plt.ion()
+
+        # Create figure
+        self._fig, self._ax = plt.subplots(2, 2, sharex=True)
 
-            # Create figure
-            self._fig, self._ax = plt.subplots(2, 2, sharex=True)
+        for ax in self._ax.ravel():
+            ax.set_autoscale_on(True)
 
-            for ax in self._ax.ravel():
-                ax.set_autoscale_on(True)
+        self._plot_group_last = None
 
-            self._plot_group_last = None
+    def _plot_get_axes(self, axes_idx):
+        if isinstance(axes_idx, int):
+            return self._ax.ravel()[axes_idx]
+        return self._ax[axes_idx]
+
+    def _plot_rate_limited(self, force):
+        if force or not self._plot_fps or self._plot_time_draw is None:
+            return False
+        return time.monotonic() - self._plot_time_draw < 1.0 / self._plot_fps
+
+    def plot_update(self, force=False):
+        """ Updates plot window with data from the current group
+
+        force: Redraw even if plot_fps would otherwise skip this update
+        """
+        if self._plot_rate_limited(force):
+            return
+        self._plot_time_draw = time.monotonic()
+
+        if self._plot_blit:
+            self._plot_update_blit()
+            return
+
+        if not self._plot_window_drawn:
+            self._plot_init()
 
         for plotdef in self._plots:
             # Access dictionary keys by popping them as needed.  That asllows us
@@ -264,10 +587,7 @@ class DataLogger(object):
             data_x = self.get_group(0, key_x)
             data_y = self.get_group(0, key_y)
 
-            if isinstance(axes_idx, int):
-                ax = self._ax.ravel()[axes_idx]
-            else:
-                ax = self._ax[axes_idx]
+            ax = self._plot_get_axes(axes_idx)
             # if not self._plot_window_drawn:
             if self._plot_group_last != self._group_num:
                 ax.plot(
@@ -286,6 +606,154 @@ class DataLogger(object):
         self._plot_group_last = self._group_num
         self._plot_window_drawn = True
 
+    def _plot_update_blit(self):
+        """ Incremental version of plot_update()
+
+        Each plot definition owns an animated line holding the current group.
+        Only records added since the last refresh are appended to it.  The
+        static parts of the figure are cached as bitmaps and restored before
+        the lines are redrawn, so a refresh does not depend on the amount of
+        data already plotted.
+        """
+        first_draw = not self._plot_window_drawn
+        if first_draw:
+            self._plot_init()
+            self._plot_lines = [None] * len(self._plots)
+            self._plot_line_data = [None] * len(self._plots)
+            self._plot_backgrounds = {}
+            self._plot_consumed = 0
+
+        new_group = self._plot_group_last != self._group_num
+        # Relative index of the group drawn by the last refresh.  With plot_fps
+        # whole groups can start and finish between two refreshes.
+        last_index = 0
+        if new_group and not first_draw:
+            last_index = self._plot_group_last - self._group_num
+            if -last_index >= len(self._groups):
+                # Group index was restarted by set_state()
+                last_index = 0
+        last_consumed = self._plot_consumed
+        if new_group:
+            self._plot_consumed = self._group_start
+
+        record_slice = slice(self._plot_consumed, self._num_records)
+        redraw = first_draw or new_group
+
+        for n, plotdef in enumerate(self._plots):
+            plotdef_copy = plotdef.copy()  # Create copy so we don't modify original
+
+            axes_idx = plotdef_copy.pop("axes")
+            title = plotdef_copy.pop("title")
+
+            key_x = plotdef_copy.pop("x")
+            key_y = plotdef_copy.pop("y")
+
+            new_x = self.get_data(key_x, record_slice)
+            new_y = self.get_data(key_y, record_slice)
+
+            ax = self._plot_get_axes(axes_idx)
+            if new_group:
+                if self._plot_lines[n] is not None and last_index < 0:
+                    # Points of the previous group that arrived after the last
+                    # refresh
+                    last_slice = slice(
+                        last_consumed, self._groups.get_slice(last_index).stop
+                    )
+                    data_x, data_y = self._plot_line_data[n]
+                    data_x.extend(self.get_data(key_x, last_slice))
+                    data_y.extend(self.get_data(key_y, last_slice))
+                    self._plot_lines[n].set_data(data_x, data_y)
+
+                    # Groups that were never drawn
+                    for index in range(last_index + 1, 0):
+                        group_slice = self._groups.get_slice(index)
+                        ax.plot(
+                            self.get_data(key_x, group_slice),
+                            self.get_data(key_y, group_slice),
+                            label=key_y,
+                            **plotdef_copy,
+                        )
+                if self._plot_lines[n] is not None:
+                    # Previous group becomes part of the static background
+                    self._plot_lines[n].set_animated(False)
+                self._plot_line_data[n] = (list(new_x), list(new_y))
+                (line,) = ax.plot(
+                    *self._plot_line_data[n], label=key_y, animated=True, **plotdef_copy
+                )
+                self._plot_lines[n] = line
+                ax.set_title(title)
+                ax.legend()
+                ax.grid(True)
+            elif len(new_x) > 0:
+                data_x, data_y = self._plot_line_data[n]
+                data_x.extend(new_x)
+                data_y.extend(new_y)
+                self._plot_lines[n].set_data(data_x, data_y)
+
+            if len(new_x) > 0 and self._plot_outside_view(ax, new_x, new_y):
+                redraw = True
+
+        self._plot_consumed = self._num_records
+
+        canvas = self._fig.canvas
+        axes_used = {line.axes for line in self._plot_lines if line is not None}
+        if redraw:
+            for ax in axes_used:
+                self._plot_expand_view(ax)
+            if first_draw:
+                self._fig.tight_layout()
+            canvas.draw()
+            self._plot_backgrounds = {
+                ax: canvas.copy_from_bbox(ax.bbox) for ax in axes_used
+            }
+
+        for ax in axes_used:
+            if not redraw:
+                canvas.restore_region(self._plot_backgrounds[ax])
+            for line in self._plot_lines:
+                if line is not None and line.axes is ax:
+                    ax.draw_artist(line)
+            canvas.blit(ax.bbox)
+        canvas.flush_events()
+
+        self._plot_group_last = self._group_num
+        self._plot_window_drawn = True
+
+    def _plot_outside_view(self, ax, new_x, new_y):
+        try:
+            new_x = np.asarray(new_x, dtype=float)
+            new_y = np.asarray(new_y, dtype=float)
+        except (TypeError, ValueError):
+            return False
+
+        if np.all(np.isnan(new_x)) or np.all(np.isnan(new_y)):
+            return False
+
+        xlim = sorted(ax.get_xlim())
+        ylim = sorted(ax.get_ylim())
+        return (
+            np.nanmin(new_x) < xlim[0]
+            or np.nanmax(new_x) > xlim[1]
+            or np.nanmin(new_y) < ylim[0]
+            or np.nanmax(new_y) > ylim[1]
+        )
+
+    def _plot_expand_view(self, ax, headroom=0.2):
+        """ Rescales axes to the data plus some headroom so that a steadily
+        growing sweep does not force a full redraw on every point """
+        ax.relim()
+        ax.autoscale_view(True, True, True)
+        for get_lim, set_lim, data_lim in (
+            (ax.get_xlim, ax.set_xlim, ax.dataLim.intervalx),
+            (ax.get_ylim, ax.set_ylim, ax.dataLim.intervaly),
+        ):
+            lo, hi = sorted(data_lim)
+            if not (np.isfinite(lo) and np.isfinite(hi)) or lo == hi:
+                continue
+            pad = headroom * (hi - lo)
+            lim_lo, lim_hi = sorted(get_lim())
+            set_lim(min(lim_lo, lo - pad), max(lim_hi, hi + pad), auto=None)
+
     def plot_pause(self, delay=0.05):
         """ Calls matplotlib.pyplot.pause to allow QT windows to update and receive
         GUI events """
@@ -293,9 +761,9 @@ class DataLogger(object):
 
     def plot_single(self, x=None, y=None, **kwargs):
         if x is None:
-            return plt.plot(self._data[y], **kwargs)
+            return plt.plot(self.get_data(y), **kwargs)
         else:
-            return plt.plot(self._data[x], self._data[y], **kwargs)
+            return plt.plot(self.get_data(x), self.get_data(y), **kwargs)
 
     # Check to see if data file exists. If so, increment
     def next_available(filename):
@@ -317,6 +785,89 @@ class DataLogger(object):
         return next_available(new_filename)
 
 
+class ParameterProduct(object):
+    """
+    Lazy cartesian product of parameter values
+
+    Behaves like list(itertools.product(*values)) without building it.  The
+    tuple for any flat index is computed on demand by treating the index as a
+    mixed-radix number whose digits select the value of each parameter (last
+    parameter varies fastest).
+
+    With serpentine=True the points are visited in boustrophedon order: each
+    pass of a parameter runs in the opposite direction of the previous pass,
+    so exactly one parameter changes between consecutive points.
+    """
+
+    def __init__(self, values, serpentine=False):
+        self.serpentine = serpentine
+        self._values = [list(v) for v in values]
+        self._lengths = [len(v) for v in self._values]
+
+        # stride[i] = number of points before parameter i changes
+        self._strides = [1] * len(self._values)
+        for i in range(len(self._values) - 2, -1, -1):
+            self._strides[i] = self._strides[i + 1] * self._lengths[i + 1]
+
+        self._length = 1
+        for length in self._lengths:
+            self._length *= length
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._get(k) for k in range(*index.indices(self._length))]
+
+        if index < 0:
+            index += self._length
+        if index < 0 or index >= self._length:
+            raise IndexError("ParameterProduct index out of range")
+        return self._get(index)
+
+    def __iter__(self):
+        for k in range(self._length):
+            yield self._get(k)
+
+    def __repr__(self):
+        return "ParameterProduct({:s}, length={:d}{:s})".format(
+            "x".join(str(length) for length in self._lengths),
+            self._length,
+            ", serpentine" if self.serpentine else "",
+        )
+
+    @property
+    def lengths(self):
+        return list(self._lengths)
+
+    @property
+    def strides(self):
+        return list(self._strides)
+
+    def digits(self, index):
+        """ Returns the position of each parameter within its value list """
+        return tuple(
+            self._digit(index, stride, length)
+            for stride, length in zip(self._strides, self._lengths)
+        )
+
+    def _digit(self, index, stride, length):
+        digit = (index // stride) % length
+        # Odd numbered passes of a parameter run backwards
+        if self.serpentine and (index // (stride * length)) % 2:
+            digit = length - 1 - digit
+        return digit
+
+    def _get(self, index):
+        return tuple(
+            values[self._digit(index, stride, length)]
+            for values, stride, length in zip(
+                self._values, self._strides, self._lengths
+            )
+        )
+
+
 class ParameterSweep(object):
     """
     classdocs
@@ -333,6 +884,12 @@ class ParameterSweep(object):
         self._parameter_list = None
         self._list_computed = False
 
+        # Time (s) to change & settle each parameter, see set_parameter_cost()
+        self._parameter_costs = {}
+        self._serpentine = False
+
+        self._logger = logging.getLogger(__name__)
+
         self._index = 0
         self._index_last = None
         self._length = None
@@ -353,7 +910,7 @@ class ParameterSweep(object):
         if self._index_last is None:
             return None
         else:
-            self.get_last_tuple()[self._parameter_order.index(key)]
+            return self.get_last_tuple()[self._parameter_order.index(key)]
 
     def get_last_tuple(self):
         if self._index_last is None:
@@ -368,9 +925,23 @@ class ParameterSweep(object):
         self.check_valid()
         return self._parameter_list[self._index]
 
+    def get_current_row(self):
+        return self.get_current_tuple()
+
+    def get_current_digits(self):
+        """ Returns the position of each parameter within its value list """
+        self.check_valid()
+        return self._parameter_list.digits(self._index)
+
     def get_index(self):
         return self._index
 
+    def get_order(self):
+        return list(self._parameter_order)
+
+    def get_parameter_range(self, key):
+        return self._parameters[key]
+
     def get_changes(self):
         if self._index_last is None:
             result = self.get_current_dict()
@@ -384,6 +955,34 @@ class ParameterSweep(object):
                     result[self._parameter_order[i]] = cur[i]
         return result
 
+    def get_state(self):
+        """ Returns the sweep position as a JSON serializable dict """
+        self.check_valid()
+        return {
+            "index": self._index,
+            "length": self._length,
+            "order": list(self._parameter_order),
+            "serpentine": self._serpentine,
+        }
+
+    def set_state(self, state):
+        """
+        Restores the sweep position saved by get_state()
+
+        The sweep must already be set up & computed the same way as when the
+        state was saved.  get_changes() reports all parameters for the first
+        point after the restore since the instrument state is unknown.
+        """
+        self.check_valid()
+        if (
+            state["order"] != self._parameter_order
+            or state["length"] != self._length
+            or state["serpentine"] != self._serpentine
+        ):
+            raise ValueError("Sweep does not match saved state")
+        self._index = state["index"]
+        self._index_last = None
+
     def set_parameter_range(self, key, val):
         # Create a copy if we can
         try:
@@ -408,14 +1007,140 @@ class ParameterSweep(object):
         self._parameter_order = order
         self._list_computed = False
 
+    def set_parameter_cost(self, key, cost=0.0, settle=0.0):
+        """
+        Sets how long it takes to change a parameter
+
+        Parameters
+        ----------
+        key : str
+            Parameter name
+        cost : float, optional
+            Time (s) spent programming the new value (e.g. VNA re-calibration)
+        settle : float, optional
+            Time (s) to wait after the change before measuring
+
+        Returns
+        -------
+        None.
+
+        """
+        if key not in self._parameters:
+            raise KeyError("Unknown parameter: {:s}".format(key))
+        self._parameter_costs[key] = float(cost) + float(settle)
+
+    def set_serpentine(self, serpentine):
+        """ Enables boustrophedon traversal (see ParameterProduct) """
+        self._serpentine = serpentine
+        self._list_computed = False
+
+    def get_change_counts(self, order=None, serpentine=None):
+        """ Number of times each parameter changes over the sweep, not counting
+        the initial setting """
+        if order is None:
+            order = self._parameter_order
+        if serpentine is None:
+            serpentine = self._serpentine
+
+        result = {}
+        passes = 1  # Number of passes over the current parameter
+        for key in order:
+            length = len(self._parameters[key])
+            if serpentine:
+                result[key] = passes * (length - 1)
+            else:
+                result[key] = passes * length - 1
+            passes *= length
+        return result
+
+    def estimate_duration(self, point_time=0.0, order=None, serpentine=None):
+        """
+        Estimates the wall time of the sweep
+
+        Parameters
+        ----------
+        point_time : float, optional
+            Time (s) spent measuring each point
+        order, serpentine : optional
+            Evaluate a different ordering than the current one
+
+        Returns
+        -------
+        float
+            Estimated duration in seconds
+
+        """
+        if order is None:
+            order = self._parameter_order
+
+        duration = 0.0
+        num_points = 1
+        changes = self.get_change_counts(order, serpentine)
+        for key in order:
+            # Every parameter is set once at the start of the sweep
+            duration += self._parameter_costs.get(key, 0.0) * (1 + changes[key])
+            num_points *= len(self._parameters[key])
+        return duration + point_time * num_points
+
+    def optimize_order(self, serpentine=False):
+        """
+        Orders the parameters so expensive parameters change the least
+
+        Parameters that only have one value go outermost.  Otherwise, for a
+        normal traversal parameter i changes N_i - 1 times where N_i is the
+        product of the lengths of i and all parameters outside it.  Swapping
+        two neighbors shows the total cost is minimized by sorting on
+        cost * L / (L - 1), largest outermost.  For a serpentine traversal the
+        inner parameter never changes when the outer one does, so sorting on
+        cost alone is optimal.
+
+        Parameters
+        ----------
+        serpentine : bool, optional
+            Also switch to serpentine traversal
+
+        Returns
+        -------
+        list
+            New parameter order
+
+        """
+
+        def weight(key):
+            length = len(self._parameters[key])
+            if length < 2:
+                return float("inf")
+            cost = self._parameter_costs.get(key, 0.0)
+            if serpentine:
+                return cost
+            return cost * length / (length - 1)
+
+        # Stable sort so ties keep the user specified order
+        order = list(self._parameter_order)
+        if set(order) != set(self._parameters.keys()):
+            order = list(self._parameters.keys())
+        order = sorted(order, key=weight, reverse=True)
+
+        self.set_order(order)
+        self.set_serpentine(serpentine)
+        return order
+
     def compute(self):
         self.reset()
-        self._parameter_list = list(
-            product(*[self._parameters[k] for k in self._parameter_order])
+        self._parameter_list = ParameterProduct(
+            [self._parameters[k] for k in self._parameter_order],
+            serpentine=self._serpentine,
         )
         self._length = len(self._parameter_list)
         self._list_computed = True
 
+        if self._parameter_costs:
+            self._logger.info(
+                "Sweep of %d points, estimated %.1f s of parameter changes",
+                self._length,
+                self.estimate_duration(),
+            )
+
     def reset(self):
         self._index = 0
         self._index_last = None
@@ -434,16 +1159,268 @@ class ParameterSweep(object):
         self._index += 1
 
     def next_group(self):
-        # Slow but I'm tried of messing with this for now
+        """ Skips to the next value of the second innermost parameter """
+        self.skip_dimension(-1)
+
+    def skip_dimension(self, key):
+        """
+        Skips the remaining points of the loop over a parameter
+
+        Jumps to the next point where a parameter outside of key changes.  E.g.
+        with order ["bias", "freq", "power"], skip_dimension("power") aborts
+        the rest of the power sweep and moves to the next frequency, while
+        skip_dimension("freq") moves straight to the next bias point.
+
+        Parameters
+        ----------
+        key : str or int
+            Parameter name or position in the sweep order
+
+        Returns
+        -------
+        None.
+
+        """
+        self.check_valid()
+        if isinstance(key, str):
+            level = self._parameter_order.index(key)
+        else:
+            level = range(len(self._parameter_order))[key]
+
+        # Points covered by one complete pass of the loop over key
+        product = self._parameter_list
+        block = product.strides[level] * product.lengths[level]
+        index_new = min((self._index // block + 1) * block, self._length)
+
+        self._logger.debug("Advanced from %d to %d", self._index, index_new)
         self._index_last = self._index
-        i0 = self._index
-        v = self._parameter_list[self._index][:-1]
-        while (self._index < self._length) and (
-            v == self._parameter_list[self._index][:-1]
-        ):
-            self.next()
-        i1 = self._index
-        print("Advanced from {:d} to {:d}".format(i0, i1))
+        self._index = index_new
 
     def end(self):
         return self._index >= self._length
+
+
+class AdaptiveSweep(object):
+    """
+    Sweep of a single parameter that refines itself from measured data
+
+    The sweep starts with a coarse uniform grid.  Once the coarse points have
+    been measured, points are inserted at the midpoint of the interval where
+    the measured value changes the most, or where it crosses one of the given
+    thresholds.  Refinement stops when no interval is wider than 2 * min_step
+    or the point budget is used up.
+
+    The interface mirrors ParameterSweep so it can drop into existing loops.
+    Measured values are fed back with feed() or feed_logger() before calling
+    next():
+
+        sweep = AdaptiveSweep("power", -20, 10, num_coarse=7, min_step=0.25)
+        while not sweep.end():
+            source.set_power(sweep["power"])
+            datalog["gain"] = measure_gain()
+            datalog.next_record()
+            sweep.feed_logger(datalog, "gain")
+            sweep.next()
+    """
+
+    def __init__(
+        self,
+        key,
+        start,
+        stop,
+        num_coarse=11,
+        min_step=None,
+        max_points=50,
+        thresholds=None,
+        tolerance=0.0,
+        batch=1,
+    ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        key : str
+            Parameter name
+        start, stop : float
+            Range of the sweep.  Coarse points include both end points.
+        num_coarse : int, optional
+            Number of points in the initial coarse grid
+        min_step : float, optional
+            Finest spacing refinement will produce.  Defaults to 1/16 of the
+            coarse step.
+        max_points : int, optional
+            Maximum total number of points, including the coarse grid
+        thresholds : list of float, optional
+            Intervals where the measured value crosses any of these values are
+            refined before any others
+        tolerance : float, optional
+            Intervals where the measured value changes by no more than this are
+            not refined (unless they cross a threshold)
+        batch : int, optional
+            Number of points inserted per refinement pass.  Points within a
+            pass are visited in order from start to stop.
+
+        Returns
+        -------
+        None.
+
+        """
+        if num_coarse < 2:
+            raise ValueError("num_coarse must be at least 2")
+        if max_points < num_coarse:
+            raise ValueError("max_points must be at least num_coarse")
+
+        self._logger = logging.getLogger(__name__)
+
+        self.key = key
+        self.start = start
+        self.stop = stop
+        self.max_points = max_points
+        self.thresholds = [] if thresholds is None else list(thresholds)
+        self.tolerance = tolerance
+        self.batch = batch
+
+        coarse = np.linspace(start, stop, num_coarse)
+        if min_step is None:
+            min_step = abs(stop - start) / (num_coarse - 1) / 16
+        self.min_step = min_step
+
+        self._pending = [x.item() for x in coarse]
+        self._points = []  # Measured points in visiting order
+        self._values = []
+        self._current = None
+        self._last = None
+        self._value_current = None
+        self._pop()
+
+    def __getitem__(self, key):
+        if key != self.key:
+            raise KeyError(key)
+        self.check_valid()
+        return self._current
+
+    def __len__(self):
+        return len(self._points)
+
+    def __repr__(self):
+        return "AdaptiveSweep({:s}, {:d} points measured)".format(
+            self.key, len(self._points)
+        )
+
+    def get(self, key):
+        return self.__getitem__(key)
+
+    def get_last(self, key):
+        if key != self.key:
+            raise KeyError(key)
+        return self._last
+
+    def get_current_dict(self):
+        self.check_valid()
+        return {self.key: self._current}
+
+    def get_changes(self):
+        if self._last == self._current:
+            return {}
+        return self.get_current_dict()
+
+    def get_index(self):
+        return len(self._points)
+
+    def check_valid(self):
+        if self._current is None:
+            raise Exception("Sweep has ended")
+
+    def end(self):
+        return self._current is None
+
+    def feed(self, value):
+        """ Sets the measured value for the current point """
+        self.check_valid()
+        self._value_current = value
+
+    def feed_logger(self, datalog, key):
+        """ Feeds the most recently logged value of key from a DataLogger """
+        self.feed(datalog.last(key))
+
+    def next(self):
+        self.check_valid()
+        if self._value_current is None:
+            self._logger.warning(
+                "No value fed for %s = %s, point ignored for refinement",
+                self.key,
+                str(self._current),
+            )
+
+        self._points.append(self._current)
+        self._values.append(self._value_current)
+        self._last = self._current
+        self._value_current = None
+        self._pop()
+
+    def get_state(self):
+        """ Returns the measured points & pending points as a JSON
+        serializable dict """
+        return {
+            "key": self.key,
+            "points": [float(x) for x in self._points],
+            "values": [None if v is None else float(v) for v in self._values],
+            "pending": [float(x) for x in self._pending],
+            "current": None if self._current is None else float(self._current),
+        }
+
+    def set_state(self, state):
+        """ Restores the sweep saved by get_state().  The sweep must be
+        constructed with the same settings. """
+        if state["key"] != self.key:
+            raise ValueError("Sweep does not match saved state")
+        self._points = list(state["points"])
+        self._values = list(state["values"])
+        self._pending = list(state["pending"])
+        self._current = state["current"]
+        self._last = None
+        self._value_current = None
+
+    def get_points(self):
+        """ Returns measured points and values sorted by parameter value """
+        x = np.array(self._points, dtype=float)
+        y = np.array(
+            [np.nan if v is None else v for v in self._values], dtype=float
+        )
+        order = np.argsort(x, kind="stable")
+        return x[order], y[order]
+
+    def _pop(self):
+        if not self._pending and len(self._points) < self.max_points:
+            self._pending = self._refine()
+        self._current = self._pending.pop(0) if self._pending else None
+
+    def _refine(self):
+        x, y = self.get_points()
+        valid = ~np.isnan(y)
+        x, y = x[valid], y[valid]
+        if len(x) < 2:
+            return []
+
+        dx = np.diff(x)
+        dy = np.abs(np.diff(y))
+
+        # Threshold crossings first, then by largest change
+        score = dy.copy()
+        score[dy <= self.tolerance] = -1
+        for threshold in self.thresholds:
+            above = y >= threshold
+            score[above[:-1] != above[1:]] = np.inf
+
+        # Intervals that cannot be split without going below min_step
+        score[dx < 2 * self.min_step * (1 - 1e-9)] = -1
+
+        budget = min(self.batch, self.max_points - len(self._points))
+        candidates = np.argsort(-score, kind="stable")[:budget]
+        candidates = candidates[score[candidates] >= 0]
+
+        points = sorted(((x[k] + x[k + 1]) / 2).item() for k in candidates)
+        if self.start > self.stop:
+            points.reverse()
+        return points
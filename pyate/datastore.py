@@ -0,0 +1,421 @@
+"""
+Created on Oct 18, 2026
+
+Storage primitives used by DataLogger
+
+@author: kyleh
+"""
+
+from collections import deque
+
+import numpy as np
+
+
+class DataColumn(object):
+    """
+    Growable, typed column of values backed by a NumPy buffer
+
+    Numeric values (bool, int, float) are stored in a typed buffer.  Missing
+    values are stored as NaN, so integer and boolean columns are promoted to
+    float64 the first time a value is missing.  Any non-numeric value converts
+    the column to an object buffer.  Capacity grows by doubling so appends are
+    amortized O(1).
+    """
+
+    _initial_capacity = 64
+
+    def __init__(self, num_missing=0, capacity=None):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        num_missing : int, optional
+            Number of missing values to pre-fill the column with.  Used when a
+            new key shows up after records have already been logged.
+        capacity : int, optional
+            Initial capacity of the buffer
+
+        Returns
+        -------
+        None.
+
+        """
+        if capacity is None:
+            capacity = self._initial_capacity
+        capacity = max(capacity, num_missing, 1)
+
+        # dtype is unknown until the first real value shows up.  Until then
+        # the column only holds missing values which are stored as NaN.
+        self._dtype = None
+        self._buffer = np.full(capacity, np.nan, dtype=np.float64)
+        self._length = num_missing
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        for k in range(self._length):
+            yield self[k]
+
+    def __getitem__(self, s):
+        if isinstance(s, slice):
+            return self.values()[s]
+
+        if s < 0:
+            s += self._length
+        if s < 0 or s >= self._length:
+            raise IndexError("DataColumn index out of range")
+
+        value = self._buffer[s]
+        if self._dtype is None or (self._dtype == np.float64 and np.isnan(value)):
+            return self.missing_value
+        return value.item() if isinstance(value, np.generic) else value
+
+    def __repr__(self):
+        return "DataColumn({:s})".format(repr(self.values()))
+
+    @property
+    def dtype(self):
+        return self._buffer.dtype
+
+    @property
+    def missing_value(self):
+        """Value returned for missing entries"""
+        if self._buffer.dtype == object:
+            return None
+        return float("nan")
+
+    def values(self):
+        """Returns zero-copy view of the valid portion of the buffer"""
+        return self._buffer[: self._length]
+
+    def append(self, value):
+        if value is None:
+            self._append_missing()
+            return
+
+        kind = self._kind(value)
+
+        if self._dtype is None:
+            # First real value sets the type of the column
+            self._set_dtype(kind)
+        elif self._dtype != kind:
+            self._promote(kind)
+
+        self._reserve(self._length + 1)
+        self._buffer[self._length] = value
+        self._length += 1
+
+    def _append_missing(self):
+        if self._dtype in (np.int64, np.bool_):
+            # Integer & bool buffers cannot represent NaN
+            self._promote(np.float64)
+
+        self._reserve(self._length + 1)
+        self._buffer[self._length] = None if self._dtype == object else np.nan
+        self._length += 1
+
+    def _kind(self, value):
+        if isinstance(value, (bool, np.bool_)):
+            return np.bool_
+        if isinstance(value, (int, np.integer)):
+            return np.int64
+        if isinstance(value, (float, np.floating)):
+            return np.float64
+        return object
+
+    def _set_dtype(self, kind):
+        if kind in (np.int64, np.bool_) and self._length > 0:
+            # Column was created with missing values, so must hold NaN
+            kind = np.float64
+        self._convert(kind)
+
+    def _promote(self, kind):
+        """Determines the smallest dtype that can hold both the existing and
+        the new values and converts the buffer to it"""
+        current = self._dtype
+        if current == object or kind == object:
+            target = object
+        elif np.float64 in (current, kind):
+            target = np.float64
+        elif current == kind:
+            return
+        else:
+            # Mix of int and bool
+            target = np.int64
+        self._convert(target)
+
+    def _convert(self, kind):
+        if self._buffer.dtype == kind:
+            self._dtype = kind
+            return
+
+        buffer = np.empty(len(self._buffer), dtype=kind)
+        if kind == object:
+            # Preserve Python semantics (None for missing, native ints, etc)
+            buffer[:] = None
+            if self._dtype is not None:
+                # NaN marks missing values in float buffers.  Those stay None
+                has_nan = self._dtype == np.float64
+                for k in range(self._length):
+                    value = self[k]
+                    if not (has_nan and value != value):
+                        buffer[k] = value
+        else:
+            buffer[: self._length] = self._buffer[: self._length]
+        self._buffer = buffer
+        self._dtype = kind
+
+    def _reserve(self, size):
+        capacity = len(self._buffer)
+        if size <= capacity:
+            return
+
+        while capacity < size:
+            capacity *= 2
+
+        if self._buffer.dtype == object:
+            buffer = np.full(capacity, None, dtype=object)
+        elif self._buffer.dtype == np.float64:
+            buffer = np.full(capacity, np.nan, dtype=np.float64)
+        else:
+            buffer = np.zeros(capacity, dtype=self._buffer.dtype)
+        buffer[: self._length] = self._buffer[: self._length]
+        self._buffer = buffer
+
+
+class RollingStatistics(object):
+    """
+    Statistics over the last `window` values of a series, updated in O(1)
+
+    Running sums give the mean, standard deviation and least-squares slope
+    (per sample, same as DataLogger.trend()).  Monotonic deques give the min
+    and max.  The sums are recomputed from the window every `window` updates
+    to keep floating point drift from accumulating.
+
+    None and NaN values are ignored.
+    """
+
+    def __init__(self, window):
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        self.window = int(window)
+        self.reset()
+
+    def reset(self):
+        self._values = deque()
+        self._count = 0  # Total number of values seen
+        self._origin = 0  # Sample position corresponding to x = 0 in the sums
+        self._sum_y = 0.0
+        self._sum_yy = 0.0
+        self._sum_xy = 0.0
+        self._min = deque()  # (position, value), increasing values
+        self._max = deque()  # (position, value), decreasing values
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return "RollingStatistics(window={:d}, {:s})".format(
+            self.window, str(self.get())
+        )
+
+    def append(self, value):
+        if value is None:
+            return
+        value = float(value)
+        if value != value:  # NaN
+            return
+
+        position = self._count
+        self._count += 1
+
+        self._values.append(value)
+        x = position - self._origin
+        self._sum_y += value
+        self._sum_yy += value * value
+        self._sum_xy += x * value
+
+        if len(self._values) > self.window:
+            old = self._values.popleft()
+            x_old = position - self.window - self._origin
+            self._sum_y -= old
+            self._sum_yy -= old * old
+            self._sum_xy -= x_old * old
+
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append((position, value))
+        while self._min[0][0] <= position - self.window:
+            self._min.popleft()
+
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((position, value))
+        while self._max[0][0] <= position - self.window:
+            self._max.popleft()
+
+        if self._count % self.window == 0:
+            self._recompute()
+
+    def _recompute(self):
+        # Move origin to the start of the window and rebuild the sums
+        self._origin = self._count - len(self._values)
+        self._sum_y = 0.0
+        self._sum_yy = 0.0
+        self._sum_xy = 0.0
+        for x, value in enumerate(self._values):
+            self._sum_y += value
+            self._sum_yy += value * value
+            self._sum_xy += x * value
+
+    @property
+    def mean(self):
+        n = len(self._values)
+        if n == 0:
+            return float("nan")
+        return self._sum_y / n
+
+    @property
+    def std(self):
+        """Population standard deviation of the window"""
+        n = len(self._values)
+        if n == 0:
+            return float("nan")
+        var = self._sum_yy / n - (self._sum_y / n) ** 2
+        return max(var, 0.0) ** 0.5
+
+    @property
+    def min(self):
+        return self._min[0][1] if self._min else float("nan")
+
+    @property
+    def max(self):
+        return self._max[0][1] if self._max else float("nan")
+
+    @property
+    def span(self):
+        return self.max - self.min
+
+    @property
+    def slope(self):
+        """Least-squares slope of the window versus sample number"""
+        n = len(self._values)
+        if n < 2:
+            return float("nan")
+
+        # Shift x so the window starts at zero
+        x0 = self._count - n - self._origin
+        sum_xy = self._sum_xy - x0 * self._sum_y
+        sum_x = n * (n - 1) / 2
+        sum_xx = (n - 1) * n * (2 * n - 1) / 6
+        return (n * sum_xy - sum_x * self._sum_y) / (n * sum_xx - sum_x**2)
+
+    def get(self):
+        return {
+            "count": len(self._values),
+            "mean": self.mean,
+            "std": self.std,
+            "min": self.min,
+            "max": self.max,
+            "slope": self.slope,
+        }
+
+    def settled(self, slope=None, std=None, span=None):
+        """
+        Checks if the window meets all of the given settling criteria
+
+        Parameters
+        ----------
+        slope : float, optional
+            Maximum magnitude of the slope (per sample)
+        std : float, optional
+            Maximum standard deviation
+        span : float, optional
+            Maximum difference between max and min
+
+        Returns
+        -------
+        bool
+            False until the window is full
+
+        """
+        if len(self._values) < self.window:
+            return False
+        if slope is not None and not abs(self.slope) <= slope:
+            return False
+        if std is not None and not self.std <= std:
+            return False
+        if span is not None and not self.span <= span:
+            return False
+        return True
+
+
+class GroupIndex(object):
+    """
+    Start/stop offsets and summary of each record group
+
+    Offsets are positions in the DataLogger column store, so the records of any
+    group can be retrieved with a single slice.  Groups are addressed the same
+    way as DataLogger.get_group(): 0 is the current group, -1 the previous one,
+    etc.
+    """
+
+    def __init__(self, group_num=0, start=0):
+        self._numbers = [group_num]
+        self._starts = [start]
+        self._stops = [start]
+        self._time_start = [None]
+        self._time_stop = [None]
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __repr__(self):
+        return "GroupIndex({:d} groups)".format(len(self))
+
+    def _position(self, index):
+        # Relative group index (0 = current) to list position
+        position = len(self._starts) - 1 + index
+        if index > 0 or position < 0:
+            raise IndexError("Group index out of range")
+        return position
+
+    @property
+    def current_start(self):
+        return self._starts[-1]
+
+    def add_record(self, time_start=None, time_stop=None):
+        """Extends the current group by one record"""
+        self._stops[-1] += 1
+        if self._time_start[-1] is None:
+            self._time_start[-1] = time_start
+        self._time_stop[-1] = time_stop
+
+    def next_group(self, group_num):
+        stop = self._stops[-1]
+        self._numbers.append(group_num)
+        self._starts.append(stop)
+        self._stops.append(stop)
+        self._time_start.append(None)
+        self._time_stop.append(None)
+
+    def get_slice(self, index):
+        position = self._position(index)
+        return slice(self._starts[position], self._stops[position])
+
+    def get_info(self, index):
+        position = self._position(index)
+        return {
+            "group": self._numbers[position],
+            "start": self._starts[position],
+            "stop": self._stops[position],
+            "count": self._stops[position] - self._starts[position],
+            "time_start": self._time_start[position],
+            "time_stop": self._time_stop[position],
+        }
+
+    def indexes(self):
+        """Relative indexes of all groups from oldest to current"""
+        return range(1 - len(self._starts), 1)
@@ -0,0 +1,639 @@
+"""
+Created on Oct 18, 2026
+
+Log file writers used by DataLogger for autosave
+
+@author: kyleh
+"""
+
+import atexit
+from collections import OrderedDict
+import csv
+import logging
+import os
+import queue
+import threading
+import time
+import weakref
+
+import numpy as np
+import pandas as pd
+
+# Writers that still have an open file.  Flushed & closed at interpreter exit
+_open_writers = weakref.WeakSet()
+
+
+@atexit.register
+def _close_open_writers():
+    # ThreadedLogWriters go first.  Closing one drains its queue and then
+    # closes the writer it wraps, which must not be closed underneath it.
+    writers = sorted(
+        _open_writers, key=lambda writer: not isinstance(writer, ThreadedLogWriter)
+    )
+    for writer in writers:
+        try:
+            writer.close()
+        except Exception:
+            logging.getLogger(__name__).exception("Failed to close %s", str(writer))
+
+
+class _LineBuffer(object):
+    """Minimal file-like object so csv.writer can format into a list"""
+
+    def __init__(self):
+        self.lines = []
+
+    def write(self, line):
+        self.lines.append(line)
+
+
+class CsvLogWriter(object):
+    """
+    Streaming CSV writer that keeps the log file open between records
+
+    Formatted rows are held in memory and written out when one of the
+    following happens:
+        - flush_records rows are pending
+        - flush_interval seconds have passed since the last flush
+        - next_group() is called
+        - flush() or close() is called
+    close() also fsyncs the file.  Any writer left open is closed when the
+    interpreter exits.
+    """
+
+    def __init__(self, filename, flush_records=1, flush_interval=None, append=False):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        filename : str
+            Log file to write
+        flush_records : int, optional
+            Number of pending rows that triggers a flush
+        flush_interval : float, optional
+            Maximum number of seconds rows can be held before being flushed.
+            None disables the time based flush.
+        append : bool, optional
+            Append to an existing file instead of starting a new one.  The
+            header is not re-written when appending.
+
+        Returns
+        -------
+        None.
+
+        """
+        self._logger = logging.getLogger(__name__)
+
+        self.filename = filename
+        self.flush_records = max(int(flush_records), 1)
+        self.flush_interval = flush_interval
+
+        self._append = append
+        self._fid = None
+        self._keys = None
+        self._buffer = _LineBuffer()
+        self._csv = csv.writer(self._buffer, lineterminator="\n")
+        self._time_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __repr__(self):
+        return "{:s}({:s})".format(self.__class__.__name__, repr(self.filename))
+
+    @property
+    def started(self):
+        return self._keys is not None
+
+    @property
+    def pending(self):
+        """Number of rows formatted but not yet written to the file"""
+        return len(self._buffer.lines)
+
+    def open(self):
+        if self._fid is not None:
+            return
+        mode = "at" if self._append else "wt"
+        self._logger.debug("Opening %s (mode=%s)", self.filename, mode)
+        self._fid = open(self.filename, mode, newline="")
+        _open_writers.add(self)
+
+    def write_record(self, record):
+        """
+        Adds record to the output buffer
+
+        Parameters
+        ----------
+        record : OrderedDict
+            Record to write.  The keys of the first record written define the
+            header and the column order.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self._fid is None:
+            self.open()
+
+        if self._keys is None:
+            self._keys = list(record.keys())
+            if not self._append:
+                self._csv.writerow(self._keys)
+                self.flush()
+
+        self._csv.writerow(
+            ["None" if value is None else value for value in record.values()]
+        )
+
+        if self.pending >= self.flush_records:
+            self.flush()
+        elif (
+            self.flush_interval is not None
+            and time.monotonic() - self._time_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def next_group(self):
+        self.flush()
+
+    def tell(self):
+        """Flushes pending rows and returns the size of the file in bytes"""
+        self.flush()
+        if self._fid is None and not self._append:
+            # File gets replaced on first write
+            return 0
+        if not os.path.exists(self.filename):
+            return 0
+        return os.path.getsize(self.filename)
+
+    def truncate(self, size):
+        """Discards everything in the file past size bytes.  Later records are
+        appended after that point."""
+        self.close()
+        os.truncate(self.filename, size)
+        self._append = True
+
+    def flush(self):
+        self._time_flush = time.monotonic()
+        if self._fid is None or not self._buffer.lines:
+            return
+
+        self._fid.write("".join(self._buffer.lines))
+        self._buffer.lines.clear()
+        self._fid.flush()
+
+    def close(self):
+        if self._fid is None:
+            return
+
+        self.flush()
+        try:
+            os.fsync(self._fid.fileno())
+        except OSError:
+            # Some network shares do not support fsync
+            self._logger.warning("fsync failed for %s", self.filename)
+        self._fid.close()
+        self._fid = None
+        _open_writers.discard(self)
+
+        # Any later records get appended to what was already written
+        self._append = True
+
+
+def _is_number(value):
+    try:
+        float(value)
+    except (ValueError, TypeError):
+        return False
+    return True
+
+
+class HdfLogWriter(object):
+    """
+    Append-only HDF5 writer
+
+    Records are collected in memory and appended to a PyTables table in
+    chunks whenever a group completes (next_group()), flush_records rows are
+    pending or flush_interval seconds have passed.  Each append is
+    proportional to the chunk size rather than the size of the whole log.
+
+    The table is indexed by the record "index" and "group" is stored as a
+    data column, so parts of a large log can be reloaded with read_hdf_log()
+    without reading the whole file.
+
+    Column types are fixed by the first chunk written.  Columns holding only
+    bools are stored as bool, other numeric columns as float64 (None becomes
+    NaN) and everything else as fixed width strings.  Later records with a
+    value that does not fit the type or width of its column are rejected with
+    ValueError before they are buffered.
+    """
+
+    def __init__(
+        self,
+        filename,
+        key="data",
+        flush_records=1000,
+        flush_interval=None,
+        append=False,
+        min_itemsize=64,
+    ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        filename : str
+            HDF5 file to write
+        key : str, optional
+            Name of the table inside the HDF5 file
+        flush_records : int, optional
+            Number of pending rows that triggers an append
+        flush_interval : float, optional
+            Maximum number of seconds rows can be held before being appended.
+            None disables the time based flush.
+        append : bool, optional
+            Append to an existing table instead of starting a new file
+        min_itemsize : int, optional
+            Storage size reserved for string columns.  PyTables tables use
+            fixed width strings so this must hold the longest expected value.
+
+        Returns
+        -------
+        None.
+
+        """
+        self._logger = logging.getLogger(__name__)
+
+        self.filename = filename
+        self.key = key
+        self.flush_records = max(int(flush_records), 1)
+        self.flush_interval = flush_interval
+        self.min_itemsize = min_itemsize
+
+        self._append = append
+        self._store = None
+        self._keys = None
+        self._kinds = None
+        # Width in bytes of each string column of the table
+        self._itemsizes = None
+        self._rows = []
+        self._time_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __repr__(self):
+        return "{:s}({:s})".format(self.__class__.__name__, repr(self.filename))
+
+    @property
+    def started(self):
+        return self._keys is not None
+
+    @property
+    def pending(self):
+        return len(self._rows)
+
+    def open(self):
+        if self._store is not None:
+            return
+        mode = "a" if self._append else "w"
+        self._logger.debug("Opening %s (mode=%s)", self.filename, mode)
+        self._store = pd.HDFStore(self.filename, mode=mode)
+        _open_writers.add(self)
+
+        # Pick up column types of an existing table
+        if self._append and self._kinds is None and self.key in self._store:
+            storer = self._store.get_storer(self.key)
+            self._kinds = {
+                name: axis.kind if axis.kind in ("string", "bool") else "float"
+                for axis in storer.values_axes
+                for name in axis.values
+                if name != "group"
+            }
+            self._read_itemsizes()
+
+    def write_record(self, record):
+        if self._store is None:
+            self.open()
+        if self._keys is None:
+            self._keys = list(record.keys())
+
+        values = list(record.values())
+        if self._kinds is not None:
+            self._check_values(values)
+        self._rows.append(values)
+
+        if self.pending >= self.flush_records:
+            self.flush()
+        elif (
+            self.flush_interval is not None
+            and time.monotonic() - self._time_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def next_group(self):
+        self.flush()
+
+    def tell(self):
+        """Flushes pending rows and returns the number of rows in the table"""
+        self.flush()
+        if self._store is None:
+            if not self._append or not os.path.exists(self.filename):
+                # File gets replaced on first write
+                return 0
+            self.open()
+        if self.key not in self._store:
+            return 0
+        return self._store.get_storer(self.key).nrows
+
+    def truncate(self, size):
+        """Discards all rows of the table past the first size rows.  Later
+        records are appended after that point."""
+        self._append = True
+        if self.tell() > size:
+            self._store.remove(self.key, start=size)
+            self._store.flush(fsync=True)
+
+    def _read_itemsizes(self):
+        coldtypes = self._store.get_storer(self.key).table.coldtypes
+        self._itemsizes = {
+            key: coldtypes[key].itemsize
+            for key, kind in self._kinds.items()
+            if kind == "string"
+        }
+
+    def _check_values(self, values):
+        for key, value in zip(self._keys, values):
+            kind = self._kinds.get(key)
+            if kind == "bool":
+                valid = isinstance(value, (bool, np.bool_))
+            elif kind == "float":
+                valid = value is None or _is_number(value)
+            elif kind == "string":
+                valid = (
+                    value is None or len(str(value).encode()) <= self._itemsizes[key]
+                )
+            else:
+                valid = True
+            if not valid:
+                raise ValueError(
+                    "Value {:s} does not fit {:s} column {:s} of {:s}".format(
+                        repr(value), kind, key, self.filename
+                    )
+                )
+
+    def _prepare_chunk(self):
+        frame = pd.DataFrame(self._rows, columns=self._keys)
+
+        if self._kinds is None:
+            # Column types are fixed by the first chunk written
+            self._kinds = {}
+            for key in self._keys:
+                if key in ("index", "group"):
+                    continue
+                column = frame[key]
+                if all(isinstance(value, (bool, np.bool_)) for value in column):
+                    self._kinds[key] = "bool"
+                    continue
+                try:
+                    pd.to_numeric(column)
+                    self._kinds[key] = "float"
+                except (ValueError, TypeError):
+                    self._kinds[key] = "string"
+
+        for key in self._keys:
+            kind = self._kinds.get(key)
+            if key in ("index", "group"):
+                frame[key] = frame[key].astype(np.int64)
+            elif kind == "string":
+                frame[key] = [
+                    "" if value is None else str(value) for value in frame[key]
+                ]
+            elif kind == "bool":
+                frame[key] = frame[key].astype(bool)
+            else:
+                frame[key] = pd.to_numeric(frame[key]).astype(np.float64)
+
+        return frame.set_index("index")
+
+    def flush(self):
+        self._time_flush = time.monotonic()
+        if self._store is None or not self._rows:
+            return
+
+        frame = self._prepare_chunk()
+        self._store.append(
+            self.key,
+            frame,
+            format="table",
+            data_columns=["group"],
+            min_itemsize={
+                key: self.min_itemsize
+                for key, kind in self._kinds.items()
+                if kind == "string"
+            },
+        )
+        self._rows.clear()
+        self._store.flush(fsync=False)
+        if self._itemsizes is None:
+            # Strings longer than min_itemsize in the first chunk widen the column
+            self._read_itemsizes()
+
+    def close(self):
+        if self._store is None:
+            return
+
+        self.flush()
+        self._store.flush(fsync=True)
+        self._store.close()
+        self._store = None
+        _open_writers.discard(self)
+        self._append = True
+
+
+def read_hdf_log(filename, groups=None, key="data", columns=None):
+    """
+    Reads a log written by HdfLogWriter
+
+    Parameters
+    ----------
+    filename : str
+        HDF5 file to read
+    groups : int or list of int, optional
+        Groups to load.  None loads the whole log.
+    key : str, optional
+        Name of the table inside the HDF5 file
+    columns : list of str, optional
+        Columns to load.  None loads all columns.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Log data indexed by the record index
+
+    """
+    where = None
+    if groups is not None:
+        if isinstance(groups, int):
+            groups = [groups]
+        where = "group in [{:s}]".format(",".join(str(int(g)) for g in groups))
+    return pd.read_hdf(filename, key, where=where, columns=columns)
+
+
+class ThreadedLogWriter(object):
+    """
+    Runs another log writer on a dedicated thread
+
+    write_record() only copies the record onto a bounded queue.  Formatting
+    and file I/O happen on the writer thread.  When the queue is full the
+    caller blocks until there is room, which keeps memory bounded if the disk
+    cannot keep up.  flush() and close() block until the queue is drained.
+
+    Exceptions raised on the writer thread are re-raised in the caller on the
+    next call to write_record(), flush() or close().
+    """
+
+    _stop = object()
+
+    def __init__(self, writer, queue_size=1000):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        writer : CsvLogWriter
+            Writer that does the actual formatting and I/O
+        queue_size : int, optional
+            Maximum number of pending jobs before write_record() blocks
+
+        Returns
+        -------
+        None.
+
+        """
+        self._logger = logging.getLogger(__name__)
+
+        self.writer = writer
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+
+        self.records_written = 0
+        self.write_time_last = 0.0
+        self.write_time_max = 0.0
+        self.write_time_total = 0.0
+
+        self._thread = threading.Thread(
+            target=self._run, name=f"ThreadedLogWriter({writer.filename})", daemon=True
+        )
+        self._thread.start()
+        _open_writers.add(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __repr__(self):
+        return "{:s}({:s})".format(self.__class__.__name__, repr(self.writer))
+
+    @property
+    def filename(self):
+        return self.writer.filename
+
+    @property
+    def started(self):
+        return self.writer.started
+
+    @property
+    def queue_depth(self):
+        """Number of jobs waiting for the writer thread"""
+        return self._queue.qsize()
+
+    @property
+    def write_time_mean(self):
+        if self.records_written == 0:
+            return float("nan")
+        return self.write_time_total / self.records_written
+
+    def get_statistics(self):
+        return {
+            "queue_depth": self.queue_depth,
+            "records_written": self.records_written,
+            "write_time_last": self.write_time_last,
+            "write_time_mean": self.write_time_mean,
+            "write_time_max": self.write_time_max,
+        }
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is self._stop:
+                    return
+                fcn, args, kwargs = job
+                time_start = time.perf_counter()
+                fcn(*args, **kwargs)
+                if fcn == self.writer.write_record:
+                    elapsed = time.perf_counter() - time_start
+                    self.records_written += 1
+                    self.write_time_last = elapsed
+                    self.write_time_total += elapsed
+                    self.write_time_max = max(self.write_time_max, elapsed)
+            except Exception as e:
+                self._logger.exception("Error on writer thread")
+                if self._error is None:
+                    self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _check_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def submit(self, fcn, *args, **kwargs):
+        """Queues an arbitrary callable to be run on the writer thread"""
+        self._check_error()
+        if not self._thread.is_alive():
+            raise RuntimeError("Writer thread is not running")
+        self._queue.put((fcn, args, kwargs))
+
+    def write_record(self, record):
+        # Record gets reused by the caller so a copy has to be queued
+        self.submit(self.writer.write_record, OrderedDict(record))
+
+    def next_group(self):
+        self.submit(self.writer.next_group)
+
+    def tell(self):
+        self.flush()
+        return self.writer.tell()
+
+    def truncate(self, size):
+        self.flush()
+        self.writer.truncate(size)
+
+    def flush(self):
+        if self._thread.is_alive():
+            self._queue.put((self.writer.flush, (), {}))
+            self._queue.join()
+        self._check_error()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put((self.writer.close, (), {}))
+            self._queue.put(self._stop)
+            self._thread.join()
+        else:
+            self.writer.close()
+        _open_writers.discard(self)
+        self._check_error()
@@ -4,8 +4,16 @@ Instrument drivers package __init__ file
 
 from .manager import InstrumentManager
 from .instrument import Instrument
+from .asyncinstrument import AsyncInstrument
+from .executor import StepExecutor
+from .retry import RetryPolicy
+from .statistics import IOStatistics
 
+from . import asyncinstrument
 from . import error
+from . import executor
+from . import retry
+from . import statistics
 
 from . import instrument
 from . import multimeter
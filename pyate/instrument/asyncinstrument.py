@@ -0,0 +1,102 @@
+"""
+Created on Oct 18, 2026
+
+Asyncio interface to the synchronous instrument drivers.
+
+@author: kyleh
+"""
+
+import asyncio
+import functools
+
+
+class AsyncInstrument:
+    """
+    Asyncio wrapper around an Instrument driver
+
+    I/O runs in an executor thread so several instruments can be driven
+    concurrently from one event loop:
+
+        psu, sg = psu.as_async(), sg.as_async()
+        await asyncio.gather(psu.set_voltage(5.0), sg.set_frequency(2e9))
+
+    Every driver method is available as a coroutine taking the same
+    arguments.  Operations hold the instrument's bus lock, so instruments
+    sharing a bus (e.g. the same GPIB board or Prologix controller) are still
+    accessed one at a time while instruments on different buses overlap.
+
+    Parameters
+    ----------
+    instrument : Instrument
+        Driver to wrap
+    executor : concurrent.futures.Executor, optional
+        Executor the blocking I/O runs in.  Defaults to the event loop's
+        default executor.
+    """
+
+    def __init__(self, instrument, executor=None):
+        self.instrument = instrument
+        self.executor = executor
+        self.bus_id = instrument.get_bus_id()
+        self._lock = instrument.get_bus_lock()
+
+    def __repr__(self):
+        return "AsyncInstrument({:s}, bus={:s})".format(
+            self.instrument.driver_name, self.bus_id
+        )
+
+    async def run(self, fcn, *args, **kwargs):
+        """
+        Calls fcn(*args, **kwargs) in the executor while holding the bus lock
+
+        Parameters
+        ----------
+        fcn : callable
+            Blocking function to run
+
+        Returns
+        -------
+        Return value of fcn
+
+        """
+
+        def call():
+            with self._lock:
+                return fcn(*args, **kwargs)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, call)
+
+    async def write(self, command, **kwargs):
+        return await self.run(self.instrument.write, command, **kwargs)
+
+    async def read(self, **kwargs):
+        return await self.run(self.instrument.read, **kwargs)
+
+    async def query(self, command, **kwargs):
+        return await self.run(self.instrument.query, command, **kwargs)
+
+    async def query_many(self, commands, **kwargs):
+        return await self.run(self.instrument.query_many, commands, **kwargs)
+
+    async def write_binary_values(self, *args, **kwargs):
+        return await self.run(self.instrument.write_binary_values, *args, **kwargs)
+
+    async def read_binary_values(self, *args, **kwargs):
+        return await self.run(self.instrument.read_binary_values, *args, **kwargs)
+
+    async def query_binary_values(self, *args, **kwargs):
+        return await self.run(self.instrument.query_binary_values, *args, **kwargs)
+
+    def __getattr__(self, name):
+        if name == "instrument":
+            raise AttributeError(name)
+        attr = getattr(self.instrument, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        return method
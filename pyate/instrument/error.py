@@ -4,3 +4,7 @@ class InstrumentIOError(Exception):
 
 class InstrumentNothingToRead(Exception):
     pass
+
+
+class InstrumentUnhealthyError(InstrumentIOError):
+    pass
@@ -0,0 +1,192 @@
+"""
+Created on Oct 18, 2026
+
+Runs the independent instrument calls of a measurement step in parallel.
+
+@author: kyleh
+"""
+
+import collections
+import concurrent.futures
+import logging
+import time
+
+from pyate.instrument.instrument import Instrument, get_bus_lock
+
+
+class StepExecutor:
+    """
+    Runs a set of independent driver calls on a thread pool
+
+    Calls are grouped by the bus of the instrument they belong to.  Each bus
+    gets one worker that makes its calls in the order they were added, while
+    different buses run in parallel.  A step therefore takes about as long as
+    its slowest bus instead of the sum of all calls.
+
+        step = StepExecutor()
+        step.add("pout", pm.measure_power, channel=1)
+        step.add("pin", pm.measure_power, channel=2)
+        step.add("idd", psu.measure_current)
+        step.add("vdd", dmm.meas_voltage_dc)
+        while not sweep.end():
+            ...
+            step.run(datalog)
+            datalog.next_record()
+
+    Parameters
+    ----------
+    max_workers : int, optional
+        Upper limit on the number of threads.  Defaults to one per bus.
+    """
+
+    def __init__(self, max_workers=None):
+        self.logger = logging.getLogger(__name__)
+        self.max_workers = max_workers
+        self.last_duration = None
+        self._calls = collections.OrderedDict()
+        self._pool = None
+        self._pool_size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def __len__(self):
+        return len(self._calls)
+
+    def add(self, name, fcn, *args, bus=None, **kwargs):
+        """
+        Adds a call to the step
+
+        Parameters
+        ----------
+        name : str
+            Key of the result in the dict returned by run()
+        fcn : callable
+            Function to call, usually a bound driver method
+        *args, **kwargs
+            Arguments to call fcn with
+        bus : str, optional
+            Bus id the call belongs to.  Taken from the instrument fcn is bound
+            to if not given.  Calls that are not bound to an instrument get a
+            worker of their own.
+
+        Raises
+        ------
+        KeyError
+            If name was already added
+
+        Returns
+        -------
+        None.
+
+        """
+        if name in self._calls:
+            raise KeyError(f"{name} already added")
+        if bus is None:
+            instrument = getattr(fcn, "__self__", None)
+            if isinstance(instrument, Instrument):
+                bus = instrument.get_bus_id()
+            else:
+                bus = f"call-{name}"
+        self._calls[name] = (fcn, args, kwargs, bus)
+
+    def remove(self, name):
+        del self._calls[name]
+
+    def clear(self):
+        self._calls.clear()
+
+    def get_buses(self):
+        """
+        Returns the names of the calls grouped by bus
+
+        Returns
+        -------
+        dict
+            {bus id: [names in call order]}
+
+        """
+        buses = collections.OrderedDict()
+        for name, (fcn, args, kwargs, bus) in self._calls.items():
+            buses.setdefault(bus, []).append(name)
+        return buses
+
+    def _get_pool(self, workers):
+        if self.max_workers is not None:
+            workers = min(workers, self.max_workers)
+        if self._pool is None or self._pool_size < workers:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+            self._pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="StepExecutor"
+            )
+            self._pool_size = workers
+        return self._pool
+
+    def _run_bus(self, bus, names):
+        results = []
+        with get_bus_lock(bus):
+            for name in names:
+                fcn, args, kwargs, _ = self._calls[name]
+                results.append(fcn(*args, **kwargs))
+        return results
+
+    def run(self, datalog=None):
+        """
+        Runs all calls and waits for them to finish
+
+        Parameters
+        ----------
+        datalog : DataLogger, optional
+            If given, each result is also stored in the current record
+
+        Raises
+        ------
+        Exception
+            The first exception raised by a call, after all buses are done.
+            Calls after a failed one on the same bus are not made.
+
+        Returns
+        -------
+        dict
+            {name: result} in the order the calls were added
+
+        """
+        start = time.perf_counter()
+        buses = self.get_buses()
+        results = {}
+        if buses:
+            pool = self._get_pool(len(buses))
+            futures = {
+                pool.submit(self._run_bus, bus, names): names
+                for bus, names in buses.items()
+            }
+            error = None
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    results.update(zip(futures[future], future.result()))
+                except Exception as e:
+                    self.logger.error(
+                        "Step call failed on bus with %s: %r", futures[future], e
+                    )
+                    if error is None:
+                        error = e
+            if error is not None:
+                raise error
+
+        results = collections.OrderedDict((name, results[name]) for name in self._calls)
+        self.last_duration = time.perf_counter() - start
+        if datalog is not None:
+            for name, value in results.items():
+                datalog[name] = value
+        return results
+
+    def shutdown(self):
+        """Stops the worker threads"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+            self._pool_size = 0
@@ -5,57 +5,168 @@ Created on Tue Oct 10 13:51:46 2017
 @author: kyleh
 """
 
+import functools
+import inspect
 import logging
+import re
+import threading
 import time
 import pyvisa.errors
 
 from pyate import visawrapper
 from pyate.instrument import manager
+from pyate.instrument.asyncinstrument import AsyncInstrument
 from pyate.instrument.error import InstrumentIOError
+from pyate.instrument.retry import RetryPolicy
+from pyate.instrument.statistics import IOStatistics, scpi_header
+
+
+def _recover(instrument, e, name):
+    """Attempts to recover from exception e raised during Instrument.name
+
+    Returns the error class used by the retry policy.  Exceptions that
+    cannot be recovered from are re-raised."""
+    if isinstance(e, pyvisa.VisaIOError):
+        if e.error_code == pyvisa.errors.VI_ERROR_TMO:
+            instrument.logger.warning(
+                "NI Timeout occured during Instrument.%s operation", name
+            )
+            return "timeout"
+        elif e.error_code == pyvisa.errors.VI_ERROR_CONN_LOST:
+            instrument.logger.warning(
+                "Connection lost during Instrument.%s.  Reopening", name
+            )
+            instrument.invalidate_state()
+            instrument.resource.open()
+            return "connection"
+        raise e
+    elif isinstance(e, pyvisa.errors.InvalidSession):
+        instrument.logger.warning(
+            "InvalidSession error occured during Instrument.%s  Attempting to reopen",
+            name,
+        )
+        instrument.resource.open()
+        return "session"
+    elif isinstance(e, ConnectionResetError):
+        instrument.logger.warning(
+            "ConnectionResetError during Instrument.%s.  Closing & Reopening", name
+        )
+        instrument.reset()
+        return "connection"
+    elif isinstance(e, visawrapper.prologix.PrologixTimeout):
+        instrument.logger.warning(
+            "Prologix Timeout occured during Instrument.%s operation", name
+        )
+        return "timeout"
+    raise e
+
+
+# Exceptions that are failures of the instrument or the bus rather than of
+# the calling code.  Only these count against the circuit breaker.
+_IO_ERRORS = (
+    OSError,
+    InstrumentIOError,
+    pyvisa.errors.Error,
+    visawrapper.prologix.PrologixTimeout,
+)
 
 
 def pyvisaExceptionHandler(fcn):
     """This is a decorator to handle the excessive number of exceptions
-    that pyvisa raises for problems it really should hanldle on it's own"""
+    that pyvisa raises for problems it really should hanldle on it's own.
+
+    Failed operations are retried according to the instrument's
+    retry_policy.  The number of attempts is taken from the retries argument
+    of the decorated method, whether passed by keyword or position, and
+    defaults to the policy's retries."""
+    signature = inspect.signature(fcn)
+    has_retries = "retries" in signature.parameters
 
+    @functools.wraps(fcn)
     def wrapper(self, *args, **kwargs):
-        retries = kwargs.get("retries", 3)
-        for n in range(retries):
-            try:
-                return fcn(self, *args, **kwargs)
-            except pyvisa.VisaIOError as e:
-                if e.error_code == pyvisa.errors.VI_ERROR_TMO:
-                    self.logger.warning(
-                        "NI Timeout occured during Instrument.%s operation",
-                        fcn.__name__,
-                    )
-                elif e.error_code == pyvisa.errors.VI_ERROR_CONN_LOST:
-                    self.resource.open()
-                else:
-                    raise e
-            except pyvisa.errors.InvalidSession:
-                self.logger.warning(
-                    "InvalidSession error occured during Instrument.%s  Attempting to reopen",
-                    fcn.__name__,
-                )
-                self.resource.open()
-            except ConnectionResetError as e:
-                self.logger.warning(
-                    "ConnectionResetError during Instrument.%s.  Closing & Reopening",
-                    fcn.__name__,
-                )
-                self.resource.reset()
-            except visawrapper.prologix.PrologixTimeout as e:
-                self.logger.warning(
-                    "Prologix Timeout occured during Instrument.%s operation",
-                    fcn.__name__,
-                )
-        raise InstrumentIOError("Instrument.%s Max retries exceeded", fcn.__name__)
+        retries = None
+        if has_retries:
+            # None or not given uses the policy default
+            retries = signature.bind(self, *args, **kwargs).arguments.get("retries")
+
+        def recover(e):
+            error_class = _recover(self, e, fcn.__name__)
+            self.io_stats.record_retry(fcn.__name__, self._last_header)
+            return error_class
+
+        return self.retry_policy.run(
+            lambda: fcn(self, *args, **kwargs),
+            retries=retries,
+            recover=recover,
+            name="Instrument." + fcn.__name__,
+            io_errors=_IO_ERRORS,
+        )
 
     return wrapper
 
 
+_bus_locks = {}
+_bus_locks_guard = threading.Lock()
+
+
+def get_bus_lock(bus_id):
+    """Returns the lock that serializes access to the bus bus_id"""
+    with _bus_locks_guard:
+        return _bus_locks.setdefault(bus_id, threading.RLock())
+
+
+def split_responses(text, separator=";"):
+    """Splits the reply to several combined queries.  Separators inside
+    quoted strings are ignored."""
+    responses = []
+    quote = None
+    start = 0
+    for k, c in enumerate(text):
+        if quote is not None:
+            if c == quote:
+                quote = None
+        elif c in "\"'":
+            quote = c
+        elif c == separator:
+            responses.append(text[start:k].strip())
+            start = k + 1
+    responses.append(text[start:].strip())
+    return responses
+
+
+# Headers after which none of the cached instrument state can be trusted
+_STATE_RESET_HEADERS = re.compile(r"\*RST|\*RCL|SYST(EM)?:PRES(ET)?")
+
+
 class Instrument:
+    # Instruments that do not accept several queries in one program message
+    # can set this to False so query_many() sends the queries one at a time.
+    combine_queries = True
+    # Maximum number of queries combined into a single message
+    combine_queries_max = 16
+    # Minimum time between the end of the last I/O operation and the next
+    # command.  Drivers for instruments that hang when spoken to too quickly
+    # set this instead of sleeping after every write.
+    min_command_gap = 0.0
+    # How wait_complete() decides the instrument is done: "opc" queries
+    # *OPC?, "stb" polls the status byte until the stb_busy_mask bits clear
+    complete_method = "opc"
+    stb_busy_mask = 0
+    # Opt-in write-through cache of instrument settings.  When enabled, a
+    # write that sets a header to the value it already has is not sent.
+    # Settings changed from the front panel are not seen by the cache.
+    state_cache = False
+    # Headers that select what following commands apply to (e.g. INST:NSEL).
+    # Their cached values are part of the cache key of every other header.
+    state_cache_context = ()
+    # Headers that apply to the whole instrument whatever the context, so
+    # they are cached without it.  Both short and long form must be listed.
+    state_cache_global = ()
+    # Root nodes of action commands.  Repeating them does something even
+    # with the same argument (e.g. CAL:ZERO:AUTO ONCE), so they are never
+    # cached.  Matched against the short form, with any suffix number removed.
+    state_cache_exclude = ("ABOR", "CAL", "CONF", "INIT", "MEAS", "MMEM", "TRIG")
+
     @classmethod
     def register_models(cls, models):
         logging.getLogger(__name__).debug(".register_models(%s)", str(models))
@@ -71,6 +182,16 @@ class Instrument:
         self.driver_name = "Instrument"
 
         self._channel_default = None
+        # Earliest time (time.monotonic()) the next command may be sent
+        self._ready_time = 0.0
+        # Time the last command that was not a query finished
+        self._last_change = 0.0
+        self._state = {}
+        self.state_cache = kwargs.get("state_cache", self.state_cache)
+        self.retry_policy = kwargs.get("retry_policy") or RetryPolicy()
+        self.io_stats = IOStatistics()
+        # Header of the last command written, reads are attributed to it
+        self._last_header = ""
 
         if "resource" in kwargs:
             if "addr" in kwargs:
@@ -109,6 +230,48 @@ class Instrument:
     def resource(self, resource):
         self._resource = resource
 
+    def get_bus_id(self):
+        """
+        Returns an id shared by all instruments on the same bus
+
+        Instruments with different bus ids can be talked to concurrently.
+        GPIB instruments share their board, instruments behind a Prologix
+        controller or LAN gateway share its address, and anything else is
+        considered to be on a bus of its own.
+
+        Returns
+        -------
+        str
+
+        """
+        name = getattr(self.resource, "resource_name", None)
+        if not isinstance(name, str) or not name:
+            return "resource-{:d}".format(id(self.resource))
+        parts = name.split("::")
+        prefix = parts[0].upper()
+        if prefix.startswith("GPIB"):
+            return prefix
+        if prefix.startswith(("TCPIP", "PROLOGIX")):
+            return "::".join([prefix] + parts[1:2])
+        return name
+
+    def get_bus_lock(self):
+        """Returns the lock serializing access to this instrument's bus"""
+        return get_bus_lock(self.get_bus_id())
+
+    def as_async(self, executor=None):
+        """
+        Returns an AsyncInstrument wrapping this instrument
+
+        Parameters
+        ----------
+        executor : concurrent.futures.Executor, optional
+            Executor the blocking I/O runs in.  Defaults to the event loop's
+            default executor.
+
+        """
+        return AsyncInstrument(self, executor=executor)
+
     def refreshIDN(self):
         self.identity = manager.InstrumentManager.parse_ident_string(
             self.resource.query("*IDN?")
@@ -142,35 +305,321 @@ class Instrument:
             self.logger.error("VisaIOError: {:s}".format(str(e.error_code)))
         self.resource.open()
         self.resource.clear()
+        self.invalidate_state()
+
+    def hold_off(self, seconds):
+        """
+        Defers the next command until seconds from now
+
+        Unlike time.sleep() this only costs time if another command is sent
+        before the hold off has expired.
+
+        Parameters
+        ----------
+        seconds : float
+            Minimum time before the next command
+
+        Returns
+        -------
+        None.
+
+        """
+        self._ready_time = max(self._ready_time, time.monotonic() + seconds)
+
+    def settle(self, seconds):
+        """
+        Blocks until seconds after the last command that changed a setting,
+        e.g. for an output change to take effect
+
+        Time already spent since that command, such as waiting for *OPC?,
+        counts towards the settling time.  Unlike hold_off() this also holds
+        up the caller, so measurements on other instruments do not start
+        before the change has taken effect.
+
+        Parameters
+        ----------
+        seconds : float
+            Settling time
+
+        Returns
+        -------
+        None.
+
+        """
+        self._ready_time = max(self._ready_time, self._last_change + seconds)
+        self._pace()
+
+    def _pace(self):
+        """Waits until the instrument is ready for the next command"""
+        wait = self._ready_time - time.monotonic()
+        if wait > 0:
+            self.logger.log(8, "Pacing: waiting %.3f s", wait)
+            time.sleep(wait)
+            self.io_stats.record_sleep(wait)
+
+    def _io_done(self):
+        """Records the end of an I/O operation"""
+        self.hold_off(self.min_command_gap)
+
+    def poll_status(self, mask, timeout=10.0, interval=0.01):
+        """
+        Polls the status byte until all bits in mask are clear
+
+        Parameters
+        ----------
+        mask : int
+            Status byte bits that indicate the instrument is busy
+        timeout : float, optional
+            Maximum time to wait in seconds
+        interval : float, optional
+            Time between polls in seconds
+
+        Returns
+        -------
+        bool
+            False if the timeout expired before the bits cleared
+
+        """
+        deadline = time.monotonic() + timeout
+        while self.read_stb() & mask:
+            if time.monotonic() > deadline:
+                self.logger.debug("poll_status(): Timeout waiting for completion")
+                return False
+            time.sleep(interval)
+        return True
+
+    def wait_complete(self, timeout=10.0):
+        """
+        Waits for pending operations to finish using complete_method
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Maximum time to wait when polling the status byte
+
+        Returns
+        -------
+        bool
+            False if the instrument did not report completion
+
+        """
+        if self.complete_method == "stb":
+            return self.poll_status(self.stb_busy_mask, timeout=timeout)
+        elif self.complete_method == "opc":
+            return self.query("*OPC?").strip() == "1"
+        raise ValueError(f"Invalid complete_method: {self.complete_method}")
+
+    def _parse_setting(self, command):
+        """Returns (header, value) if command sets a single cacheable setting"""
+        parts = command.strip().split(None, 1)
+        if len(parts) != 2 or ";" in command or "?" in command:
+            return None
+        header = parts[0].lstrip(":").upper()
+        if header.startswith("*"):
+            return None
+        root = header.split(":", 1)[0].rstrip("0123456789")
+        if root.startswith(self.state_cache_exclude):
+            return None
+        return header, parts[1].strip()
+
+    def _state_key(self, header):
+        if header in self.state_cache_context or header in self.state_cache_global:
+            return header
+        return (tuple(self._state.get(c) for c in self.state_cache_context), header)
+
+    def _update_state(self, command, setting):
+        """Updates the state cache after command has been written"""
+        if setting is not None:
+            self._state[self._state_key(setting[0])] = setting[1]
+            return
+
+        parts = [p.strip() for p in command.split(";") if p.strip()]
+        headers = [p.split(None, 1)[0].lstrip(":").upper() for p in parts]
+        if any(_STATE_RESET_HEADERS.fullmatch(h) for h in headers):
+            self.invalidate_state()
+        elif len(parts) > 1 and not all(h.endswith("?") for h in headers):
+            # Headers of compound messages can be relative to the previous
+            # one, so there is no telling what was set
+            self.invalidate_state()
+
+    def invalidate_state(self, header=None):
+        """
+        Forgets cached instrument settings
+
+        Parameters
+        ----------
+        header : str, optional
+            Only forget this header (for every context).  All settings are
+            forgotten if None.
+
+        Returns
+        -------
+        None.
+
+        """
+        if header is None:
+            self._state.clear()
+            return
+        header = header.lstrip(":").upper()
+        for key in list(self._state):
+            if key == header or (isinstance(key, tuple) and key[1] == header):
+                del self._state[key]
 
     @pyvisaExceptionHandler
     def read_stb(self):
-        return self.resource.read_stb()
+        start = time.perf_counter()
+        result = self.resource.read_stb()
+        self.io_stats.record("read_stb", "*STB?", time.perf_counter() - start)
+        return result
 
     @pyvisaExceptionHandler
-    def write(self, command, delay=0.0, retries=3):
+    def write(self, command, delay=0.0, retries=None):
+        """
+        Writes command to the instrument
+
+        Parameters
+        ----------
+        command : str
+            Command to send
+        delay : float, optional
+            Time to wait after the command.  Blocks like time.sleep() so the
+            instrument, and whatever it drives, has settled before the caller
+            continues.  Use hold_off() instead when only the next command to
+            this instrument has to wait.
+        retries : int, optional
+            Number of attempts.  Defaults to retry_policy.retries.
+
+        Returns
+        -------
+        Result of the resource write, or None if the state cache shows the
+        command would not change anything
+
+        """
+        setting = None
+        if self.state_cache:
+            setting = self._parse_setting(command)
+            if setting is not None:
+                key = self._state_key(setting[0])
+                if self._state.get(key) == setting[1]:
+                    self.logger.log(8, "Unchanged, not sent: %s", command)
+                    return None
+                # Unknown until the write succeeds
+                self._state.pop(key, None)
+
         self.logger.log(8, command)
+        self._pace()
+        self._last_header = scpi_header(command)
+        start = time.perf_counter()
         result = self.resource.write(command)
-        time.sleep(delay)
+        self.io_stats.record(
+            "write", self._last_header, time.perf_counter() - start, len(command)
+        )
+        self._io_done()
+        if "?" not in command:
+            self._last_change = time.monotonic()
+        if delay:
+            self.settle(delay)
+        if self.state_cache:
+            self._update_state(command, setting)
         return result
 
     @pyvisaExceptionHandler
-    def read(self, retries=3):
-        return self.resource.read()
+    def read(self, retries=None):
+        start = time.perf_counter()
+        result = self.resource.read()
+        self.io_stats.record(
+            "read", self._last_header, time.perf_counter() - start, len(result)
+        )
+        self._io_done()
+        return result
 
-    def query(self, command, delay=0, retries=3):
+    def query(self, command, delay=0, retries=None):
         self.write(command, retries=retries)
-        time.sleep(delay)
+        if delay:
+            # The read has to wait out the delay
+            self.hold_off(delay)
+            self._pace()
         return self.read(retries=retries)
 
+    def query_many(self, commands, delay=0, retries=None):
+        """
+        Sends several queries and returns all of the responses
+
+        The queries are combined into as few program messages as possible
+        ("Q1?;:Q2?;:Q3?"), so the whole batch costs one round trip instead of
+        one per query.  Each query is sent from the root of the command tree.
+        If the instrument does not return one response per query, combining is
+        disabled for this instrument, the input buffer is cleared and the queries
+        are sent individually.  I/O errors are raised and do not disable
+        combining.
+
+        Parameters
+        ----------
+        commands : list of str
+            Queries to send
+        delay : float, optional
+            Delay between each write and the following read
+        retries : int, optional
+
+        Returns
+        -------
+        list of str
+            Responses in the same order as commands
+
+        """
+        commands = list(commands)
+        if not self.combine_queries or len(commands) < 2:
+            return [self.query(c, delay=delay, retries=retries) for c in commands]
+
+        results = []
+        for start in range(0, len(commands), self.combine_queries_max):
+            chunk = commands[start : start + self.combine_queries_max]
+            results.extend(self._query_combined(chunk, delay, retries))
+        return results
+
+    def _query_combined(self, commands, delay, retries):
+        message = ";".join(
+            c if c.startswith((":", "*")) else ":" + c for c in commands
+        )
+        responses = split_responses(self.query(message, delay=delay, retries=retries))
+        if len(responses) != len(commands):
+            self.logger.warning(
+                "Combined query not supported.  Sending queries individually"
+            )
+            self.combine_queries = False
+            # Drop any late part of the combined reply before starting over
+            self.resource.clear()
+            return [self.query(c, delay=delay, retries=retries) for c in commands]
+        return responses
+
+    def _binary_transfer(self, operation, method, args, kwargs):
+        if operation != "read_binary_values":
+            self._pace()
+            message = args[0] if args else kwargs.get("message", "")
+            self._last_header = scpi_header(message)
+        start = time.perf_counter()
+        result = method(*args, **kwargs)
+        # Byte counts are not known for binary transfers
+        self.io_stats.record(operation, self._last_header, time.perf_counter() - start)
+        self._io_done()
+        if operation == "write_binary_values":
+            self._last_change = time.monotonic()
+        return result
+
     def write_binary_values(self, *args, **kwargs):
-        return self.resource.write_binary_values(*args, **kwargs)
+        return self._binary_transfer(
+            "write_binary_values", self.resource.write_binary_values, args, kwargs
+        )
 
     def read_binary_values(self, *args, **kwargs):
-        return self.resource.read_binary_values(*args, **kwargs)
+        return self._binary_transfer(
+            "read_binary_values", self.resource.read_binary_values, args, kwargs
+        )
 
     def query_binary_values(self, *args, **kwargs):
-        return self.resource.query_binary_values(*args, **kwargs)
+        return self._binary_transfer(
+            "query_binary_values", self.resource.query_binary_values, args, kwargs
+        )
 
     def test_connection(self, attempt_reset=False, tries_left=1):
         try:
@@ -259,7 +708,7 @@ class Instrument:
         self._channel_default = channel
 
     def get_basic_parameter(
-        self, scpi_command: str, channel: int = None, dtype=float, retries=3
+        self, scpi_command: str, channel: int = None, dtype=float, retries=None
     ):
         """
         Reads back value from basic SCPI command
@@ -133,12 +133,15 @@ class Oscilloscope(Instrument):
             self.write(":CURSor:TRACk:BX {:d}".format(xpixel))
 
     def get_cursor_values(self):
-        d = {}
-        d["ax"] = float(self.query(":CURSor:TRACk:AXValue?"))
-        d["bx"] = float(self.query(":CURSor:TRACk:BXValue?"))
-        d["ay"] = float(self.query(":CURSor:TRACk:AYValue?"))
-        d["by"] = float(self.query(":CURSor:TRACk:BYValue?"))
-        return d
+        values = self.query_many(
+            [
+                ":CURSor:TRACk:AXValue?",
+                ":CURSor:TRACk:BXValue?",
+                ":CURSor:TRACk:AYValue?",
+                ":CURSor:TRACk:BYValue?",
+            ]
+        )
+        return dict(zip(["ax", "bx", "ay", "by"], [float(v) for v in values]))
 
     def set_trigger(self, mode=None, source=None, slope=None, level=None, sweep=None):
 
@@ -170,13 +173,13 @@ class Oscilloscope(Instrument):
 
     def get_trigger(self):
         d = {}
-        d["mode"] = self.query(":TRIG:MODE?")
-        d["status"] = self.query(":TRIG:STAT?")
+        d["mode"], d["status"] = self.query_many([":TRIG:MODE?", ":TRIG:STAT?"])
 
         if d["mode"] == "EDGE":
-            d["level"] = float(self.query(":TRIG:EDGe:LEVel?"))
-            d["source"] = self.query(":TRIG:EDGe:SOUR?")
-            d["slope"] = self.query(":TRIG:EDGe:SLOP?")
+            level, d["source"], d["slope"] = self.query_many(
+                [":TRIG:EDGe:LEVel?", ":TRIG:EDGe:SOUR?", ":TRIG:EDGe:SLOP?"]
+            )
+            d["level"] = float(level)
 
         return d
 
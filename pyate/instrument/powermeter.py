@@ -151,14 +151,30 @@ class PowerMeterKeysight(PowerMeter):
 
     def get_settings(self, channel: int = None):
         channel = self.get_default_channel(default=channel)
+
+        # All settings are read back in a single batch
+        commands = {
+            "continuous": f"INIT{channel}:CONT?",
+            "trigger_source": f"TRIG{channel}:SOUR?",
+            "readings_per_second": f"SENS{channel}:SPE?",
+            "avgen": f"SENS{channel}:AVER?",
+            "avgauto": f"SENS{channel}:AVER:COUN:AUTO?",
+            "avgcnt": f"SENS{channel}:AVER:COUN?",
+            "offseten": f"SENS{channel}:CORR:GAIN2:STAT?",
+            "offset": f"SENS{channel}:CORR:GAIN2?",
+            "dutyen": f"SENS{channel}:CORR:DCYC:STAT?",
+            "dutycycle": f"SENS{channel}:CORR:DCYC?",
+        }
+        raw = dict(zip(commands.keys(), self.query_many(commands.values())))
+
         result = {}
-        result["continuous"] = bool(int(self.query(f"INIT{channel}:CONT?")))
-        result["trigger_source"] = self.query(f"TRIG{channel}:SOUR?")
-        result["readings_per_second"] = int(self.query(f"SENS{channel}:SPE?"))
+        result["continuous"] = bool(int(raw["continuous"]))
+        result["trigger_source"] = raw["trigger_source"]
+        result["readings_per_second"] = int(raw["readings_per_second"])
 
-        avgen = bool(int(self.query(f"SENS{channel}:AVER?")))
-        avgauto = bool(int(self.query(f"SENS{channel}:AVER:COUN:AUTO?")))
-        avgcnt = int(self.query(f"SENS{channel}:AVER:COUN?"))
+        avgen = bool(int(raw["avgen"]))
+        avgauto = bool(int(raw["avgauto"]))
+        avgcnt = int(raw["avgcnt"])
         if not avgen:
             result["averaging"] = False
         elif avgauto:
@@ -168,17 +184,17 @@ class PowerMeterKeysight(PowerMeter):
 
         # result['resolution'] = self.query(f'TRIG{channel}:SOUR')
 
-        offseten = bool(int(self.query(f"SENS{channel}:CORR:GAIN2:STAT?")))
+        offseten = bool(int(raw["offseten"]))
         if not offseten:
             result["offset"] = False
         else:
-            result["offset"] = float(self.query(f"SENS{channel}:CORR:GAIN2?"))
+            result["offset"] = float(raw["offset"])
 
-        dutyen = bool(int(self.query(f"SENS{channel}:CORR:DCYC:STAT?")))
+        dutyen = bool(int(raw["dutyen"]))
         if not dutyen:
             result["dutycycle"] = False
         else:
-            result["dutycycle"] = float(self.query(f"SENS{channel}:CORR:DCYC?"))
+            result["dutycycle"] = float(raw["dutycycle"])
         return result
 
     def measure_power(self, resolution=None, channel: int = None):
@@ -226,6 +242,9 @@ class PowerMeterRohdeNRP(PowerMeter):
         )
         self.set_default_channel(1)  # Single channel device
 
+    complete_method = "stb"
+    stb_busy_mask = 1 << 7
+
     mapping_trigger_source = (
         ("1", "hold", "HOLD"),
         ("2", "immediate", "IMM"),
@@ -271,13 +290,7 @@ class PowerMeterRohdeNRP(PowerMeter):
         return bool(self.read_stb() & (1 << 7))
 
     def wait_for_completion(self):
-        for k in range(20):
-            if not self.check_busy():
-                if k > 0:
-                    self.logger.debug("wait_for_completion(): Waited %d iterations", k)
-                return
-            time.sleep(0.05)
-        self.logger.debug("wait_for_completion(): Timeout waiting for completion")
+        self.wait_complete(timeout=1.0)
 
     def calibration_zero_sensor(self):
         self.write("CAL:ZERO:AUTO ONCE")
@@ -372,40 +385,63 @@ class PowerMeterRohdeNRP(PowerMeter):
 
     def get_settings(self, channel: int = None):
         channel = self.get_default_channel(default=channel)
+
+        # All settings are read back in a single batch
+        commands = {
+            "function": "SENSe:FUNCtion?",
+            "continuous": "INIT:CONT?",
+            "trigger_source": "TRIG:SOUR?",
+            "trigger_level": "TRIG:LEV?",
+            "sample_rate": "SENSe:SAMPling?",
+            "frequency": "SENS:FREQ?",
+            "range_sensitivity": "SENSe:RANGe?",
+            "range_auto": "SENSe:RANGe:AUTO?",
+            "avgen": "SENS:AVER:STAT?",
+            "avgauto": "SENS:AVER:COUN:AUTO?",
+            "avgcnt": "SENS:AVER:COUN?",
+            "avgtcon": "SENS:AVER:TCON?",
+            "average_auto_type": "SENSe:AVERage:COUNt:AUTO:TYPE?",
+            "average_mtime": "SENSe:AVERage:COUNt:AUTO:MTIM?",
+            "average_nsratio": "SENSe:AVERage:COUNt:AUTO:NSRatio?",
+            "average_resolution": "SENSe:AVERage:COUNt:AUTO:RESolution?",
+            "average_aperture_time": ":SENS:POW:AVG:APER?",
+            "averaging_smooth": "SENSe:POWer:AVG:SMOothing:STATe?",
+            "buffer": ":SENS:POW:AVG:BUFF:STAT?",
+            "offset": "SENS:CORR:OFFS?",
+            "dutyen": "SENS:CORR:DCYC:STAT?",
+            "dutycycle": "SENS:CORR:DCYC?",
+            "min_power": "SYSTem:MINPower?",
+        }
+        raw = dict(zip(commands.keys(), self.query_many(commands.values())))
+
         result = {}
         result["function"] = self.map_value(
-            self.query("SENSe:FUNCtion?"), "from", self.mapping_function
+            raw["function"], "from", self.mapping_function
         )
         result["continuous"] = self.map_value(
-            self.query("INIT:CONT?"), "from", self.mapping_on_off
+            raw["continuous"], "from", self.mapping_on_off
         )
         result["trigger_source"] = self.map_value(
-            self.query("TRIG:SOUR?"), "from", self.mapping_trigger_source
+            raw["trigger_source"], "from", self.mapping_trigger_source
         )
-        result["trigger_level"] = self.w_to_dbm(float(self.query("TRIG:LEV?")))
+        result["trigger_level"] = self.w_to_dbm(float(raw["trigger_level"]))
         result["sample_rate"] = self.map_value(
-            self.query("SENSe:SAMPling?"), "from", self.mapping_sampling
+            raw["sample_rate"], "from", self.mapping_sampling
         )
 
-        result["frequency"] = float(self.query("SENS:FREQ?"))
+        result["frequency"] = float(raw["frequency"])
 
         result["range_sensitivity"] = self.map_value(
-            self.query("SENSe:RANGe?"), "from", self.mapping_sensitivity
+            raw["range_sensitivity"], "from", self.mapping_sensitivity
         )
         result["range_auto"] = self.map_value(
-            self.query("SENSe:RANGe:AUTO?"), "from", self.mapping_on_off
+            raw["range_auto"], "from", self.mapping_on_off
         )
 
-        avgen = self.map_value(
-            self.query("SENS:AVER:STAT?"), "from", self.mapping_on_off
-        )
-        avgauto = self.map_value(
-            self.query("SENS:AVER:COUN:AUTO?"), "from", self.mapping_on_off
-        )
-        avgcnt = int(self.query("SENS:AVER:COUN?"))
-        avgtcon = self.map_value(
-            self.query("SENS:AVER:TCON?"), "from", self.mapping_avg_tcon
-        )
+        avgen = self.map_value(raw["avgen"], "from", self.mapping_on_off)
+        avgauto = self.map_value(raw["avgauto"], "from", self.mapping_on_off)
+        avgcnt = int(raw["avgcnt"])
+        avgtcon = self.map_value(raw["avgtcon"], "from", self.mapping_avg_tcon)
         # SENSe:AVERage:COUNt:AUTO ONCE
 
         if not avgen:
@@ -417,40 +453,32 @@ class PowerMeterRohdeNRP(PowerMeter):
 
         result["average_count"] = avgcnt
         result["average_auto_type"] = self.map_value(
-            self.query("SENSe:AVERage:COUNt:AUTO:TYPE?"), "from", self.mapping_auto_type
-        )
-        result["average_mtime"] = float(self.query("SENSe:AVERage:COUNt:AUTO:MTIM?"))
-        result["average_nsratio"] = float(
-            self.query("SENSe:AVERage:COUNt:AUTO:NSRatio?")
+            raw["average_auto_type"], "from", self.mapping_auto_type
         )
-        result["average_resolution"] = int(
-            self.query("SENSe:AVERage:COUNt:AUTO:RESolution?")
-        )
-        result["average_aperture_time"] = float(self.query(":SENS:POW:AVG:APER?"))
+        result["average_mtime"] = float(raw["average_mtime"])
+        result["average_nsratio"] = float(raw["average_nsratio"])
+        result["average_resolution"] = int(raw["average_resolution"])
+        result["average_aperture_time"] = float(raw["average_aperture_time"])
         result["averaging_smooth"] = self.map_value(
-            self.query("SENSe:POWer:AVG:SMOothing:STATe?"), "from", self.mapping_on_off
+            raw["averaging_smooth"], "from", self.mapping_on_off
         )
         result["averaging_tcon"] = avgtcon
 
-        result["buffer"] = self.map_value(
-            self.query(":SENS:POW:AVG:BUFF:STAT?"), "from", self.mapping_on_off
-        )
+        result["buffer"] = self.map_value(raw["buffer"], "from", self.mapping_on_off)
 
-        offseten = self.map_value(
-            self.query("SENS:CORR:OFFS?"), "from", self.mapping_on_off
-        )
+        offseten = self.map_value(raw["offset"], "from", self.mapping_on_off)
         if not offseten:
             result["offset"] = False
         else:
-            result["offset"] = float(self.query("SENS:CORR:OFFS?"))
+            result["offset"] = float(raw["offset"])
 
-        dutyen = bool(int(self.query("SENS:CORR:DCYC:STAT?")))
+        dutyen = bool(int(raw["dutyen"]))
         if not dutyen:
             result["dutycycle"] = False
         else:
-            result["dutycycle"] = float(self.query("SENS:CORR:DCYC?"))
+            result["dutycycle"] = float(raw["dutycycle"])
 
-        result["min_power"] = self.w_to_dbm(float(self.query("SYSTem:MINPower?")))
+        result["min_power"] = self.w_to_dbm(float(raw["min_power"]))
         return result
 
     def set_settings(self, channel: int = None, function=None, continuous=None):
@@ -124,6 +124,11 @@ class PowerSupplyKeysight(PowerSupply):
     Instrument driver for Keysight E3646A & similar supplies
     """
 
+    # Settings are per output, selected with INST:NSEL
+    state_cache_context = ("INST:NSEL",)
+    # Except for the output state, which switches all outputs
+    state_cache_global = ("OUTP", "OUTPUT", "OUTP:STAT", "OUTPUT:STATE")
+
     def __init__(self, *args, channel=None, **kwargs):
         """
         Constructor for Rigol DP832 Power Supply
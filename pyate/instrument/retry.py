@@ -0,0 +1,252 @@
+"""
+Created on Oct 18, 2026
+
+Retry policy for instrument I/O: exponential backoff with jitter,
+per-error-class retry budgets and a circuit breaker.
+
+@author: kyleh
+"""
+
+import collections
+import logging
+import random
+import threading
+import time
+
+from pyate.instrument.error import InstrumentIOError, InstrumentUnhealthyError
+
+
+class RetryPolicy:
+    """
+    Decides when and how often a failed instrument operation is retried
+
+    An operation is attempted up to `retries` times.  Between attempts the
+    policy sleeps for an exponentially growing, jittered backoff so a flaky
+    instrument does not turn into a tight reconnect loop that starves other
+    instruments on the same bus.
+
+    After `failure_threshold` consecutive operations have failed the circuit
+    breaker opens and the instrument is marked unhealthy.  Operations are then
+    rejected with InstrumentUnhealthyError without touching the bus until
+    `recovery_time` has passed, after which a single trial operation is let
+    through.  A success closes the breaker again.
+
+    Parameters
+    ----------
+    retries : int, optional
+        Default number of attempts per operation
+    backoff : float, optional
+        Delay before the first retry in seconds
+    backoff_max : float, optional
+        Upper limit of the delay between attempts
+    multiplier : float, optional
+        Growth factor of the delay for each further retry
+    jitter : float, optional
+        Fraction of the delay that is randomized (0 to 1)
+    budgets : dict, optional
+        Maximum number of attempts that may fail with a given error class
+        (e.g. {"connection": 1}).  Classes that are not listed are only
+        limited by retries.
+    failure_threshold : int, optional
+        Consecutive failed operations that mark the instrument unhealthy.
+        None disables the circuit breaker.
+    recovery_time : float, optional
+        Time in seconds before an unhealthy instrument is tried again
+    """
+
+    def __init__(
+        self,
+        retries=3,
+        backoff=0.05,
+        backoff_max=2.0,
+        multiplier=2.0,
+        jitter=0.5,
+        budgets=None,
+        failure_threshold=5,
+        recovery_time=30.0,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.budgets = {} if budgets is None else dict(budgets)
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened = None
+        self.reset_counters()
+
+    @property
+    def healthy(self):
+        """False while the circuit breaker is open"""
+        return self._opened is None
+
+    def reset(self):
+        """Closes the circuit breaker, marking the instrument healthy again"""
+        with self._lock:
+            self._consecutive_failures = 0
+            self._opened = None
+
+    def reset_counters(self):
+        with self._lock:
+            self._counters = {
+                "operations": 0,
+                "successes": 0,
+                "failures": 0,
+                "retries": 0,
+                "rejected": 0,
+                "trips": 0,
+                "backoff_time": 0.0,
+            }
+            self._errors = collections.Counter()
+
+    def get_counters(self):
+        """
+        Returns a snapshot of the counters for monitoring
+
+        Returns
+        -------
+        dict
+            operations, successes, failures, retries, rejected (calls refused
+            while unhealthy), trips (times the breaker opened), backoff_time
+            (seconds slept between attempts), errors (count by error class)
+            and healthy
+
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            counters["errors"] = dict(self._errors)
+            counters["healthy"] = self.healthy
+        return counters
+
+    def get_delay(self, attempt):
+        """
+        Returns the backoff before retry number attempt (starting at 0)
+        """
+        delay = min(self.backoff_max, self.backoff * self.multiplier**attempt)
+        return delay * (1.0 - self.jitter * random.random())
+
+    def run(
+        self,
+        operation,
+        retries=None,
+        recover=None,
+        name="operation",
+        io_errors=(OSError, InstrumentIOError),
+    ):
+        """
+        Runs operation under this policy
+
+        Parameters
+        ----------
+        operation : callable
+            Called without arguments.  Its return value is returned.
+        retries : int, optional
+            Number of attempts.  Uses the policy default if None.
+        recover : callable, optional
+            Called with the exception after each failed attempt.  Returns the
+            error class name used for budgets and counters, after doing any
+            recovery (such as reopening the session).  Exceptions that should
+            not be retried are raised from it.  Without recover nothing is
+            retried.
+        name : str, optional
+            Name used in log and error messages
+        io_errors : tuple of type, optional
+            Exception types that count as I/O failures.  Other exceptions
+            (bad arguments, driver bugs) are raised without counting against
+            the circuit breaker.
+
+        Raises
+        ------
+        InstrumentUnhealthyError
+            If the circuit breaker is open
+        InstrumentIOError
+            If all attempts failed
+
+        """
+        retries = self.retries if retries is None else retries
+        self._check_breaker(name)
+
+        failures = collections.Counter()
+        error = None
+        for attempt in range(retries):
+            if attempt > 0:
+                delay = self.get_delay(attempt - 1)
+                with self._lock:
+                    self._counters["retries"] += 1
+                    self._counters["backoff_time"] += delay
+                time.sleep(delay)
+
+            try:
+                result = operation()
+            except Exception as e:
+                error = e
+                try:
+                    if recover is None:
+                        raise
+                    error_class = recover(e)
+                except Exception as failure:
+                    if isinstance(e, io_errors) or isinstance(failure, io_errors):
+                        self._record(False)
+                    raise
+                with self._lock:
+                    self._errors[error_class] += 1
+                failures[error_class] += 1
+                if failures[error_class] >= self.budgets.get(error_class, retries):
+                    break
+            else:
+                self._record(True)
+                return result
+
+        self._record(False)
+        raise InstrumentIOError(
+            "{:s}: Max retries exceeded ({:s})".format(name, repr(error))
+        ) from error
+
+    def _check_breaker(self, name):
+        with self._lock:
+            self._counters["operations"] += 1
+            if self._opened is None:
+                return
+            if time.monotonic() - self._opened >= self.recovery_time:
+                # Half open: let this operation through as a trial
+                self._opened = time.monotonic()
+                return
+            self._counters["rejected"] += 1
+        raise InstrumentUnhealthyError(
+            "{:s}: Instrument marked unhealthy after {:d} failures".format(
+                name, self._consecutive_failures
+            )
+        )
+
+    def _record(self, success):
+        with self._lock:
+            if success:
+                self._counters["successes"] += 1
+                self._consecutive_failures = 0
+                if self._opened is not None:
+                    self.logger.info("Instrument recovered")
+                self._opened = None
+                return
+
+            self._counters["failures"] += 1
+            self._consecutive_failures += 1
+            threshold = self.failure_threshold
+            if (
+                threshold is not None
+                and self._consecutive_failures >= threshold
+                and self._opened is None
+            ):
+                self._opened = time.monotonic()
+                self._counters["trips"] += 1
+                self.logger.warning(
+                    "%d consecutive failures.  Marking instrument unhealthy",
+                    self._consecutive_failures,
+                )
+            elif self._opened is not None:
+                # Failed trial, stay open for another recovery_time
+                self._opened = time.monotonic()
@@ -0,0 +1,240 @@
+"""
+Created on Oct 18, 2026
+
+I/O statistics for instrument drivers: call counts, latency histograms,
+bytes transferred, retries and time spent pacing, per SCPI header.
+
+@author: kyleh
+"""
+
+import bisect
+import threading
+
+import pandas as pd
+
+# Upper edges of the latency histogram bins in seconds.  The last bin
+# collects everything slower than LATENCY_BINS[-1].
+LATENCY_BINS = (
+    1e-4, 2e-4, 5e-4,
+    1e-3, 2e-3, 5e-3,
+    1e-2, 2e-2, 5e-2,
+    1e-1, 2e-1, 5e-1,
+    1.0, 2.0, 5.0, 10.0,
+)  # fmt: skip
+
+
+def scpi_header(command):
+    """
+    Returns the normalized SCPI header of command
+
+    Combined messages are reported under the first header followed by ";...".
+    """
+    first, _, rest = command.partition(";")
+    parts = first.split(None, 1)
+    header = parts[0].lstrip(":").upper() if parts else ""
+    return header + ";..." if rest.strip() else header
+
+
+class _Entry:
+    __slots__ = ("count", "total", "min", "max", "bytes", "retries", "histogram")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self.bytes = 0
+        self.retries = 0
+        self.histogram = [0] * (len(LATENCY_BINS) + 1)
+
+
+class IOStatistics:
+    """
+    Collects I/O statistics for one instrument
+
+    Every write, read and binary transfer is recorded under its operation and
+    SCPI header.  Reads are attributed to the header of the preceding write,
+    so a query shows up as a write and a read of the same header.
+
+    Parameters
+    ----------
+    enabled : bool, optional
+        Whether operations are recorded
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._entries = {}
+            self.sleep_time = 0.0
+
+    def record(self, operation, header, latency, nbytes=0):
+        """
+        Records one completed operation
+
+        Parameters
+        ----------
+        operation : str
+            Type of operation ("write", "read", ...)
+        header : str
+            SCPI header the operation belongs to
+        latency : float
+            Duration of the operation in seconds
+        nbytes : int, optional
+            Number of bytes transferred
+
+        Returns
+        -------
+        None.
+
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self._entry(operation, header)
+            entry.count += 1
+            entry.total += latency
+            entry.min = min(entry.min, latency)
+            entry.max = max(entry.max, latency)
+            entry.bytes += nbytes
+            entry.histogram[bisect.bisect_left(LATENCY_BINS, latency)] += 1
+
+    def record_retry(self, operation, header):
+        """Records a failed attempt that was recovered from"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entry(operation, header).retries += 1
+
+    def record_sleep(self, seconds):
+        """Records time spent waiting for the instrument to be ready"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.sleep_time += seconds
+
+    def _entry(self, operation, header):
+        key = (operation, header)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _Entry()
+        return entry
+
+    def get_histogram(self, operation, header):
+        """
+        Returns the latency histogram of one operation and header
+
+        Returns
+        -------
+        list of tuple
+            (upper bin edge, count) pairs.  The last edge is inf.
+
+        """
+        with self._lock:
+            histogram = list(self._entries[(operation, header)].histogram)
+        return list(zip(LATENCY_BINS + (float("inf"),), histogram))
+
+    def to_dataframe(self):
+        """
+        Returns the statistics as a DataFrame
+
+        Returns
+        -------
+        pandas.DataFrame
+            One row per operation and header with the columns count,
+            total_time, mean_time, min_time, max_time, bytes and retries.
+            Sorted by total_time, largest first.
+
+        """
+        rows = []
+        with self._lock:
+            for (operation, header), entry in self._entries.items():
+                rows.append(
+                    {
+                        "operation": operation,
+                        "header": header,
+                        "count": entry.count,
+                        "total_time": entry.total,
+                        "mean_time": entry.total / entry.count if entry.count else 0.0,
+                        "min_time": entry.min if entry.count else 0.0,
+                        "max_time": entry.max,
+                        "bytes": entry.bytes,
+                        "retries": entry.retries,
+                    }
+                )
+        columns = [
+            "operation",
+            "header",
+            "count",
+            "total_time",
+            "mean_time",
+            "min_time",
+            "max_time",
+            "bytes",
+            "retries",
+        ]
+        frame = pd.DataFrame(rows, columns=columns)
+        return frame.sort_values("total_time", ascending=False, ignore_index=True)
+
+    def report(self, limit=None):
+        """
+        Returns a text summary of where the I/O time went
+
+        Parameters
+        ----------
+        limit : int, optional
+            Only include the slowest limit rows
+
+        Returns
+        -------
+        str
+
+        """
+        frame = self.to_dataframe()
+        lines = [
+            "Total I/O time: {:.3f} s  Waiting: {:.3f} s".format(
+                frame["total_time"].sum(), self.sleep_time
+            )
+        ]
+        if limit is not None:
+            frame = frame.head(limit)
+        if len(frame):
+            lines.append(frame.to_string(index=False))
+        return "\n".join(lines)
+
+
+def summarize(instruments):
+    """
+    Combines the statistics of several instruments
+
+    Parameters
+    ----------
+    instruments : dict or list
+        Instruments by name, or a list of instruments named by driver_name
+
+    Returns
+    -------
+    pandas.DataFrame
+        Rows of IOStatistics.to_dataframe() with an added instrument column,
+        sorted by total_time.  Export with DataFrame.to_csv() etc.
+
+    """
+    if not isinstance(instruments, dict):
+        named = {}
+        for k, inst in enumerate(instruments):
+            name = inst.driver_name
+            named[name if name not in named else f"{name}_{k}"] = inst
+        instruments = named
+    frames = []
+    for name, inst in instruments.items():
+        frame = inst.io_stats.to_dataframe()
+        frame.insert(0, "instrument", name)
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame()
+    frame = pd.concat(frames, ignore_index=True)
+    return frame.sort_values("total_time", ascending=False, ignore_index=True)
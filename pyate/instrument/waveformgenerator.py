@@ -5,7 +5,6 @@ Created on Jul 12, 2017
 """
 
 from pyate.instrument import Instrument
-import time
 
 
 class WaveformGenerator(Instrument):
@@ -20,8 +19,8 @@ class WaveformGenerator(Instrument):
 
     def set_output_state(self, channel, state):
         self.write(":OUTP{:d} {:s}".format(channel, "ON" if state else "OFF"))
-        self.query("*OPC?")
-        time.sleep(0.1)
+        self.wait_complete()
+        self.settle(0.1)
 
 
 @Instrument.register_models(["DG1032Z"])
@@ -30,7 +29,7 @@ class WaveformGeneratorRigol(WaveformGenerator):
         super().__init__(*args, **kwargs)
         self.driver_name = "WaveformGeneratorRigol"
         self._scpi_prefix = ":APPL{:d}"
-        self.delay = 0.1
+        self.delay = 0.1  # Settling time after waveform changes
 
         self._map_slope = {"pos": "POS", "neg": "NEG"}
 
@@ -51,7 +50,7 @@ class WaveformGeneratorRigol(WaveformGenerator):
         data = data + 2 ** 13
 
         self.write(":SOUR{:d}:APPL:ARB {:g}, {:g}, {:g}".format(channel, samplerate, amplitude, offset))
-        self.query("*OPC?")
+        self.wait_complete()
         # There does not seem to be the capability of setting binary
         # data format or byte order.
         # Looks like the default is:
@@ -61,8 +60,8 @@ class WaveformGeneratorRigol(WaveformGenerator):
         self.write_binary_values(
             ":SOUR{:d}:DATA:DAC VOLATILE,".format(channel), data, datatype="h", is_big_endian=False
         )
-        self.query("*OPC?")
-        time.sleep(self.delay)
+        self.wait_complete()
+        self.settle(self.delay)
 
     def setup_burst(self, channel, **kwargs):
         if "mode" in kwargs:
@@ -105,8 +104,8 @@ class WaveformGeneratorRigol(WaveformGenerator):
             self.check_parameter("delay", arg_value, float, None)
             self.write(":SOUR{:d}:BURS:TDELay {:g}".format(channel, arg_value))
 
-        self.query("*OPC?")
-        time.sleep(self.delay)
+        self.wait_complete()
+        self.settle(self.delay)
 
     def get_mode(self, channel):
         """ Queries instrument for current mode and returns relevant settings"""
@@ -145,11 +144,11 @@ class WaveformGeneratorRigol(WaveformGenerator):
         if vlow is not None:
             self.write(":SOUR{:d}:VOLT:LEV:LOW {:g}".format(channel, vlow))
 
-        self.query("*OPC?")
+        self.wait_complete()
         # The following is required for the above settigns to take effect
         # The front panel of the instrument will show the new seetings,
         # but the actual waveform output will remain unchanged
-        time.sleep(0.1)
+        self.settle(0.1)
         # self.set_output_state(channel, state_start)
 
     def set_channel(self, channel, sync=None, syncpol=None):
@@ -185,18 +184,18 @@ class WaveformGenerator81150(WaveformGenerator):
         # Assume default of BigEndian is still set
         # Should explicitly set this though.
         self.write_binary_values("DATA{:d}:DAC VOLATILE,".format(channel), data, datatype="h", is_big_endian=True)
-        self.query("*OPC?")
+        self.wait_complete()
         self.write("FUNC{:d}:USER VOLATILE".format(channel))
         self.write("APPL{:d}:USER {:g}, {:g}, {:g}".format(channel, freq, amplitude, offset))
-        self.query("*OPC?")
-        time.sleep(0.1)
+        self.wait_complete()
+        self.settle(0.1)
 
     def setup_burst(self, channel):
         self.write(":ARM:IMP MAX")  # Set EXT-IN imput impedance to 10kOhm
         self.write(":ARM:SOUR{:d} EXT".format(channel))
         self.write(":ARM:SLOP{:d} POS".format(channel))
-        self.query("*OPC?")
-        time.sleep(0.1)
+        self.wait_complete()
+        self.settle(0.1)
 
     def setup_pulse(self, channel, mode, period, width, vlow, vhigh):
         # state_start = self.get_output_state(channel)
@@ -207,9 +206,9 @@ class WaveformGenerator81150(WaveformGenerator):
         self.write(":FUNC{:d}:PULS:WIDT {:g}".format(channel, width))
         self.write(":VOLT{:d}:HIGH {:g}".format(channel, vhigh))
         self.write(":VOLT{:d}:LOW {:g}".format(channel, vlow))
-        self.query("*OPC?")
+        self.wait_complete()
         # The following is required for the above settigns to take effect
         # The front panel of the instrument will show the new seetings,
         # but the actual waveform output will remain unchanged
-        time.sleep(0.1)
+        self.settle(0.1)
         # self.set_output_state(channel, state_start)
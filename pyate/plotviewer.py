@@ -0,0 +1,353 @@
+"""
+Created on Oct 18, 2026
+
+Out-of-process live plotting for DataLogger
+
+DataLogger(plot_publish=port) streams plot definitions and records over a
+local TCP socket.  The viewer runs in its own process and owns the Qt window,
+so GUI events never block the measurement loop.  Viewers can be started and
+stopped at any time during a run:
+
+    python -m pyate.plotviewer --port 5050
+
+Messages are newline delimited JSON objects:
+    {"type": "hello", "plots": [...], "group": n}
+    {"type": "plots", "plots": [...]}
+    {"type": "record", "data": {...}}
+    {"type": "group", "group": n}
+
+@author: kyleh
+"""
+
+import argparse
+import json
+import logging
+import select
+import socket
+
+
+def _json_default(obj):
+    # numpy scalars and anything else json does not know about
+    try:
+        return obj.item()
+    except AttributeError:
+        return str(obj)
+
+
+def encode_message(message):
+    return (json.dumps(message, default=_json_default) + "\n").encode()
+
+
+class PlotPublisher(object):
+    """
+    Publishes DataLogger records to any number of viewer processes
+
+    All socket operations are non-blocking.  New viewers are accepted while
+    publishing and receive the plot definitions plus the records of the current
+    group.  A viewer that falls more than max_pending bytes behind is
+    disconnected rather than stalling the caller.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, max_pending=4 * 1024 * 1024):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        host : str, optional
+            Interface to listen on
+        port : int, optional
+            Port to listen on.  0 picks a free port (see self.port)
+        max_pending : int, optional
+            Maximum number of unsent bytes per viewer
+
+        Returns
+        -------
+        None.
+
+        """
+        self._logger = logging.getLogger(__name__)
+
+        self.max_pending = max_pending
+
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((host, port))
+        self._server.listen()
+        self._server.setblocking(False)
+        self.host, self.port = self._server.getsockname()
+        self._logger.info("Publishing plot data on %s:%d", self.host, self.port)
+
+        self._clients = {}
+        self._plots = []
+        self._group = 0
+        self._group_messages = []
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    @property
+    def num_viewers(self):
+        return len(self._clients)
+
+    def _accept(self):
+        while True:
+            readable, _, _ = select.select([self._server], [], [], 0)
+            if not readable:
+                return
+            try:
+                client, address = self._server.accept()
+            except BlockingIOError:
+                return
+            client.setblocking(False)
+            self._logger.info("Plot viewer connected from %s", str(address))
+
+            hello = {"type": "hello", "plots": self._plots, "group": self._group}
+            self._clients[client] = bytearray(encode_message(hello))
+            for message in self._group_messages:
+                self._clients[client].extend(message)
+
+    def _drop(self, client, reason):
+        self._logger.info("Dropping plot viewer: %s", reason)
+        del self._clients[client]
+        client.close()
+
+    def _send(self, message=None):
+        self._accept()
+
+        for client in list(self._clients):
+            pending = self._clients[client]
+            if message is not None:
+                pending.extend(message)
+
+            try:
+                sent = client.send(pending)
+                del pending[:sent]
+            except (BlockingIOError, InterruptedError):
+                pass
+            except OSError as e:
+                self._drop(client, str(e))
+                continue
+
+            if len(pending) > self.max_pending:
+                self._drop(client, "viewer is not keeping up")
+
+    def set_plots(self, plots):
+        self._plots = [dict(plotdef) for plotdef in plots]
+        self._send(encode_message({"type": "plots", "plots": self._plots}))
+
+    def publish_record(self, record):
+        message = encode_message({"type": "record", "data": dict(record)})
+        self._group_messages.append(message)
+        self._send(message)
+
+    def publish_group(self, group):
+        # Viewers waiting to connect still get the group that just finished
+        self._accept()
+        self._group = group
+        self._group_messages = []
+        self._send(encode_message({"type": "group", "group": group}))
+
+    def poll(self):
+        """Accepts new viewers and sends pending data without publishing"""
+        self._send()
+
+    def close(self):
+        for client in list(self._clients):
+            client.close()
+        self._clients = {}
+        self._server.close()
+
+
+class PlotViewer(object):
+    """
+    Receives data from a PlotPublisher and plots it
+
+    The plot layout matches DataLogger.plot_update(): a 2x2 grid of axes with
+    one line per plot definition and group.  Only the last max_groups groups
+    are kept.  Lines are created once and updated in place, so a refresh
+    only touches the groups that received data.
+    """
+
+    def __init__(self, host="127.0.0.1", port=5050, fps=10.0, max_groups=20):
+        self._logger = logging.getLogger(__name__)
+
+        self.host = host
+        self.port = port
+        self.fps = fps
+        self.max_groups = max_groups
+
+        self.plots = []
+        self.groups = {}
+        self.group = 0
+
+        self._socket = None
+        self._buffer = bytearray()
+        self._fig = None
+        self._lines = {}
+        self._rebuild = True
+        self._dirty_groups = set()
+
+    def connect(self):
+        self._socket = socket.create_connection((self.host, self.port))
+        self._socket.setblocking(False)
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def _start_group(self, group):
+        self.group = group
+        self.groups[group] = []
+        self._dirty_groups.add(group)
+        while len(self.groups) > self.max_groups:
+            # Groups arrive in order so the first one is the oldest
+            del self.groups[next(iter(self.groups))]
+
+    def handle_message(self, message):
+        kind = message["type"]
+        if kind == "hello":
+            self.plots = message["plots"]
+            self.groups = {}
+            self._start_group(message["group"])
+            self._rebuild = True
+        elif kind == "plots":
+            self.plots = message["plots"]
+            self._rebuild = True
+        elif kind == "record":
+            self.groups.setdefault(self.group, []).append(message["data"])
+            self._dirty_groups.add(self.group)
+        elif kind == "group":
+            self._start_group(message["group"])
+        else:
+            self._logger.warning("Unknown message type: %s", kind)
+
+    def receive(self):
+        """Reads everything available on the socket without blocking
+
+        Returns False once the publisher has closed the connection"""
+        while True:
+            try:
+                data = self._socket.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                break
+            if not data:
+                return False
+            self._buffer.extend(data)
+
+        while True:
+            try:
+                end = self._buffer.index(b"\n")
+            except ValueError:
+                break
+            line = self._buffer[:end]
+            del self._buffer[: end + 1]
+            self.handle_message(json.loads(line))
+        return True
+
+    def get_group(self, group, key):
+        return [record.get(key) for record in self.groups.get(group, [])]
+
+    def _get_axes(self, axes_idx):
+        if isinstance(axes_idx, int):
+            return self._ax.ravel()[axes_idx]
+        return self._ax[tuple(axes_idx)]
+
+    def draw(self):
+        import matplotlib.pyplot as plt
+
+        if self._fig is None:
+            self._fig, self._ax = plt.subplots(2, 2, sharex=True)
+        if not self._rebuild and not self._dirty_groups:
+            return
+
+        if self._rebuild:
+            for ax in self._ax.ravel():
+                ax.clear()
+            self._lines = {}
+            self._dirty_groups = set(self.groups)
+            for plotdef in self.plots:
+                ax = self._get_axes(plotdef["axes"])
+                ax.set_title(plotdef["title"])
+                ax.grid(True)
+
+        # Lines of groups dropped by max_groups
+        for key in [key for key in self._lines if key[1] not in self.groups]:
+            self._lines.pop(key).remove()
+
+        axes_used = set()
+        for n, plotdef in enumerate(self.plots):
+            plotdef_copy = dict(plotdef)
+            ax = self._get_axes(plotdef_copy.pop("axes"))
+            plotdef_copy.pop("title")
+            key_x = plotdef_copy.pop("x")
+            key_y = plotdef_copy.pop("y")
+
+            for group in sorted(self._dirty_groups.intersection(self.groups)):
+                data_x = self.get_group(group, key_x)
+                data_y = self.get_group(group, key_y)
+                line = self._lines.get((n, group))
+                if line is None:
+                    (line,) = ax.plot(data_x, data_y, **plotdef_copy)
+                    self._lines[(n, group)] = line
+                else:
+                    line.set_data(data_x, data_y)
+                axes_used.add(ax)
+
+            # Only the current group shows up in the legend
+            for group in self.groups:
+                line = self._lines.get((n, group))
+                if line is not None:
+                    line.set_label(key_y if group == self.group else "_nolegend_")
+
+        for ax in axes_used:
+            ax.relim()
+            ax.autoscale_view(True, True, True)
+            ax.legend()
+
+        self._fig.canvas.draw_idle()
+        self._rebuild = False
+        self._dirty_groups.clear()
+
+    def run(self):
+        import matplotlib
+
+        matplotlib.use("qtagg")
+        import matplotlib.pyplot as plt
+
+        self.connect()
+        self.draw()
+
+        def update():
+            if not self.receive():
+                self._logger.info("Publisher closed connection")
+                timer.stop()
+                self.close()
+            self.draw()
+
+        timer = self._fig.canvas.new_timer(interval=int(1000 / self.fps))
+        timer.add_callback(update)
+        timer.start()
+        plt.show()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Live plot viewer for DataLogger")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5050)
+    parser.add_argument("--fps", type=float, default=10.0)
+    parser.add_argument("--max-groups", type=int, default=20)
+    args = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO)
+    PlotViewer(
+        host=args.host, port=args.port, fps=args.fps, max_groups=args.max_groups
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
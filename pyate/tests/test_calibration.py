@@ -7,8 +7,11 @@ import unittest
 
 import numpy as np
 import numpy.testing as nptest
+import pandas as pd
 
 from pyate.calibration import Calibration as Cal
+from pyate.calibration import CalibrationTable, GridTable
+from pyate import ParameterSweep
 
 
 class TestCalibration(unittest.TestCase):
@@ -40,12 +43,128 @@ class TestCalibration(unittest.TestCase):
         cal = self.create_calibration()
         self.assertAlmostEqual(cal.get("lin", 3.5), 1 + 2 * 3.5)
 
+    def test_get_array(self):
+        cal = self.create_calibration()
+        x = np.array([[1.5, 2.0], [3.25, 8.0]])
+        x_table = np.arange(1.0, 10.0, 1.0)
+        nptest.assert_array_almost_equal(
+            cal.get("sq", x), np.interp(x, x_table, x_table**2)
+        )
+        self.assertEqual(np.ndim(cal.get("sq", 2.5)), 0)
+
+    def test_get_many(self):
+        cal = self.create_calibration()
+        cal.set_table("other_x", [0, 20], [0, 40])
+
+        values = cal.get_many(4.5)
+        self.assertListEqual(list(values.keys()), ["eq", "lin", "sq", "other_x"])
+        for name, value in values.items():
+            self.assertAlmostEqual(value, cal.get(name, 4.5))
+
+        x = np.linspace(1, 9, 17)
+        values = cal.get_many(x, names=["other_x", "lin"])
+        self.assertListEqual(list(values.keys()), ["other_x", "lin"])
+        nptest.assert_array_almost_equal(values["lin"], 1 + 2 * x)
+        nptest.assert_array_almost_equal(values["other_x"], 2 * x)
+
+    def test_cache(self):
+        cal = self.create_calibration()
+        cal.cache_size = 4
+        for x in range(1, 9):
+            cal.get("lin", x)
+        self.assertEqual(len(cal._cache), 4)
+        self.assertEqual(cal._cache[("lin", 8)], 17)
+
+        # Tables changing invalidates cached results
+        cal.get_many(3)
+        cal.set_table("lin", np.arange(1.0, 10.0), np.zeros(9))
+        self.assertEqual(cal.get("lin", 8), 0)
+        self.assertEqual(cal.get_many(3)["lin"], 0)
+
+        # Also when the tables are changed directly
+        cal.get("eq", 3)
+        cal.get_many(3)
+        cal.tables["eq"] = CalibrationTable([1.0, 9.0], [0.0, 0.0])
+        self.assertEqual(cal.get("eq", 3), 0)
+        self.assertEqual(cal.get_many(3)["eq"], 0)
+        del cal.tables["eq"]
+        self.assertNotIn("eq", cal.get_many(3))
+        with self.assertRaises(KeyError):
+            cal.get("eq", 3)
+
+    def test_table(self):
+        x = np.array([3.0, 1.0, 2.0, 5.0])
+        y = np.array([30.0, 10.0, 20.0, 0.0])
+        table = CalibrationTable(x, y)
+        self.assertFalse(table.uniform)
+        nptest.assert_array_equal(table.x, [1, 2, 3, 5])
+        nptest.assert_array_equal(table.y, [10, 20, 30, 0])
+
+        x_new = np.array([1.0, 1.5, 3.0, 4.5, 5.0])
+        expected = [10, 15, 30, 7.5, 0]
+        nptest.assert_array_almost_equal(table(x_new), expected)
+        for x_k, y_k in zip(x_new, expected):
+            self.assertAlmostEqual(table(x_k), y_k)
+
+        # Changes to the caller's arrays do not affect the table
+        x = np.array([1.0, 2.0, 3.0])
+        y = np.array([10.0, 20.0, 30.0])
+        table = CalibrationTable(x, y)
+        y[:] = 0
+        self.assertAlmostEqual(table(1.5), 15.0)
+        nptest.assert_array_almost_equal(table(np.array([1.5, 2.5])), [15, 25])
+
+        with self.assertRaises(ValueError):
+            CalibrationTable([1, 1, 2], [1, 2, 3])
+        with self.assertRaises(ValueError):
+            CalibrationTable([1], [1])
+
+    def test_table_uniform(self):
+        x = np.linspace(1e9, 6e9, 501)
+        y = np.sin(x / 1e9)
+        table = CalibrationTable(x, y)
+        table_search = CalibrationTable(x, y)
+        table_search._step = None
+        self.assertTrue(table.uniform)
+
+        x_new = np.concatenate([x, np.linspace(1e9, 6e9, 1237)])
+        nptest.assert_array_almost_equal(table(x_new), table_search(x_new))
+        nptest.assert_array_almost_equal(table(x), y)
+        self.assertAlmostEqual(table(x[-1]), y[-1])
+        self.assertAlmostEqual(table(3.3e9), table_search(3.3e9))
+
+    def test_table_extrapolate(self):
+        x_new = np.array([0.0, 2.0, 11.0])
+        expected = {
+            "clip": [1.0, 2.0, 9.0],
+            "linear": [0.0, 2.0, 11.0],
+            "nan": [np.nan, 2.0, np.nan],
+        }
+        for mode, y in expected.items():
+            table = CalibrationTable(np.arange(1.0, 10.0), np.arange(1.0, 10.0), mode)
+            nptest.assert_array_almost_equal(table(x_new), y)
+            for x_k, y_k in zip(x_new, y):
+                nptest.assert_almost_equal(table(x_k), y_k)
+
+        table = CalibrationTable(np.arange(1.0, 10.0), np.arange(1.0, 10.0))
+        with self.assertRaises(ValueError):
+            table(0.0)
+        with self.assertRaises(ValueError):
+            table(x_new)
+
+        cal = self.create_calibration()
+        cal.set_table("clip", [0, 1], [0, 1], extrapolate="clip")
+        self.assertEqual(cal.get("clip", 2), 1)
+        with self.assertRaises(ValueError):
+            cal.get("lin", 0)
+
     def test_save_calibration(self):
         cal = self.create_calibration()
         cal.write("unittest_cal.csv")
 
     def test_read_calibration(self):
         cal1 = self.create_calibration()
+        cal1.write("unittest_cal.csv")
         cal2 = Cal()
         cal2.read("unittest_cal.csv")
 
@@ -54,6 +173,181 @@ class TestCalibration(unittest.TestCase):
             nptest.assert_array_almost_equal(cal1.tables[name].x, cal2.tables[name].x)
             nptest.assert_array_almost_equal(cal1.tables[name].y, cal2.tables[name].y)
 
+    def test_binary(self):
+        cal1 = self.create_calibration()
+        cal1.set_table("clip", [0.0, 2.0, 1.0], [0.0, 4.0, 1.0], extrapolate="clip")
+        cal1.set_grid_table("grid", ["x", "p"], [[1.0, 2.0], [0.0, 10.0]], np.eye(2))
+        cal1.write("unittest_cal.bin", format="binary")
+
+        cal2 = Cal()
+        cal2.read("unittest_cal.bin")
+        self.assertEqual(cal2.indep_var, "x")
+        self.assertListEqual(list(cal2.tables.keys()), list(cal1.tables.keys()))
+
+        # Tables are loaded on first access
+        self.assertFalse(cal2.tables.is_loaded("lin"))
+        self.assertAlmostEqual(cal2.get("lin", 3.5), 1 + 2 * 3.5)
+        self.assertTrue(cal2.tables.is_loaded("lin"))
+        self.assertFalse(cal2.tables.is_loaded("sq"))
+        self.assertIsInstance(cal2.tables["lin"].y.base, np.memmap)
+
+        # Memory mapped data is only copied for scalar lookups
+        nptest.assert_array_almost_equal(cal2.get("sq", [2.0, 3.0]), [4.0, 9.0])
+        self.assertIsNone(cal2.tables["sq"]._lists)
+        self.assertAlmostEqual(cal2.get("sq", 2.5), 6.5)
+        self.assertIsNotNone(cal2.tables["sq"]._lists)
+
+        for name in ["eq", "lin", "sq", "clip"]:
+            nptest.assert_array_equal(cal1.tables[name].x, cal2.tables[name].x)
+            nptest.assert_array_equal(cal1.tables[name].y, cal2.tables[name].y)
+        self.assertEqual(cal2.get("clip", 5), 4)
+        self.assertAlmostEqual(cal2.get("grid", (1.5, 5.0)), 0.5)
+        self.assertListEqual(cal2.tables["grid"].dims, ["x", "p"])
+
+        # CSV stays available for import/export
+        cal2.write("unittest_cal.csv", fields=["eq", "lin", "sq"])
+        cal3 = Cal()
+        cal3.read("unittest_cal.csv")
+        nptest.assert_array_equal(cal3.tables["sq"].y, cal1.tables["sq"].y)
+
+        with self.assertRaises(ValueError):
+            cal1.write("unittest_cal.bin", format="xml")
+
+
+class TestGridCalibration(unittest.TestCase):
+    freq = np.array([1e9, 2e9, 2.5e9, 4e9])
+    power = np.arange(-20.0, 11.0, 5.0)
+    temp = np.array([25.0, 85.0])
+
+    @staticmethod
+    def loss(freq, power, temp=25.0):
+        # Multilinear so interpolation is exact
+        f = freq / 1e9
+        return 1 + 0.5 * f - 0.01 * power + 0.02 * f * power + 0.001 * f * power * temp
+
+    def create_calibration(self):
+        cal = Cal()
+        grid = np.meshgrid(self.freq, self.power, self.temp, indexing="ij")
+        cal.set_grid_table(
+            "loss",
+            ["freq", "power", "temp"],
+            [self.freq, self.power, self.temp],
+            self.loss(*grid),
+        )
+        grid = np.meshgrid(self.freq, self.power, indexing="ij")
+        cal.set_grid_table(
+            "offset", ["freq", "power"], [self.freq, self.power], 2 * self.loss(*grid)
+        )
+        return cal
+
+    def test_interp(self):
+        cal = self.create_calibration()
+        table = cal.tables["loss"]
+        rng = np.random.default_rng(0)
+        f = rng.uniform(1e9, 4e9, 50)
+        p = rng.uniform(-20, 10, 50)
+        t = rng.uniform(25, 85, 50)
+        nptest.assert_array_almost_equal(table(f, p, t), self.loss(f, p, t))
+        self.assertAlmostEqual(
+            cal.get("loss", (3e9, 1.0, 30.0)), self.loss(3e9, 1.0, 30.0)
+        )
+        self.assertAlmostEqual(
+            cal.get("offset", {"freq": 1.5e9, "power": -3.0}),
+            2 * self.loss(1.5e9, -3.0),
+        )
+
+        # Broadcasting
+        self.assertEqual(table(f[:, None], p[None, :], 25.0).shape, (50, 50))
+
+    def test_unsorted(self):
+        table = GridTable(
+            ["a", "b"], [[2.0, 1.0], [0.0, 1.0]], [[20.0, 21.0], [10.0, 11.0]]
+        )
+        nptest.assert_array_equal(table.axes[0], [1.0, 2.0])
+        self.assertAlmostEqual(table(1.5, 0.5), 15.5)
+
+        with self.assertRaises(ValueError):
+            GridTable(["a"], [[1.0, 2.0]], [1.0, 2.0, 3.0])
+
+    def test_extrapolate(self):
+        values = [[0.0, 1.0], [10.0, 11.0]]
+        with self.assertRaises(ValueError):
+            GridTable(["a", "b"], [[0, 1], [0, 1]], values)(2, 0.5)
+        self.assertAlmostEqual(
+            GridTable(["a", "b"], [[0, 1], [0, 1]], values, "clip")(2, 0.5), 10.5
+        )
+        self.assertAlmostEqual(
+            GridTable(["a", "b"], [[0, 1], [0, 1]], values, "linear")(2, 0.5), 20.5
+        )
+        self.assertTrue(
+            np.isnan(GridTable(["a", "b"], [[0, 1], [0, 1]], values, "nan")(2, 0.5))
+        )
+
+        # Single valued axis
+        table = GridTable(["a", "b"], [[0, 1], [5]], [[1.0], [3.0]], "clip")
+        self.assertAlmostEqual(table(0.5, 7), 2.0)
+
+    def test_get_many(self):
+        cal = self.create_calibration()
+        cal.set_indep_var("freq")
+        cal.set_table("gain", self.freq, self.freq / 1e9)
+        x = {"freq": 2e9, "power": 0.0, "temp": 85.0}
+        values = cal.get_many(x)
+        self.assertAlmostEqual(values["loss"], self.loss(2e9, 0.0, 85.0))
+        self.assertAlmostEqual(values["offset"], 2 * self.loss(2e9, 0.0))
+        self.assertAlmostEqual(values["gain"], 2.0)
+
+    def test_write_read(self):
+        cal1 = self.create_calibration()
+        cal1.write("unittest_cal_grid.csv", fields=["offset"])
+
+        # Row order does not matter
+        frame = pd.read_csv("unittest_cal_grid.csv").sample(frac=1, random_state=1)
+        frame.to_csv("unittest_cal_grid.csv", index=False)
+
+        cal2 = Cal()
+        cal2.read("unittest_cal_grid.csv", indep=["freq", "power"])
+        table1 = cal1.tables["offset"]
+        table2 = cal2.tables["offset"]
+        self.assertListEqual(table2.dims, ["freq", "power"])
+        for a1, a2 in zip(table1.axes, table2.axes):
+            nptest.assert_array_almost_equal(a1, a2)
+        nptest.assert_array_almost_equal(table1.values, table2.values)
+
+        frame.iloc[1:].to_csv("unittest_cal_grid.csv", index=False)
+        with self.assertRaises(ValueError):
+            Cal().read("unittest_cal_grid.csv", indep=["freq", "power"])
+
+        with self.assertRaises(ValueError):
+            cal1.write("unittest_cal_grid.csv", fields=["offset", "loss"])
+
+    def test_precompute(self):
+        cal = self.create_calibration()
+        sweep = ParameterSweep()
+        sweep.set_parameter_range("frequency", np.linspace(1e9, 4e9, 7))
+        sweep.set_parameter_range("power", np.arange(-20.0, 10.0, 3.0))
+        sweep.set_parameter_range("temp", [25.0, 50.0, 85.0])
+        sweep.set_order(["temp", "frequency", "power"])
+        sweep.set_serpentine(True)
+        sweep.compute()
+
+        sweep_cal = cal.precompute(sweep, mapping={"freq": "frequency"})
+        self.assertEqual(sweep_cal.get_grid("offset").shape, (7, 10))
+        while not sweep.end():
+            point = sweep.get_current_dict()
+            values = sweep_cal.get_current_dict()
+            self.assertAlmostEqual(
+                values["loss"],
+                self.loss(point["frequency"], point["power"], point["temp"]),
+            )
+            self.assertAlmostEqual(
+                sweep_cal["offset"], 2 * self.loss(point["frequency"], point["power"])
+            )
+            sweep.next()
+
+        with self.assertRaises(KeyError):
+            cal.precompute(sweep)
+
 
 if __name__ == "__main__":
     # import sys;sys.argv = ['', 'Test.testName']
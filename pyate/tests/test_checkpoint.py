@@ -0,0 +1,141 @@
+"""
+Created on Oct 18, 2026
+
+@author: kyleh
+"""
+
+import os
+import unittest
+
+import pandas as pd
+
+from pyate import AdaptiveSweep, Checkpoint, DataLogger, ParameterSweep
+from pyate.datawriter import read_hdf_log
+
+
+class TestCheckpoint(unittest.TestCase):
+    def tearDown(self):
+        for filename in (
+            "unittest_checkpoint.json",
+            "unittest_checkpoint.log",
+            "unittest_checkpoint.h5",
+        ):
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def construct_sweep(self):
+        sweep = ParameterSweep()
+        sweep.set_parameter_range("freq", [1e9, 2e9, 3e9])
+        sweep.set_parameter_range("power", range(-10, 10, 5))
+        sweep.set_order(["freq", "power"])
+        sweep.compute()
+        return sweep
+
+    def run_sweep(self, logfile, logfile_format, stop=None, **kwargs):
+        sweep = self.construct_sweep()
+        datalog = DataLogger(
+            logfile=logfile, logfile_format=logfile_format, autosave=True, **kwargs
+        )
+        checkpoint = Checkpoint("unittest_checkpoint.json", sweep, datalog, records=5)
+        resumed = checkpoint.resume()
+
+        points = []
+        while not sweep.end():
+            if len(points) == stop:
+                # Simulate losing the connection part way through
+                datalog.close()
+                return resumed, points
+
+            points.append(sweep.get_index())
+            if sweep.get_index() > 0 and sweep["power"] == -10:
+                datalog.next_group()
+            datalog["freq"] = sweep["freq"]
+            datalog["power"] = sweep["power"]
+            datalog["pout"] = sweep["power"] + 10.0
+            datalog.next_record()
+            sweep.next()
+            checkpoint.update()
+
+        datalog.close()
+        checkpoint.remove()
+        return resumed, points
+
+    def check_resume(self, logfile, logfile_format, read_log, **kwargs):
+        resumed, points = self.run_sweep(logfile, logfile_format, stop=7, **kwargs)
+        self.assertFalse(resumed)
+        self.assertTrue(os.path.exists("unittest_checkpoint.json"))
+
+        # Picks up after the last checkpoint (5 points) and discards the
+        # records written after it
+        resumed, points = self.run_sweep(logfile, logfile_format, **kwargs)
+        self.assertTrue(resumed)
+        self.assertListEqual(points, list(range(5, 12)))
+        self.assertFalse(os.path.exists("unittest_checkpoint.json"))
+
+        frame = read_log(logfile)
+        self.assertListEqual(list(frame.index), list(range(12)))
+        self.assertListEqual(list(frame["group"]), [0] * 4 + [1] * 4 + [2] * 4)
+        self.assertListEqual(list(frame["pout"]), [0.0, 5.0, 10.0, 15.0] * 3)
+        self.assertListEqual(list(frame.columns[:3]), ["freq", "power", "pout"])
+
+    def test_resume_csv(self):
+        self.check_resume(
+            "unittest_checkpoint.log",
+            "csv",
+            lambda filename: pd.read_csv(filename, index_col="index"),
+        )
+
+    def test_resume_csv_background(self):
+        self.check_resume(
+            "unittest_checkpoint.log",
+            "csv",
+            lambda filename: pd.read_csv(filename, index_col="index"),
+            background_writer=True,
+            flush_records=3,
+        )
+
+    def test_resume_hdf(self):
+        self.check_resume("unittest_checkpoint.h5", "hdf", read_hdf_log)
+
+    def test_sweep_state(self):
+        sweep = self.construct_sweep()
+        for k in range(6):
+            sweep.next()
+        state = sweep.get_state()
+
+        sweep = self.construct_sweep()
+        sweep.set_state(state)
+        self.assertEqual(sweep.get_index(), 6)
+        # All parameters are reapplied after a resume
+        self.assertDictEqual(sweep.get_changes(), {"freq": 2e9, "power": 0})
+
+        sweep.set_parameter_range("power", range(-10, 10, 2))
+        sweep.compute()
+        with self.assertRaises(ValueError):
+            sweep.set_state(state)
+
+    def test_adaptive_state(self):
+        sweep = AdaptiveSweep("power", 0, 8, num_coarse=5, max_points=7)
+        for k in range(6):
+            sweep.feed(sweep["power"] ** 2)
+            sweep.next()
+
+        checkpoint = Checkpoint("unittest_checkpoint.json", sweep)
+        checkpoint.save()
+
+        sweep_resumed = AdaptiveSweep("power", 0, 8, num_coarse=5, max_points=7)
+        Checkpoint("unittest_checkpoint.json", sweep_resumed).resume()
+        self.assertEqual(sweep_resumed["power"], sweep["power"])
+        self.assertEqual(len(sweep_resumed), 6)
+
+    def test_set_state_after_logging(self):
+        datalog = DataLogger()
+        state = datalog.get_state()
+        datalog["a"] = 1
+        datalog.next_record()
+        with self.assertRaises(Exception):
+            datalog.set_state(state)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,13 +3,29 @@ Created on May 10, 2019
 
 @author: kyleh
 """
+from collections import OrderedDict
+import json
 import logging
 import os
+import socket
 import sys
 from time import sleep
 import unittest
+from unittest import mock
+
+import matplotlib
+import numpy as np
+import numpy.testing as nptest
 
 from pyate import DataLogger
+from pyate import datawriter
+from pyate.datawriter import (
+    CsvLogWriter,
+    HdfLogWriter,
+    ThreadedLogWriter,
+    read_hdf_log,
+)
+from pyate.plotviewer import PlotViewer
 
 # from pyate.datamanagement import DataLogger
 
@@ -62,6 +78,176 @@ class TestDataLogger(unittest.TestCase):
         datalog.write_data(filename=None, format="csv")
         # datalog.write_data(filename="unittest.hdf", format="hdf")
 
+    def test_autosave_buffered(self):
+        datalog = DataLogger(
+            logfile="unittest_buffered.log", autosave=True, flush_records=100
+        )
+        self.add_records(datalog, 5)
+
+        # Records are still held in memory
+        with open("unittest_buffered.log", "rt") as fid:
+            self.assertEqual(len(fid.readlines()), 1)
+
+        datalog.next_group()
+        with open("unittest_buffered.log", "rt") as fid:
+            lines = fid.readlines()
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(lines[0].startswith("str1,str2,int1,float1"))
+
+        self.add_records(datalog, 2)
+        datalog.close()
+        with open("unittest_buffered.log", "rt") as fid:
+            self.assertEqual(len(fid.readlines()), 8)
+
+    def test_autosave_context(self):
+        with DataLogger(
+            logfile="unittest_context.log", autosave=True, flush_records=100
+        ) as datalog:
+            self.add_records(datalog, 3)
+        with open("unittest_context.log", "rt") as fid:
+            self.assertEqual(len(fid.readlines()), 4)
+
+    def test_autosave_background(self):
+        datalog = DataLogger(
+            logfile="unittest_background.log", autosave=True, background_writer=True
+        )
+        self.add_records(datalog, 20)
+        datalog.flush()
+
+        stats = datalog.get_writer_statistics()
+        self.assertEqual(stats["queue_depth"], 0)
+        self.assertEqual(stats["records_written"], 20)
+        with open("unittest_background.log", "rt") as fid:
+            self.assertEqual(len(fid.readlines()), 21)
+
+        datalog.write_data(filename="unittest_background.csv")
+        datalog.close()
+        with open("unittest_background.csv", "rt") as fid:
+            self.assertEqual(len(fid.readlines()), 21)
+
+    def test_close_then_write(self):
+        for background_writer in [False, True]:
+            datalog = DataLogger(
+                logfile="unittest_reopen.log",
+                autosave=True,
+                background_writer=background_writer,
+            )
+            self.add_records(datalog, 3)
+            datalog.close()
+            self.assertIsNone(datalog.get_writer_statistics())
+
+            # Later records are appended without a second header
+            self.add_records(datalog, 2)
+            datalog.close()
+            with open("unittest_reopen.log", "rt") as fid:
+                lines = fid.readlines()
+            self.assertEqual(len(lines), 6)
+            self.assertEqual(sum(line.startswith("str1,") for line in lines), 1)
+
+    def test_close_at_exit(self):
+        writer = ThreadedLogWriter(CsvLogWriter("unittest_atexit.log"))
+        write_record = writer.writer.write_record
+        close = writer.writer.close
+        closed_after = []
+
+        def slow_write_record(record):
+            sleep(0.01)
+            write_record(record)
+
+        def counting_close():
+            closed_after.append(writer.records_written)
+            close()
+
+        writer.writer.write_record = slow_write_record
+        writer.writer.close = counting_close
+        for k in range(10):
+            writer.write_record({"a": k})
+        sleep(0.02)  # Inner writer has opened its file by now
+
+        # The inner writer is only closed once the queue is drained
+        datawriter._close_open_writers()
+        self.assertEqual(closed_after[0], 10)
+        self.assertNotIn(writer, datawriter._open_writers)
+        self.assertNotIn(writer.writer, datawriter._open_writers)
+        with open("unittest_atexit.log", "rt") as fid:
+            self.assertEqual(len(fid.readlines()), 11)
+
+    def test_autosave_hdf(self):
+        datalog = DataLogger(
+            logfile="unittest_autosave.h5", logfile_format="hdf", autosave=True
+        )
+        for group in range(3):
+            self.add_records(datalog, 5, group)
+            datalog.next_group()
+        datalog["str1"] = "missing"
+        datalog.next_record()
+        datalog.close()
+
+        frame = read_hdf_log("unittest_autosave.h5")
+        self.assertEqual(len(frame), 16)
+        self.assertEqual(frame.index.name, "index")
+        self.assertTrue(np.isnan(frame["int1"].iloc[-1]))
+
+        frame = read_hdf_log("unittest_autosave.h5", groups=1)
+        self.assertListEqual(list(frame.index), [5, 6, 7, 8, 9])
+        self.assertListEqual(list(frame["int1"]), [1000, 1001, 1002, 1003, 1004])
+        self.assertEqual(frame["str1"].iloc[0], "g1r0a")
+
+    def test_hdf_types(self):
+        writer = HdfLogWriter("unittest_types.h5", flush_records=2)
+        for k in range(4):
+            writer.write_record(
+                OrderedDict(
+                    [("index", k), ("group", 0), ("flag", k % 2 == 0), ("x", k)]
+                )
+            )
+
+        # Values that do not fit the column are rejected, not stored as NaN
+        for record in [{"flag": 1, "x": 0}, {"flag": True, "x": "abc"}]:
+            with self.assertRaises(ValueError):
+                writer.write_record(OrderedDict(index=4, group=0, **record))
+        writer.write_record(OrderedDict(index=4, group=0, flag=False, x=None))
+        writer.close()
+
+        frame = read_hdf_log("unittest_types.h5")
+        self.assertEqual(frame["flag"].dtype, bool)
+        self.assertListEqual(list(frame["flag"]), [True, False, True, False, False])
+        self.assertEqual(frame["x"].dtype, np.float64)
+        self.assertTrue(np.isnan(frame["x"].iloc[-1]))
+
+        # Column types of an existing table are kept when appending
+        writer = HdfLogWriter("unittest_types.h5", append=True)
+        with self.assertRaises(ValueError):
+            writer.write_record(OrderedDict(index=5, group=1, flag=0.5, x=1))
+        writer.write_record(OrderedDict(index=5, group=1, flag=True, x=1))
+        writer.close()
+        frame = read_hdf_log("unittest_types.h5", groups=1)
+        self.assertEqual(frame["flag"].iloc[0], True)
+
+    def test_hdf_long_string(self):
+        datalog = DataLogger(
+            logfile="unittest_long.h5",
+            logfile_format="hdf",
+            autosave=True,
+            flush_records=1,
+            min_itemsize=8,
+        )
+        datalog["s"] = "short"
+        datalog.next_record()
+
+        # Rejected before it is buffered, so the writer keeps working
+        datalog["s"] = "x" * 100
+        with self.assertRaises(ValueError):
+            datalog.next_record()
+        datalog["s"] = "also ok"
+        datalog.next_record()
+        datalog.close()
+        self.assertListEqual(list(datalog.get_data("s")), ["short", "also ok"])
+
+        frame = read_hdf_log("unittest_long.h5")
+        self.assertListEqual(list(frame["s"]), ["short", "also ok"])
+        self.assertListEqual(list(frame.index), [0, 1])
+
     def test_addkey(self):
         datalog = self.create_test_instance()
         datalog["newkey"] = 42
@@ -104,6 +290,41 @@ class TestDataLogger(unittest.TestCase):
                 print(datalog.get_data("f", slice(None, None)))
                 print("Slope: {:g}".format(datalog.trend("f", 3)))
 
+    def test_statistics(self):
+        datalog = DataLogger()
+        stats = datalog.add_statistics("f", 4)
+
+        values = [1.0, 5.0, 2.0, 8.0, 3.0, 3.5, 4.0, 4.5]
+        for k, value in enumerate(values):
+            datalog["f"] = value
+            datalog.next_record()
+
+            window = np.array(values[max(0, k - 3) : k + 1])
+            self.assertAlmostEqual(stats.mean, window.mean())
+            self.assertAlmostEqual(stats.std, window.std())
+            self.assertEqual(stats.min, window.min())
+            self.assertEqual(stats.max, window.max())
+            if len(window) > 1:
+                fit = np.polyfit(range(len(window)), window, 1)
+                self.assertAlmostEqual(stats.slope, fit[0])
+                self.assertAlmostEqual(datalog.trend("f", 4), stats.slope)
+
+        self.assertTrue(stats.settled(slope=0.6, span=1.6))
+        self.assertFalse(stats.settled(std=0.1))
+
+        datalog.next_group()
+        self.assertEqual(len(datalog.get_statistics("f")), 0)
+        self.assertFalse(stats.settled(slope=1.0))
+
+    def test_trend_includecurrent(self):
+        datalog = DataLogger()
+        for k in range(3):
+            datalog["f"] = float(k)
+            datalog.next_record()
+        datalog["f"] = 3.0
+        self.assertAlmostEqual(datalog.trend("f", 4, includecurrent=True), 1.0)
+        self.assertEqual(len(datalog.get_data("f")), 3)
+
     def test_access_methods(self):
         datalog = self.create_test_instance()
 
@@ -116,6 +337,100 @@ class TestDataLogger(unittest.TestCase):
         result = datalog.get_group(-2, "int1")
         self.assertListEqual(result, [1000, 1001, 1002, 1003, 1004])
 
+    def test_current_group(self):
+        datalog = self.create_test_instance()
+        self.add_records(datalog, 3, 3)
+
+        # Current group must include the most recent record
+        result = datalog.get_group(0, "int1")
+        self.assertListEqual(result, [3000, 3001, 3002])
+
+    def test_group_index(self):
+        datalog = self.create_test_instance()
+        self.assertEqual(datalog.num_groups(), 4)
+
+        info = datalog.get_group_info(-2)
+        self.assertEqual(info["group"], 1)
+        self.assertEqual(info["count"], 5)
+        self.assertEqual((info["start"], info["stop"]), (5, 10))
+        self.assertLessEqual(info["time_start"], info["time_stop"])
+
+        groups = dict(datalog.iter_groups("int1"))
+        self.assertListEqual(sorted(groups), [0, 1, 2, 3])
+        self.assertListEqual(groups[3], [])
+
+        result = datalog.aggregate_groups("int1", max)
+        self.assertDictEqual(result, {0: 4, 1: 1004, 2: 2004})
+
+
+class TestDataLoggerColumnar(TestDataLogger):
+    def create_columnar_instance(self, num_groups=3, num_records=5):
+        return self.create_test_instance(
+            num_groups=num_groups,
+            num_records=num_records,
+            kwargs={"storage": "columnar"},
+        )
+
+    def test_columnar_types(self):
+        datalog = self.create_columnar_instance()
+
+        self.assertEqual(datalog._data["int1"].dtype, np.int64)
+        self.assertEqual(datalog._data["float1"].dtype, np.float64)
+        self.assertEqual(datalog._data["str1"].dtype, object)
+
+        self.assertEqual(datalog._data["str1"][0], "g0r0a")
+        self.assertEqual(datalog._data["int1"][2], 2)
+        self.assertEqual(datalog._data["float1"][2], 0.002)
+        self.assertEqual(datalog.last("int1"), 2004)
+
+    def test_columnar_missing(self):
+        datalog = self.create_columnar_instance()
+        datalog["newkey"] = 42
+        datalog.next_record()
+
+        self.assertIsNone(datalog._data["str1"][-1])
+        self.assertTrue(np.isnan(datalog._data["int1"][-1]))
+        self.assertTrue(np.isnan(datalog._data["newkey"][0]))
+        self.assertEqual(datalog._data["newkey"][-1], 42)
+
+        # Existing values must survive the promotion to float
+        self.assertEqual(datalog._data["int1"][2], 2)
+
+        # Missing values become None when a column turns into an object column
+        for value in [1.0, None, "a"]:
+            datalog["mixed"] = value
+            datalog.next_record()
+        self.assertListEqual(list(datalog.get_data("mixed")[-3:]), [1.0, None, "a"])
+        self.assertIsNone(datalog._data["mixed"][0])
+
+    def test_columnar_growth(self):
+        datalog = self.create_columnar_instance(num_groups=2, num_records=500)
+        self.assertEqual(len(datalog._data["int1"]), 1000)
+        nptest.assert_array_equal(datalog.get_group(-1, "int1"), np.arange(1000, 1500))
+
+    def test_columnar_frame(self):
+        datalog = self.create_columnar_instance()
+        frame = datalog.to_frame()
+
+        self.assertEqual(len(frame), 15)
+        self.assertTrue(
+            np.shares_memory(
+                frame["float1"].to_numpy(), datalog._data["float1"].values()
+            )
+        )
+        nptest.assert_array_equal(frame["int1"].to_numpy(), datalog.get_data("int1"))
+
+    def test_columnar_trend(self):
+        datalog = DataLogger(storage="columnar")
+        for k in range(5):
+            datalog["f"] = 2.0 * k
+            datalog.next_record()
+        self.assertAlmostEqual(datalog.trend("f", 3), 2.0)
+
+        datalog["f"] = 10.0
+        self.assertAlmostEqual(datalog.trend("f", 3, includecurrent=True), 2.0)
+        self.assertEqual(len(datalog.get_data("f")), 5)
+
 
 class TestDataLoggerPlot(unittest.TestCase):
     def setUp(self):
@@ -148,6 +463,151 @@ class TestDataLoggerPlot(unittest.TestCase):
         # datalog.plot_close()
         datalog.plot_hold()
 
+    @mock.patch.dict(os.environ, {"SPY_PYTHONPATH": ""})
+    def test_blit_plot(self):
+        # Pretend to run inside Spyder so the Agg backend is left alone
+        matplotlib.use("Agg")
+        datalog = self.create_test_instance(kwargs={"plot_blit": True})
+        datalog.plot_add("x1", "y1", axes=(0, 0), title="Axes 0")
+        datalog.plot_add("x1", "y2", axes=1, title="Axes 1")
+
+        for p2 in range(0, 3):
+            for p1 in range(0, 10):
+                datalog["x1"] = p1
+                datalog["y1"] = (p1 + p2) ** 2
+                datalog["y2"] = 1 / (1 + (p1 + p2) ** 2)
+                datalog.next_record()
+                datalog.plot_update()
+
+            # One line per group, each holding only its own group
+            line = datalog._ax[0, 0].lines[-1]
+            self.assertEqual(len(line.get_xdata()), 10)
+            self.assertEqual(line.get_ydata()[-1], (9 + p2) ** 2)
+            self.assertGreaterEqual(datalog._ax[0, 0].get_ylim()[1], (9 + p2) ** 2)
+            datalog.next_group()
+
+        self.assertEqual(len(datalog._ax[0, 0].lines), 3)
+
+    @mock.patch.dict(os.environ, {"SPY_PYTHONPATH": ""})
+    def test_plot_rate_limit(self):
+        matplotlib.use("Agg")
+        datalog = self.create_test_instance(
+            kwargs={"plot_blit": True, "plot_fps": 1e-3}
+        )
+        datalog.plot_add("x1", "y1", axes=1)
+
+        for p1 in range(0, 5):
+            datalog["x1"] = p1
+            datalog["y1"] = p1
+            datalog.next_record()
+            datalog.plot_update()
+
+        # Only the first call draws.  The rest is picked up by the next refresh
+        self.assertEqual(len(datalog._ax[0, 1].lines[-1].get_xdata()), 1)
+        datalog.plot_update(force=True)
+        self.assertEqual(len(datalog._ax[0, 1].lines[-1].get_xdata()), 5)
+
+    @mock.patch.dict(os.environ, {"SPY_PYTHONPATH": ""})
+    def test_plot_rate_limit_groups(self):
+        matplotlib.use("Agg")
+        datalog = self.create_test_instance(
+            kwargs={"plot_blit": True, "plot_fps": 1e-3}
+        )
+        datalog.plot_add("x1", "y1", axes=1)
+
+        for p2 in range(2):
+            for p1 in range(5):
+                datalog["x1"] = p1
+                datalog["y1"] = p1 + 10 * p2
+                datalog.next_record()
+                datalog.plot_update()
+            datalog.next_group()
+        datalog.plot_update(force=True)
+
+        # Groups finished between refreshes are drawn in full
+        lines = datalog._ax[0, 1].lines
+        self.assertEqual(len(lines), 3)
+        self.assertListEqual(list(lines[0].get_ydata()), [0, 1, 2, 3, 4])
+        self.assertListEqual(list(lines[1].get_ydata()), [10, 11, 12, 13, 14])
+        self.assertEqual(len(lines[2].get_xdata()), 0)
+
+
+class TestDataLoggerPublish(unittest.TestCase):
+    def read_messages(self, client, count):
+        messages = []
+        buffer = b""
+        while len(messages) < count:
+            buffer += client.recv(65536)
+            *lines, buffer = buffer.split(b"\n")
+            messages += [json.loads(line) for line in lines]
+        return messages
+
+    def test_publish(self):
+        datalog = DataLogger(plot_publish=0)
+        datalog.plot_add("x1", "y1", axes=(0, 0), title="Axes 0")
+
+        for p1 in range(3):
+            datalog["x1"] = p1
+            datalog["y1"] = p1**2
+            datalog.next_record()
+
+        # Viewer attaching mid-group gets the plots and the current group
+        client = socket.create_connection(("127.0.0.1", datalog.plot_publisher.port))
+        client.settimeout(5)
+        datalog.next_group()
+        datalog["x1"] = 10
+        datalog["y1"] = 100
+        datalog.next_record()
+
+        messages = self.read_messages(client, 6)
+        self.assertEqual(messages[0]["type"], "hello")
+        self.assertEqual(messages[0]["plots"][0]["x"], "x1")
+        self.assertEqual([m["type"] for m in messages[1:4]], ["record"] * 3)
+        self.assertEqual(messages[4], {"type": "group", "group": 1})
+        self.assertEqual(messages[5]["data"]["y1"], 100)
+
+        viewer = PlotViewer()
+        for message in messages:
+            viewer.handle_message(message)
+        self.assertListEqual(viewer.get_group(0, "y1"), [0, 1, 4])
+        self.assertListEqual(viewer.get_group(1, "x1"), [10])
+
+        client.close()
+        datalog.close()
+
+    def test_viewer_groups(self):
+        viewer = PlotViewer(max_groups=2)
+        plots = [{"axes": 0, "x": "x1", "y": "y1", "title": "Axes 0"}]
+        viewer.handle_message({"type": "hello", "plots": plots, "group": 0})
+        for group in range(3):
+            if group:
+                viewer.handle_message({"type": "group", "group": group})
+            for x in range(3):
+                data = {"x1": x, "y1": group * 10 + x}
+                viewer.handle_message({"type": "record", "data": data})
+        viewer.draw()
+
+        # Oldest group was dropped
+        self.assertListEqual(list(viewer.groups), [1, 2])
+        ax = viewer._ax.ravel()[0]
+        self.assertEqual(len(ax.lines), 2)
+
+        # New records update the existing line of the current group
+        line = viewer._lines[(0, 2)]
+        viewer.handle_message({"type": "record", "data": {"x1": 3, "y1": 23}})
+        viewer.draw()
+        self.assertIs(viewer._lines[(0, 2)], line)
+        self.assertListEqual(list(line.get_ydata()), [20, 21, 22, 23])
+        self.assertEqual(len(ax.lines), 2)
+
+        viewer.handle_message({"type": "group", "group": 3})
+        viewer.handle_message({"type": "record", "data": {"x1": 0, "y1": 30}})
+        viewer.draw()
+        self.assertListEqual(sorted(key[1] for key in viewer._lines), [2, 3])
+        self.assertEqual(len(ax.lines), 2)
+        self.assertEqual(viewer._lines[(0, 3)].get_label(), "y1")
+        self.assertEqual(viewer._lines[(0, 2)].get_label(), "_nolegend_")
+
 
 if __name__ == "__main__":
     # import sys;sys.argv = ['', 'Test.testName']
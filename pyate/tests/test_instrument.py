@@ -1,5 +1,80 @@
+import asyncio
+import time
 import unittest
-from pyate import instrument
+from pyvisa import errors as visa_errors
+from pyate import DataLogger, instrument
+from pyate.instrument import RetryPolicy, StepExecutor
+from pyate.instrument.error import InstrumentIOError, InstrumentUnhealthyError
+from pyate.instrument.instrument import split_responses
+from pyate.instrument.oscilloscope import Oscilloscope
+from pyate.instrument.powermeter import PowerMeterGigatronics, PowerMeterKeysight
+from pyate.instrument.powersupply import PowerSupplyKeysight
+from pyate.instrument.statistics import scpi_header, summarize
+from pyate.instrument.waveformgenerator import WaveformGenerator
+
+
+class FakeResource(object):
+    """
+    Stand-in for a pyvisa resource that answers queries from a dict
+
+    Queries combined with ";" are answered in one reply when combine is True.
+    Otherwise only the first query of a message is answered, like instruments
+    that do not support combined queries.
+    """
+
+    def __init__(self, responses=None, combine=True, resource_name="", latency=0.0):
+        self.responses = {"*IDN?": "Fake,Model1,0001,1.0"}
+        if responses is not None:
+            self.responses.update(responses)
+        self.combine = combine
+        self.resource_name = resource_name
+        self.latency = latency
+        self.read_termination = "\n"
+        self.writes = []
+        self.reads = 0
+        self.stb = []
+        self.times = []
+        self.clears = 0
+        self.failures = []
+        self.opened = 0
+        self._pending = []
+
+    def open(self):
+        self.opened += 1
+
+    def close(self):
+        pass
+
+    def clear(self):
+        self.clears += 1
+        self._pending = []
+
+    def write(self, command):
+        if self.failures:
+            raise self.failures.pop(0)
+        self.times.append(("write", time.monotonic()))
+        self.writes.append(command)
+        parts = [part.lstrip(":") for part in command.split(";")]
+        if not self.combine:
+            parts = parts[:1]
+        replies = [self.responses[part] for part in parts if part.endswith("?")]
+        if replies:
+            self._pending.append(";".join(replies))
+
+    def read(self):
+        time.sleep(self.latency)
+        self.times.append(("read", time.monotonic()))
+        self.reads += 1
+        if not self._pending:
+            raise InstrumentIOError("Timeout")
+        return self._pending.pop(0)
+
+    def query(self, command):
+        self.write(command)
+        return self.read()
+
+    def read_stb(self):
+        return self.stb.pop(0) if self.stb else 0
 
 
 class TestInstrument(unittest.TestCase):
@@ -14,4 +89,575 @@ class TestInstrument(unittest.TestCase):
     def test_register_instrument(self):
         self.IM.register_instrument(['model1'], instrument.Instrument)
         self.assertIn('model1', self.IM._models)
-        self.assertNotIn('model2', self.IM._models)
\ No newline at end of file
+        self.assertNotIn('model2', self.IM._models)
+
+
+class TestQueryMany(unittest.TestCase):
+    responses = {
+        "A?": "1",
+        "B?": '"x;y"',
+        "SYST:ERR?": '0,"No error"',
+    }
+
+    def test_split_responses(self):
+        self.assertListEqual(split_responses('1; "a;b" ;2'), ["1", '"a;b"', "2"])
+        self.assertListEqual(split_responses("1.5\n"), ["1.5"])
+
+    def test_combined(self):
+        resource = FakeResource(self.responses)
+        inst = instrument.Instrument(resource=resource)
+        result = inst.query_many(["A?", "B?", ":SYST:ERR?"])
+        self.assertListEqual(result, ["1", '"x;y"', '0,"No error"'])
+        self.assertListEqual(resource.writes[-1:], [":A?;:B?;:SYST:ERR?"])
+
+    def test_chunks(self):
+        resource = FakeResource(self.responses)
+        inst = instrument.Instrument(resource=resource)
+        inst.combine_queries_max = 2
+        result = inst.query_many(["A?"] * 5)
+        self.assertListEqual(result, ["1"] * 5)
+        self.assertEqual(len(resource.writes), 1 + 3)
+
+    def test_fallback(self):
+        resource = FakeResource(self.responses, combine=False)
+        inst = instrument.Instrument(resource=resource)
+        self.assertListEqual(inst.query_many(["A?", "B?"]), ["1", '"x;y"'])
+        self.assertFalse(inst.combine_queries)
+        self.assertEqual(resource.clears, 1)
+        writes = len(resource.writes)
+        self.assertListEqual(inst.query_many(["B?", "A?"]), ['"x;y"', "1"])
+        self.assertListEqual(resource.writes[writes:], ["B?", "A?"])
+
+    def test_errors_propagate(self):
+        resource = FakeResource(self.responses)
+        inst = instrument.Instrument(
+            resource=resource, retry_policy=RetryPolicy(retries=1)
+        )
+        resource.failures = [visa_errors.VisaIOError(visa_errors.VI_ERROR_TMO)]
+        with self.assertRaises(InstrumentIOError):
+            inst.query_many(["A?", "B?"])
+        self.assertTrue(inst.combine_queries)
+
+        inst.retry_policy.failure_threshold = 1
+        resource.failures = [visa_errors.VisaIOError(visa_errors.VI_ERROR_TMO)]
+        with self.assertRaises(InstrumentIOError):
+            inst.query_many(["A?", "B?"])
+        with self.assertRaises(InstrumentUnhealthyError):
+            inst.query_many(["A?", "B?"])
+        self.assertTrue(inst.combine_queries)
+        self.assertListEqual(resource.writes[1:], [])
+
+    def test_power_meter_settings(self):
+        responses = {
+            "INIT1:CONT?": "1",
+            "TRIG1:SOUR?": "IMM",
+            "SENS1:SPE?": "40",
+            "SENS1:AVER?": "1",
+            "SENS1:AVER:COUN:AUTO?": "0",
+            "SENS1:AVER:COUN?": "16",
+            "SENS1:CORR:GAIN2:STAT?": "1",
+            "SENS1:CORR:GAIN2?": "+1.50000000E+001",
+            "SENS1:CORR:DCYC:STAT?": "0",
+            "SENS1:CORR:DCYC?": "+1.000E+000",
+        }
+        resource = FakeResource(responses)
+        pm = PowerMeterKeysight(resource=resource, channel=1)
+        writes = len(resource.writes)
+        settings = pm.get_settings()
+        self.assertEqual(len(resource.writes) - writes, 1)
+        self.assertDictEqual(
+            settings,
+            {
+                "continuous": True,
+                "trigger_source": "IMM",
+                "readings_per_second": 40,
+                "averaging": 16,
+                "offset": 15.0,
+                "dutycycle": False,
+            },
+        )
+
+    def test_oscilloscope(self):
+        responses = {
+            "CURSor:TRACk:AXValue?": "1e-6",
+            "CURSor:TRACk:BXValue?": "2e-6",
+            "CURSor:TRACk:AYValue?": "0.5",
+            "CURSor:TRACk:BYValue?": "1.5",
+            "TRIG:MODE?": "EDGE",
+            "TRIG:STAT?": "TD",
+            "TRIG:EDGe:LEVel?": "1.2",
+            "TRIG:EDGe:SOUR?": "CHAN1",
+            "TRIG:EDGe:SLOP?": "POS",
+        }
+        resource = FakeResource(responses)
+        scope = Oscilloscope(resource=resource)
+        self.assertDictEqual(
+            scope.get_cursor_values(), {"ax": 1e-6, "bx": 2e-6, "ay": 0.5, "by": 1.5}
+        )
+        self.assertDictEqual(
+            scope.get_trigger(),
+            {
+                "mode": "EDGE",
+                "status": "TD",
+                "level": 1.2,
+                "source": "CHAN1",
+                "slope": "POS",
+            },
+        )
+
+        # Edge settings are only queried in edge mode
+        responses["TRIG:MODE?"] = "GLIT"
+        resource = FakeResource(responses)
+        scope = Oscilloscope(resource=resource)
+        self.assertDictEqual(scope.get_trigger(), {"mode": "GLIT", "status": "TD"})
+        self.assertListEqual(resource.writes[1:], [":TRIG:MODE?;:TRIG:STAT?"])
+
+
+class TestPacing(unittest.TestCase):
+    def construct(self, gap=0.0):
+        resource = FakeResource({"*OPC?": "1", "A?": "1"})
+        inst = instrument.Instrument(resource=resource)
+        inst.min_command_gap = gap
+        return inst
+
+    def test_min_command_gap(self):
+        inst = self.construct(gap=0.05)
+        start = time.monotonic()
+        for k in range(3):
+            inst.write("A")
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+    def test_gap_already_elapsed(self):
+        inst = self.construct(gap=0.05)
+        inst.write("A")
+        time.sleep(0.06)
+        start = time.monotonic()
+        inst.write("A")
+        self.assertLess(time.monotonic() - start, 0.04)
+
+    def test_write_delay_blocks(self):
+        inst = self.construct()
+        start = time.monotonic()
+        inst.write("A", delay=0.1)
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+    def test_settle(self):
+        resource = FakeResource({"*OPC?": "1"})
+        wg = WaveformGenerator(resource=resource)
+        start = time.monotonic()
+        wg.set_output_state(1, True)
+        # The output has settled when set_output_state returns
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+        self.assertListEqual(resource.writes[-2:], [":OUTP1 ON", "*OPC?"])
+
+        # Time spent waiting for *OPC? counts towards the settling time
+        resource.latency = 0.06
+        start = time.monotonic()
+        wg.set_output_state(1, False)
+        self.assertLess(time.monotonic() - start, 0.15)
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+    def test_hold_off(self):
+        inst = self.construct()
+        inst.hold_off(0.05)
+        start = time.monotonic()
+        self.assertEqual(inst.query("A?"), "1")
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+
+    def test_power_meter_read_gap(self):
+        meters = [
+            PowerMeterKeysight(resource=FakeResource({"FETC1?": "-10.5"}), channel=1),
+            PowerMeterGigatronics(resource=FakeResource({"1P?": "-10.5"})),
+        ]
+        for meter in meters:
+            meter.resource.times = []
+            self.assertEqual(meter.measure_power(channel=1), -10.5)
+            (op_write, t_write), (op_read, t_read) = meter.resource.times
+            self.assertEqual((op_write, op_read), ("write", "read"))
+            self.assertGreaterEqual(t_read - t_write, 0.05)
+
+    def test_power_meter_timing(self):
+        # No slower than the fixed 50 ms sleep before each read it replaces
+        meter = PowerMeterKeysight(
+            resource=FakeResource({"FETC1?": "-10.5"}), channel=1
+        )
+        start = time.monotonic()
+        meter.set_settings(continuous=True, trigger_source="IMM")
+        for k in range(2):
+            meter.measure_power()
+        meter.set_settings(readings_per_second=40)
+        for k in range(5):
+            meter.write("SENS1:AVER 0")
+        self.assertLess(time.monotonic() - start, 0.14)
+
+    def test_wait_complete(self):
+        inst = self.construct()
+        self.assertTrue(inst.wait_complete())
+        self.assertEqual(inst.resource.writes[-1], "*OPC?")
+
+        inst.complete_method = "stb"
+        inst.stb_busy_mask = 1 << 7
+        inst.resource.stb = [0x80, 0x80, 0x04]
+        self.assertTrue(inst.wait_complete())
+        self.assertListEqual(inst.resource.stb, [])
+
+        inst.resource.stb = [0x80] * 1000
+        self.assertFalse(inst.poll_status(1 << 7, timeout=0.02))
+
+
+class TestStateCache(unittest.TestCase):
+    def construct(self, **kwargs):
+        resource = FakeResource({"*OPC?": "1", "VOLT?": "5"})
+        return PowerSupplyKeysight(resource=resource, channel=1, **kwargs)
+
+    def sent(self, psu, action):
+        start = len(psu.resource.writes)
+        action()
+        return psu.resource.writes[start:]
+
+    def test_disabled_by_default(self):
+        psu = self.construct()
+        psu.set_voltage(5)
+        self.assertListEqual(
+            self.sent(psu, lambda: psu.set_voltage(5)), ["INST:NSEL 1", "VOLT 5"]
+        )
+
+    def test_channel_context(self):
+        psu = self.construct(state_cache=True)
+        psu.set_voltage(5)
+        self.assertListEqual(self.sent(psu, lambda: psu.set_voltage(5)), [])
+        self.assertListEqual(self.sent(psu, lambda: psu.set_voltage(6)), ["VOLT 6"])
+        self.assertListEqual(
+            self.sent(psu, lambda: psu.set_voltage(6, channel=2)),
+            ["INST:NSEL 2", "VOLT 6"],
+        )
+        self.assertListEqual(
+            self.sent(psu, lambda: psu.set_voltage(6, channel=1)), ["INST:NSEL 1"]
+        )
+        # Queries still select the channel through the cache
+        self.assertListEqual(self.sent(psu, lambda: psu.get_voltage()), ["VOLT?"])
+
+    def test_invalidate(self):
+        psu = self.construct(state_cache=True)
+        psu.set_voltage(5)
+        psu.write("*RST")
+        self.assertEqual(len(self.sent(psu, lambda: psu.set_voltage(5))), 2)
+
+        psu.write(":SYSTem:PREset")
+        self.assertEqual(len(self.sent(psu, lambda: psu.set_voltage(5))), 2)
+
+        psu.write("VOLT 6;CURR 1")
+        self.assertEqual(len(self.sent(psu, lambda: psu.set_voltage(5))), 2)
+
+        psu.invalidate_state("volt")
+        self.assertListEqual(self.sent(psu, lambda: psu.set_voltage(5)), ["VOLT 5"])
+
+        psu.reset()
+        self.assertEqual(len(self.sent(psu, lambda: psu.set_voltage(5))), 2)
+
+    def test_global_header(self):
+        psu = self.construct(state_cache=True)
+        psu.set_output_state(True, channel=1)
+        psu.set_output_state(False, channel=2)
+        self.assertListEqual(
+            self.sent(psu, lambda: psu.set_output_state(True, channel=1)),
+            ["INST:NSEL 1", ":OUTP ON"],
+        )
+        self.assertListEqual(
+            self.sent(psu, lambda: psu.set_output_state(True, channel=2)),
+            ["INST:NSEL 2"],
+        )
+
+    def test_actions_always_sent(self):
+        psu = self.construct(state_cache=True)
+        for command in [
+            "CAL:ZERO:AUTO ONCE",
+            "CAL:ZERO:AUTO ONCE",
+            ":INIT1:CONT 1",
+            ":INIT1:CONT 1",
+            "TRIGger:SOURce IMM",
+            "TRIGger:SOURce IMM",
+        ]:
+            self.assertListEqual(
+                self.sent(psu, lambda: psu.write(command)), [command]
+            )
+
+    def test_events_always_sent(self):
+        psu = self.construct(state_cache=True)
+        for command in ["INIT", "*TRG", "INIT"]:
+            self.assertListEqual(
+                self.sent(psu, lambda: psu.write(command)), [command]
+            )
+        # Combined queries do not change the cached settings
+        psu.set_voltage(5)
+        psu.query_many(["VOLT?", "VOLT?"])
+        self.assertListEqual(self.sent(psu, lambda: psu.set_voltage(5)), [])
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def construct(self, **kwargs):
+        kwargs.setdefault("backoff", 0.001)
+        resource = FakeResource()
+        inst = instrument.Instrument(
+            resource=resource, retry_policy=RetryPolicy(**kwargs)
+        )
+        return inst, resource
+
+    def timeout(self):
+        return visa_errors.VisaIOError(visa_errors.VI_ERROR_TMO)
+
+    def test_retry(self):
+        inst, resource = self.construct()
+        resource.failures = [self.timeout(), self.timeout()]
+        inst.write("A")
+        self.assertListEqual(resource.writes[-1:], ["A"])
+        counters = inst.retry_policy.get_counters()
+        self.assertEqual(counters["retries"], 2)
+        self.assertEqual(counters["successes"], 1)
+        self.assertDictEqual(counters["errors"], {"timeout": 2})
+        self.assertGreater(counters["backoff_time"], 0)
+
+    def test_retries_argument(self):
+        inst, resource = self.construct()
+        # Positional retries argument is honoured
+        resource.failures = [self.timeout()] * 2
+        with self.assertRaisesRegex(InstrumentIOError, "Instrument.write"):
+            inst.write("A", 0.0, 2)
+        resource.failures = [self.timeout()] * 4
+        inst.write("A", retries=5)
+        self.assertEqual(inst.retry_policy.get_counters()["failures"], 1)
+
+    def test_budget(self):
+        inst, resource = self.construct(budgets={"connection": 1})
+        lost = visa_errors.VisaIOError(visa_errors.VI_ERROR_CONN_LOST)
+        resource.failures = [lost, self.timeout()]
+        opened = resource.opened
+        with self.assertRaises(InstrumentIOError):
+            inst.write("A")
+        self.assertEqual(resource.opened, opened + 1)
+        # Gave up on the connection error without trying again
+        self.assertEqual(len(resource.failures), 1)
+
+    def test_not_retried(self):
+        inst, resource = self.construct()
+        error = visa_errors.VisaIOError(visa_errors.VI_ERROR_RSRC_NFOUND)
+        resource.failures = [error]
+        with self.assertRaises(visa_errors.VisaIOError):
+            inst.write("A")
+        self.assertEqual(inst.retry_policy.get_counters()["retries"], 0)
+
+    def test_circuit_breaker(self):
+        inst, resource = self.construct(
+            retries=1, failure_threshold=2, recovery_time=0.05
+        )
+        resource.failures = [self.timeout()] * 2
+        for k in range(2):
+            with self.assertRaises(InstrumentIOError):
+                inst.write("A")
+        self.assertFalse(inst.retry_policy.healthy)
+
+        writes = len(resource.writes)
+        with self.assertRaises(InstrumentUnhealthyError):
+            inst.write("A")
+        self.assertEqual(len(resource.writes), writes)
+
+        # Trial operation after the recovery time closes the breaker
+        time.sleep(0.06)
+        inst.write("A")
+        counters = inst.retry_policy.get_counters()
+        self.assertTrue(counters["healthy"])
+        self.assertEqual(counters["trips"], 1)
+        self.assertEqual(counters["rejected"], 1)
+
+    def test_breaker_ignores_other_errors(self):
+        inst, resource = self.construct(retries=1, failure_threshold=1)
+        resource.failures = [ValueError("driver bug")]
+        with self.assertRaises(ValueError):
+            inst.write("A")
+        with self.assertRaises(ValueError):
+            inst.retry_policy.run(lambda: int("x"))
+        counters = inst.retry_policy.get_counters()
+        self.assertTrue(counters["healthy"])
+        self.assertEqual(counters["failures"], 0)
+
+        # Unrecoverable I/O errors still count
+        resource.failures = [
+            visa_errors.VisaIOError(visa_errors.VI_ERROR_RSRC_NFOUND)
+        ]
+        with self.assertRaises(visa_errors.VisaIOError):
+            inst.write("A")
+        self.assertFalse(inst.retry_policy.healthy)
+
+    def test_delay(self):
+        policy = RetryPolicy(backoff=0.1, backoff_max=0.3, jitter=0.0)
+        delays = [policy.get_delay(k) for k in range(4)]
+        for a, b in zip(delays, [0.1, 0.2, 0.3, 0.3]):
+            self.assertAlmostEqual(a, b)
+        policy.jitter = 0.5
+        for k in range(20):
+            self.assertTrue(0.05 <= policy.get_delay(0) <= 0.1)
+
+
+class TestIOStatistics(unittest.TestCase):
+    def test_scpi_header(self):
+        self.assertEqual(scpi_header(":sour1:volt 5"), "SOUR1:VOLT")
+        self.assertEqual(scpi_header("VOLT?"), "VOLT?")
+        self.assertEqual(scpi_header(":A?;:B?"), "A?;...")
+        self.assertEqual(scpi_header("*OPC;"), "*OPC")
+
+    def test_record(self):
+        resource = FakeResource({"VOLT?": "5.000"})
+        inst = instrument.Instrument(resource=resource)
+        inst.io_stats.reset()
+        for k in range(3):
+            inst.write(f"VOLT {k}")
+            inst.query("VOLT?")
+        resource.failures = [visa_errors.VisaIOError(visa_errors.VI_ERROR_TMO)]
+        inst.retry_policy.backoff = 0.001
+        inst.write("VOLT 1")
+
+        frame = inst.io_stats.to_dataframe().set_index(["operation", "header"])
+        self.assertEqual(frame.loc[("write", "VOLT"), "count"], 4)
+        self.assertEqual(frame.loc[("write", "VOLT"), "bytes"], 4 * 6)
+        self.assertEqual(frame.loc[("write", "VOLT"), "retries"], 1)
+        self.assertEqual(frame.loc[("write", "VOLT?"), "count"], 3)
+        self.assertEqual(frame.loc[("read", "VOLT?"), "bytes"], 3 * 5)
+        histogram = inst.io_stats.get_histogram("read", "VOLT?")
+        self.assertEqual(sum(count for edge, count in histogram), 3)
+        self.assertEqual(histogram[-1][0], float("inf"))
+
+    def test_sleep_and_report(self):
+        inst = instrument.Instrument(resource=FakeResource({"A?": "1"}))
+        inst.min_command_gap = 0.02
+        inst.write("A")
+        inst.write("A")
+        self.assertGreater(inst.io_stats.sleep_time, 0.01)
+        report = inst.io_stats.report(limit=1)
+        self.assertIn("Waiting", report)
+        self.assertEqual(len(report.splitlines()), 3)
+
+        other = instrument.Instrument(resource=FakeResource({"A?": "1"}))
+        other.query("A?")
+        frame = summarize([inst, other])
+        self.assertListEqual(
+            sorted(frame["instrument"].unique()), ["Instrument", "Instrument_1"]
+        )
+
+    def test_disabled(self):
+        inst = instrument.Instrument(resource=FakeResource())
+        inst.io_stats.enabled = False
+        inst.io_stats.reset()
+        inst.write("A")
+        self.assertEqual(len(inst.io_stats.to_dataframe()), 0)
+
+
+class TestAsyncInstrument(unittest.TestCase):
+    def construct(self, resource_name, latency=0.1):
+        resource = FakeResource(
+            {"VOLT?": "5"}, resource_name=resource_name, latency=latency
+        )
+        return PowerSupplyKeysight(resource=resource, channel=1)
+
+    def test_bus_id(self):
+        names = {
+            "GPIB0::12::INSTR": "GPIB0",
+            "gpib1::5::INSTR": "GPIB1",
+            "TCPIP0::192.168.1.10::inst0::INSTR": "TCPIP0::192.168.1.10",
+            "TCPIP0::192.168.1.10::gpib0,7::INSTR": "TCPIP0::192.168.1.10",
+            "PROLOGIX::172.29.92.133::1234::13": "PROLOGIX::172.29.92.133",
+            "ASRL/dev/ttyUSB0::INSTR": "ASRL/dev/ttyUSB0::INSTR",
+        }
+        for name, bus_id in names.items():
+            inst = self.construct(name, latency=0.0)
+            self.assertEqual(inst.get_bus_id(), bus_id)
+        inst = self.construct("", latency=0.0)
+        self.assertTrue(inst.get_bus_id().startswith("resource-"))
+
+    def run_concurrently(self, *instruments):
+        async def step():
+            devices = [inst.as_async() for inst in instruments]
+            return await asyncio.gather(*[d.get_voltage() for d in devices])
+
+        start = time.monotonic()
+        result = asyncio.run(step())
+        return result, time.monotonic() - start
+
+    def test_concurrent(self):
+        result, duration = self.run_concurrently(
+            self.construct("TCPIP0::10.0.0.1::inst0::INSTR"),
+            self.construct("TCPIP0::10.0.0.2::inst0::INSTR"),
+            self.construct("TCPIP0::10.0.0.3::inst0::INSTR"),
+        )
+        self.assertListEqual(result, [5.0, 5.0, 5.0])
+        self.assertLess(duration, 0.25)
+
+    def test_shared_bus(self):
+        result, duration = self.run_concurrently(
+            self.construct("GPIB0::1::INSTR"), self.construct("GPIB0::2::INSTR")
+        )
+        self.assertListEqual(result, [5.0, 5.0])
+        self.assertGreaterEqual(duration, 0.2)
+
+    def test_methods(self):
+        inst = self.construct("GPIB0::3::INSTR", latency=0.0)
+        device = inst.as_async()
+
+        async def step():
+            await device.write("VOLT 4")
+            return await device.query("VOLT?")
+
+        self.assertEqual(asyncio.run(step()), "5")
+        self.assertEqual(device.driver_name, "PowerSupplyKeysight")
+        self.assertEqual(device.set_voltage.__name__, "set_voltage")
+
+
+class TestStepExecutor(unittest.TestCase):
+    def construct(self, resource_name, latency=0.1):
+        resource = FakeResource(
+            {"MEAS:CURR?": "0.25", "MEAS:VOLT?": "3.3"},
+            resource_name=resource_name,
+            latency=latency,
+        )
+        return PowerSupplyKeysight(resource=resource, channel=1)
+
+    def test_run(self):
+        psu1 = self.construct("GPIB0::1::INSTR")
+        psu2 = self.construct("GPIB0::2::INSTR")
+        psu3 = self.construct("TCPIP0::10.0.0.1::inst0::INSTR")
+        with StepExecutor() as step:
+            step.add("i1", psu1.measure_current)
+            step.add("v2", psu2.measure_voltage, channel=2)
+            step.add("i3", psu3.measure_current)
+            step.add("scale", lambda x: 2 * x, 4)
+            self.assertListEqual(
+                list(step.get_buses().values()), [["i1", "v2"], ["i3"], ["scale"]]
+            )
+
+            datalog = DataLogger()
+            start = time.monotonic()
+            results = step.run(datalog)
+            duration = time.monotonic() - start
+
+        self.assertListEqual(list(results), ["i1", "v2", "i3", "scale"])
+        self.assertDictEqual(
+            dict(results), {"i1": 0.25, "v2": 3.3, "i3": 0.25, "scale": 8}
+        )
+        self.assertEqual(datalog["v2"], 3.3)
+        # GPIB0 calls are serialized, TCPIP call overlaps them
+        self.assertGreaterEqual(duration, 0.2)
+        self.assertLess(duration, 0.3)
+
+    def test_duplicate_name(self):
+        step = StepExecutor()
+        step.add("a", time.time)
+        with self.assertRaises(KeyError):
+            step.add("a", time.time)
+
+    def test_error(self):
+        psu = self.construct("GPIB0::1::INSTR", latency=0.0)
+        step = StepExecutor()
+        step.add("bad", psu.query, "NOPE?")
+        step.add("i", psu.measure_current)
+        with self.assertRaises(KeyError):
+            step.run()
+        step.shutdown()
@@ -3,10 +3,13 @@ Created on May 10, 2019
 
 @author: kyleh
 """
+
+from itertools import permutations, product
 import unittest
-from pyate import ParameterSweep
+from pyate import AdaptiveSweep, DataLogger, ParameterSweep
 
 import numpy as np
+import numpy.testing as nptest
 
 
 class TestParameterSweep(unittest.TestCase):
@@ -45,6 +48,217 @@ class TestParameterSweep(unittest.TestCase):
         print(self.pl.get("PC"))
         print(self.pl.get_last("PC"))
 
+    def test_lazy_list(self):
+        self.construct_sweep()
+        expected = list(product(range(1, 4), range(1, 4), np.arange(1.1, 4.1)))
+        result = self.pl.get_list()
+
+        self.assertEqual(len(result), 27)
+        self.assertListEqual(list(result), expected)
+        self.assertEqual(result[13], expected[13])
+        self.assertEqual(result[-1], expected[-1])
+        self.assertListEqual(result[5:20:3], expected[5:20:3])
+        self.assertRaises(IndexError, result.__getitem__, 27)
+
+    def test_lazy_large(self):
+        pl = ParameterSweep()
+        for k in range(6):
+            pl.set_parameter_range(f"P{k}", np.linspace(0, 1, 101))
+        pl.set_order([f"P{k}" for k in range(6)])
+        pl.compute()
+
+        self.assertEqual(len(pl.get_list()), 101**6)
+        self.assertEqual(pl.get_list()[-1], (1.0,) * 6)
+
+    def test_changes(self):
+        self.construct_sweep()
+        self.assertDictEqual(self.pl.get_changes(), {"PA": 1, "PB": 1, "PC": 1.1})
+        self.pl.next()
+        self.assertDictEqual(self.pl.get_changes(), {"PC": 2.1})
+        self.pl.next()
+        self.pl.next()
+        self.assertDictEqual(self.pl.get_changes(), {"PB": 2, "PC": 1.1})
+
+    def test_next_group(self):
+        self.construct_sweep()
+        self.pl.next()
+        self.pl.next_group()
+        self.assertEqual(self.pl.get_index(), 3)
+        self.assertEqual(self.pl.get_last("PC"), 2.1)
+        self.assertDictEqual(self.pl.get_changes(), {"PB": 2, "PC": 1.1})
+
+        # Already at the start of a group
+        self.pl.next_group()
+        self.assertEqual(self.pl.get_index(), 6)
+
+    def test_skip_dimension(self):
+        self.construct_sweep()
+        for k in range(4):
+            self.pl.next()
+        self.pl.skip_dimension("PB")
+        self.assertEqual(self.pl.get_current_tuple()[:2], (2, 1))
+        self.assertEqual(self.pl.get_index(), 9)
+
+        self.pl.skip_dimension(0)
+        self.assertTrue(self.pl.end())
+
+    def test_skip_to_end(self):
+        self.construct_sweep()
+        while not self.pl.end():
+            self.pl.next_group()
+        self.assertEqual(self.pl.get_index(), 27)
+
+    def construct_cost_sweep(self):
+        pl = ParameterSweep()
+        pl.set_parameter_range("freq", np.linspace(1e9, 2e9, 5))
+        pl.set_parameter_range("vdd", [3.0, 3.3])
+        pl.set_parameter_range("power", np.arange(-10, 11, 2))
+        pl.set_parameter_range("temp", 25)
+        pl.set_order(["temp", "power", "freq", "vdd"])
+        pl.set_parameter_cost("freq", cost=2.0)
+        pl.set_parameter_cost("vdd", cost=0.1, settle=0.5)
+        pl.set_parameter_cost("power", cost=0.05)
+        pl.set_parameter_cost("temp", cost=0.0, settle=600)
+        return pl
+
+    def count_changes(self, pl):
+        pl.compute()
+        changes = dict.fromkeys(pl._parameter_order, 0)
+        rows = list(pl.get_list())
+        for last, cur in zip(rows[:-1], rows[1:]):
+            for key, a, b in zip(pl._parameter_order, last, cur):
+                changes[key] += a != b
+        return changes
+
+    def test_serpentine(self):
+        self.construct_sweep()
+        self.pl.set_serpentine(True)
+        self.pl.compute()
+        rows = list(self.pl.get_list())
+        self.assertEqual(
+            sorted(rows), sorted(product(range(1, 4), range(1, 4), np.arange(1.1, 4.1)))
+        )
+        for last, cur in zip(rows[:-1], rows[1:]):
+            self.assertEqual(sum(a != b for a, b in zip(last, cur)), 1)
+        self.assertEqual(rows[3], (1, 2, 3.1))
+
+    def test_change_counts(self):
+        pl = self.construct_cost_sweep()
+        for serpentine in (False, True):
+            pl.set_serpentine(serpentine)
+            self.assertDictEqual(pl.get_change_counts(), self.count_changes(pl))
+
+    def test_optimize_order(self):
+        pl = self.construct_cost_sweep()
+        for serpentine in (False, True):
+            best = min(
+                pl.estimate_duration(order=order, serpentine=serpentine)
+                for order in permutations(pl._parameter_order)
+            )
+            order = pl.optimize_order(serpentine=serpentine)
+            self.assertEqual(order[0], "temp")
+            self.assertAlmostEqual(pl.estimate_duration(), best)
+
+    def test_estimate_duration(self):
+        pl = ParameterSweep()
+        pl.set_parameter_range("a", [1, 2])
+        pl.set_parameter_range("b", [1, 2, 3])
+        pl.set_order(["a", "b"])
+        pl.set_parameter_cost("a", cost=10.0)
+        pl.set_parameter_cost("b", cost=1.0, settle=1.0)
+        # a: set + 1 change, b: set + 5 changes
+        self.assertAlmostEqual(pl.estimate_duration(point_time=0.5), 20 + 12 + 3)
+        with self.assertRaises(KeyError):
+            pl.set_parameter_cost("c", 1.0)
+
+
+class TestAdaptiveSweep(unittest.TestCase):
+    @staticmethod
+    def gain(pin):
+        # Amplifier with 20 dB gain compressing around 0 dBm input
+        return 20 - 10 * np.log10(1 + 10 ** ((pin - 2) / 5))
+
+    def run_sweep(self, sweep):
+        while not sweep.end():
+            sweep.feed(self.gain(sweep["power"]))
+            sweep.next()
+        return sweep.get_points()
+
+    def test_coarse_then_refine(self):
+        sweep = AdaptiveSweep("power", -20, 10, num_coarse=7, max_points=20)
+        x_coarse = [sweep["power"]]
+        for k in range(7):
+            self.assertDictEqual(sweep.get_changes(), {"power": x_coarse[-1]})
+            sweep.feed(self.gain(sweep["power"]))
+            sweep.next()
+            x_coarse.append(sweep["power"])
+        self.assertListEqual(x_coarse[:7], [-20, -15, -10, -5, 0, 5, 10])
+        # Largest change in gain is between 5 and 10
+        self.assertEqual(x_coarse[7], 7.5)
+
+        x, y = self.run_sweep(sweep)
+        self.assertEqual(len(x), 20)
+        self.assertTrue(np.all(np.diff(x) > 0))
+        # Points concentrate in the compression region
+        self.assertGreater(np.sum(x > 0), np.sum(x < 0))
+
+    def test_threshold(self):
+        p1db = 19
+        sweep = AdaptiveSweep(
+            "power",
+            -20,
+            10,
+            num_coarse=4,
+            min_step=0.1,
+            thresholds=[p1db],
+            tolerance=1e9,
+            max_points=40,
+        )
+        x, y = self.run_sweep(sweep)
+        # Only the crossing gets refined, stopping at min_step
+        self.assertLess(len(x), 15)
+        k = np.nonzero(y < p1db)[0][0]
+        self.assertLessEqual(x[k] - x[k - 1], 0.2)
+        x_true = x[k - 1] + (x[k] - x[k - 1]) / 2
+        self.assertAlmostEqual(self.gain(x_true), p1db, delta=0.1)
+
+    def test_fewer_points(self):
+        # Same finest resolution as a uniform 0.3125 dB grid (97 points)
+        sweep = AdaptiveSweep(
+            "power",
+            -20,
+            10,
+            num_coarse=7,
+            min_step=0.25,
+            tolerance=0.2,
+            max_points=97,
+        )
+        x, y = self.run_sweep(sweep)
+        self.assertLess(len(x), 97 / 2)
+        # Flat small signal region is left coarse
+        self.assertEqual(np.sum(x < -10), 2)
+        self.assertAlmostEqual(np.min(np.diff(x)), 0.3125)
+
+    def test_feed_logger(self):
+        datalog = DataLogger()
+        sweep = AdaptiveSweep("power", 0, 1, num_coarse=3, max_points=3)
+        while not sweep.end():
+            datalog["power"] = sweep.get("power")
+            datalog["gain"] = 2 * sweep["power"]
+            datalog.next_record()
+            sweep.feed_logger(datalog, "gain")
+            sweep.next()
+        x, y = sweep.get_points()
+        nptest.assert_array_equal(y, [0, 1, 2])
+        self.assertEqual(sweep.get_last("power"), 1)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            AdaptiveSweep("power", 0, 1, num_coarse=5, max_points=3)
+        sweep = AdaptiveSweep("power", 0, 1, num_coarse=2, max_points=2)
+        with self.assertRaises(KeyError):
+            sweep["freq"]
+
 
 if __name__ == "__main__":
     # import sys;sys.argv = ['', 'Test.testName']
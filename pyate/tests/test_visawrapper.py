@@ -1,5 +1,8 @@
+import threading
+import time
 import unittest
 from pyate import visawrapper
+from pyate.visawrapper import prologix
 
 
 class TestVisawrapper(unittest.TestCase):
@@ -18,3 +21,120 @@ class TestVisawrapper(unittest.TestCase):
 
     def test_get_resource_missing(self):
         self.assertRaises(KeyError, self.rm.getResource, "non_existant")
+
+
+class FakePrologix(prologix.PrologixEthernet):
+    """PrologixEthernet talking to simulated instruments instead of a socket.
+
+    Instruments answer "X?" with "<addr>:X" on the currently selected address.
+    """
+
+    def open(self):
+        self._stream = bytearray()
+        self._hw_addr = None
+
+    def close(self):
+        pass
+
+    def testSocket(self):
+        pass
+
+    def write_raw(self, message, delay=0.0):
+        # Give other threads a chance to interfere
+        time.sleep(0.0005)
+        if message.startswith("++addr "):
+            self._hw_addr = int(message.split()[1])
+        elif not message.startswith("++") and message.endswith("?"):
+            self._stream.extend(f"{self._hw_addr}:{message[:-1]}\n".encode())
+
+    def read_raw(self, count, buffer, term_char_en=True, timeout=None):
+        time.sleep(0.0005)
+        buffer.extend(self._stream)
+        self._stream.clear()
+        if term_char_en and b"\n" in buffer:
+            return prologix.StatusCode.success_termination_character_read
+        return prologix.StatusCode.error_timeout
+
+
+class TestPrologixLocking(unittest.TestCase):
+    def setUp(self):
+        self.controller = FakePrologix("127.0.0.1")
+        prologix.ResourceManager._prologixManager["127.0.0.1"] = self.controller
+
+    def tearDown(self):
+        del prologix.ResourceManager._prologixManager["127.0.0.1"]
+
+    def test_shared_controller(self):
+        resources = [
+            prologix.ResourceManager.open_resource(f"PROLOGIX::127.0.0.1::{n}")
+            for n in (3, 5, 7)
+        ]
+        self.assertTrue(all(r.interface is self.controller for r in resources))
+        errors = []
+
+        def worker(resource, n):
+            for k in range(20):
+                reply = resource.query(f"Q{n}_{k}?")
+                if reply != f"{resource._addr}:Q{n}_{k}":
+                    errors.append(reply)
+
+        threads = [
+            threading.Thread(target=worker, args=(r, n))
+            for n, r in enumerate(resources)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertListEqual(errors, [])
+        # Queries to one address are grouped instead of switching every time
+        self.assertLess(self.controller.address_switches, 3 * 20)
+
+    def test_coalescing(self):
+        lock = prologix.ControllerLock()
+        order = []
+
+        def worker(addr):
+            with lock.hold(addr):
+                order.append(addr)
+
+        lock.acquire(1)
+        threads = []
+        for addr in (2, 1, 2, 1):
+            threads.append(threading.Thread(target=worker, args=(addr,)))
+            threads[-1].start()
+            time.sleep(0.02)
+        lock.release()
+        for t in threads:
+            t.join()
+        self.assertListEqual(order[:2], [1, 1])
+
+    def test_max_batch(self):
+        lock = prologix.ControllerLock(max_batch=1)
+        order = []
+
+        def worker(addr):
+            with lock.hold(addr):
+                order.append(addr)
+
+        lock.acquire(1)
+        threads = []
+        for addr in (2, 1):
+            threads.append(threading.Thread(target=worker, args=(addr,)))
+            threads[-1].start()
+            time.sleep(0.02)
+        lock.release()
+        for t in threads:
+            t.join()
+        # Address 2 is not starved by the waiting address 1 thread
+        self.assertListEqual(order, [2, 1])
+
+    def test_reentrant(self):
+        lock = prologix.ControllerLock()
+        with lock.hold(1):
+            with lock.hold(2):
+                pass
+            with lock:
+                pass
+        with self.assertRaises(RuntimeError):
+            lock.release()
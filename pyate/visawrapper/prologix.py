@@ -39,7 +39,11 @@ Original code from https://github.com/baldwint/wanglib
 from serial import Serial
 from socket import socket, AF_INET, SOCK_STREAM, IPPROTO_TCP, TCP_NODELAY
 from time import sleep
+import collections
+import contextlib
+import functools
 import logging
+import threading
 
 import time
 import select
@@ -53,19 +57,121 @@ class PrologixTimeout(Exception):
     pass
 
 
+class ControllerLock(object):
+    """
+    Reentrant lock serializing access to one Prologix controller
+
+    Threads acquire the lock for the GPIB address they are about to talk to.
+    When the lock is released, threads waiting for the address that is
+    currently selected go first, so consecutive operations on one address are
+    grouped together and the controller needs fewer ++addr switches.  After
+    max_batch such grants in a row, threads waiting for other addresses go
+    first so no address is starved.
+    """
+
+    def __init__(self, max_batch=8):
+        self.max_batch = max_batch
+        self._cond = threading.Condition(threading.Lock())
+        self._owner = None
+        self._depth = 0
+        self._waiting = collections.Counter()
+        self._addr = None
+        self._batch = 0
+
+    def _may_acquire(self, addr):
+        if self._owner is not None:
+            return False
+        if self._addr is None:
+            return True
+        batch_full = self._batch >= self.max_batch
+        if addr == self._addr:
+            # Stay on the current address unless others have waited too long
+            others = any(n > 0 for a, n in self._waiting.items() if a != addr)
+            return not (batch_full and others)
+        # Let the threads for the current address go first
+        return batch_full or self._waiting[self._addr] == 0
+
+    def acquire(self, addr=None):
+        """
+        Acquires the lock for operations on GPIB address addr
+
+        addr: Integer or None  (None is used for controller commands and
+        does not change the preferred address)
+        """
+        me = threading.get_ident()
+        with self._cond:
+            if self._owner == me:
+                self._depth += 1
+                return True
+            self._waiting[addr] += 1
+            try:
+                while not self._may_acquire(addr):
+                    self._cond.wait()
+            finally:
+                self._waiting[addr] -= 1
+            self._owner = me
+            self._depth = 1
+            if addr is not None:
+                if addr == self._addr:
+                    self._batch += 1
+                else:
+                    self._addr = addr
+                    self._batch = 1
+            return True
+
+    def release(self):
+        with self._cond:
+            if self._owner != threading.get_ident():
+                raise RuntimeError("Cannot release un-acquired lock")
+            self._depth -= 1
+            if self._depth == 0:
+                self._owner = None
+                self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def hold(self, addr=None):
+        """Context manager holding the lock for GPIB address addr"""
+        self.acquire(addr)
+        try:
+            yield self
+        finally:
+            self.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+def _locked(fcn):
+    """Holds the controller lock for the GPIB address passed as first argument"""
+
+    @functools.wraps(fcn)
+    def wrapper(self, *args, **kwargs):
+        addr = args[0] if args and isinstance(args[0], int) else None
+        with self.lock.hold(addr):
+            return fcn(self, *args, **kwargs)
+
+    return wrapper
+
+
 class ResourceManager(object):
     _prologixManager = {}
+    _prologixManagerLock = threading.Lock()
 
     @classmethod
     def getPrologixController(cls, ipAddress):
         logger = logging.getLogger(__name__)
-        if ipAddress not in cls._prologixManager:
-            logger.debug("Creating new PrologixInterface instance")
-            cls._prologixManager[ipAddress] = PrologixEthernet(ipAddress)
-        else:
-            logger.debug("Returning existing PrologixInterface instance")
+        with cls._prologixManagerLock:
+            if ipAddress not in cls._prologixManager:
+                logger.debug("Creating new PrologixInterface instance")
+                cls._prologixManager[ipAddress] = PrologixEthernet(ipAddress)
+            else:
+                logger.debug("Returning existing PrologixInterface instance")
 
-        return cls._prologixManager[ipAddress]
+            return cls._prologixManager[ipAddress]
 
     @classmethod
     def open_resource(cls, resource_name):
@@ -103,25 +209,41 @@ class ResourcePrologix:
 
         self.interface = ResourceManager.getPrologixController(self._ip)
 
+    @property
+    def resource_name(self):
+        return self._resource_name
+
+    @property
+    def lock(self):
+        """Controller lock held for this resource's GPIB address.  Hold it
+        to keep other threads off the controller across several operations."""
+        return self.interface.lock.hold(self._addr)
+
     def read(self):
-        return self.interface.read(self._addr, timeout=self.timeout)
+        with self.lock:
+            return self.interface.read(self._addr, timeout=self.timeout)
 
     def write(self, message):
-        return self.interface.write(self._addr, message)
+        with self.lock:
+            return self.interface.write(self._addr, message)
 
     def query(self, message):
-        self.interface.write(self._addr, message)
-        return self.interface.read(self._addr, timeout=self.timeout)
+        # Hold the lock so no other thread can switch address in between
+        with self.lock:
+            self.interface.write(self._addr, message)
+            return self.interface.read(self._addr, timeout=self.timeout)
 
     def open(self):
-        self.interface.open()
+        with self.lock:
+            self.interface.open()
 
     def close(self):
-        self.interface.close()
-        pass
+        with self.lock:
+            self.interface.close()
 
     def clear(self):
-        self.interface.clear(self._addr)
+        with self.lock:
+            self.interface.clear(self._addr)
 
     def read_termination(self, char):
         self.logger.warning("read_termination(char) not yet implemented")
@@ -147,6 +269,10 @@ class _prologix_base(object):
         self._addrLast = None
         self.term_char = 10  # Decimal ASCII code for '\n'
 
+        # Serializes access from multiple threads / ResourcePrologix objects
+        self.lock = ControllerLock()
+        self.address_switches = 0  # Number of ++addr commands sent
+
     @property
     def addr(self):
         """
@@ -166,8 +292,9 @@ class _prologix_base(object):
         """
         # query the controller for the current address
         # and save it in the _addr variable (why not)
-        self.write(None, "++addr")
-        addrReported = int(self.read(None))
+        with self.lock:
+            self.write(None, "++addr")
+            addrReported = int(self.read(None))
         if addrReported != self._addr:
             self.logger.error(
                 "Address mismatch between Prologix device (%s) and manager (%s).  This is likely due to multiple connections to device.",
@@ -205,6 +332,7 @@ class _prologix_base(object):
             if new_addr is not None:
                 # change to the new address
                 self.write_raw("++addr {:d}".format(new_addr), delay=0.1)
+                self.address_switches += 1
                 # we update the local variable first because the 'write'
                 # command may have a built-in delay. if we intterupt a program
                 # during this period, the local attribute will be wrong
@@ -226,8 +354,9 @@ class _prologix_base(object):
         some instruments do poorly with it.
 
         """
-        self.write(None, "++auto")
-        self._auto = bool(int(self.read(None)))
+        with self.lock:
+            self.write(None, "++auto")
+            self._auto = bool(int(self.read(None)))
         return self._auto
 
     @auto.setter
@@ -237,8 +366,9 @@ class _prologix_base(object):
 
     def version(self):
         """ Check the Prologix firmware version. """
-        self.write(None, "++ver")
-        return self.read(None)
+        with self.lock:
+            self.write(None, "++ver")
+            return self.read(None)
 
     @property
     def savecfg(self):
@@ -253,8 +383,9 @@ class _prologix_base(object):
         .. _`wear on the EEPROM`: http://www.febo.com/pipermail/time-nuts/2009-July/038952.html
 
         """
-        self.write(None, "++savecfg")
-        resp = self.read(None)
+        with self.lock:
+            self.write(None, "++savecfg")
+            resp = self.read(None)
 
         if resp == "Unrecognized command":
             raise Exception(
@@ -339,6 +470,7 @@ class PrologixEthernet(_prologix_base):
         else:
             self.logger.info("Socket looks OK?")
 
+    @_locked
     def open(self):
         self.logger.debug("Opening socket connection")
         self.logger.info("Establishing socket connection")
@@ -350,10 +482,12 @@ class PrologixEthernet(_prologix_base):
         self.bus.settimeout(5)
         self.bus.connect((self._ip, 1234))
 
+    @_locked
     def close(self):
         self.logger.debug("Closing socket connection")
         self.bus.close()
 
+    @_locked
     def write_raw(self, message, delay=0.0):
         self.logger.debug("write_raw(%s, delay=%g)", message, delay)
         messageFormatted = "{:s}\r\n".format(message).encode()
@@ -377,6 +511,7 @@ class PrologixEthernet(_prologix_base):
         # If we made it here we failed 3 retry attempts
         raise ConnectionError("Cannot re-establish connection")
 
+    @_locked
     def write(self, gpibaddr, message, delay=0.0):
         # Change address
         self.addr = gpibaddr
@@ -450,6 +585,7 @@ class PrologixEthernet(_prologix_base):
                 # min_select_timeout
                 select_timout = max(select_timout / 2.0, min_select_timeout)
 
+    @_locked
     def read_last(self, flush=False):
         # Clears everything from bus.  Puts data into buffer if it was provided
         if (self._addrLast is None) or (flush):
@@ -466,6 +602,7 @@ class PrologixEthernet(_prologix_base):
         # Extremely short timeout set since we only want what was already there.
         status = self.read_raw(None, buffer, term_char_en=False, timeout=0.001)
 
+    @_locked
     def read(self, gpibaddr, count=None, timeout=None):
         if count is None:
             count = self.max_recv_size
@@ -498,6 +635,7 @@ class PrologixEthernet(_prologix_base):
         self.logger.debug("PrologiXEthernet.read():  %s", out)
         return out
 
+    @_locked
     def clear(self, addr):
         # First write anyting in bus to last addressed buffer
         self.read_last()
@@ -563,11 +701,12 @@ class PrologixUSB(_prologix_base):
 
     def query(self, query, *args, **kwargs):
         """ Write to the bus, then read response. """
-        # TODO: if bus doesn't have a logger
-        self.bus.logger.debug("clearing buffer - expect no result")
-        self.readall()  # clear the buffer
-        self.write(query, *args, **kwargs)
-        return self.readall()
+        with self.lock:
+            # TODO: if bus doesn't have a logger
+            self.bus.logger.debug("clearing buffer - expect no result")
+            self.readall()  # clear the buffer
+            self.write(query, *args, **kwargs)
+            return self.readall()
 
 
 controllers = dict()